@@ -1,16 +1,25 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 from chat_daily import RT_Daily_Chatbot
-from chat_reall_sess import RT_ChatRecallSession
+from chat_reall_sess import RT_ChatRecallSession, RecallSessionState
 from chat_theme import RT_Theme_Chatbot
 from dotenv import load_dotenv, find_dotenv
-from google.cloud import texttospeech, speech
+from google.cloud import texttospeech
+import json
 import os
-import openai
 import uuid
+import openai
 from datetime import datetime, timedelta, timezone
 from flask_cors import CORS
 import jwt
 from diary_db_management import DiaryDBManager
+from diary_jobs import DiaryJobQueue
+from recall_quiz_cache import RecallQuizCache
+from session_manager import SessionManager, SessionNotFound
+from async_loop import run_coroutine
+from stt_service import StreamingRecognitionManager, create_speech_client, recognize
+from tts_service import TTSCache
+from voice_turn import run_voice_turn
+from warmup import start_warm_up
 
 
 # 환경 변수 로드
@@ -58,6 +67,26 @@ def get_jwt_payload():
 
     return payload, None, None
 
+def get_session_key(user_id):
+    """
+    대화 세션 키 생성 함수
+    같은 사용자가 여러 창에서 대화할 수 있도록 X-Session-Id 헤더가 있으면 함께 사용
+    """
+    session_id = request.headers.get("X-Session-Id")
+    return f"{user_id}:{session_id}" if session_id else str(user_id)
+
+def sse_response(events):
+    """
+    챗봇의 스트리밍 이벤트({"type": "delta" | "done" | "error", ...})를 SSE 응답으로 변환
+    """
+    def generate():
+        for event in events:
+            yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    # 프록시(nginx)가 응답을 모아서 보내지 않도록 버퍼링 해제
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 def verify_jwt(token):
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
@@ -81,13 +110,70 @@ CORS(app,
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "default_secret_key")  # 기본값 설정 가능
 
 # 챗봇 객체 생성 시 전역 DB 매니저를 전달
-daily_bot = RT_Daily_Chatbot(db_manager=global_db_manager)
+# 대화 기록이 사용자끼리 섞이지 않도록 일상/테마 챗봇은 세션별로 따로 생성
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "500"))
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+# 대화가 끝나면 일기 생성·색인은 작업 큐로 넘기고 마무리 인사를 바로 반환 (재시작해도 작업 유지)
+diary_jobs = DiaryJobQueue()
+daily_diary_writer = RT_Daily_Chatbot(db_manager=global_db_manager)
+theme_diary_writer = RT_Theme_Chatbot(db_manager=global_db_manager)
+# 생성 실패는 예외로 올려 에러 일기가 저장되지 않고 작업이 재시도되게 함
+diary_jobs.register("daily", lambda job: daily_diary_writer.write_diary(
+    job["user_id"], job["chat_history"], raise_errors=True))
+diary_jobs.register("theme", lambda job: theme_diary_writer.write_diary(
+    job["user_id"], job["chat_history"], job["theme"], raise_errors=True))
+diary_jobs.start()
+
+daily_sessions = SessionManager(
+    lambda: RT_Daily_Chatbot(db_manager=global_db_manager, diary_jobs=diary_jobs),
+    max_sessions=SESSION_MAX_COUNT,
+    idle_timeout=SESSION_IDLE_SECONDS,
+)
+theme_sessions = SessionManager(
+    lambda: RT_Theme_Chatbot(db_manager=global_db_manager, diary_jobs=diary_jobs),
+    max_sessions=SESSION_MAX_COUNT,
+    idle_timeout=SESSION_IDLE_SECONDS,
+)
+# 회상 세션 객체는 대화 상태 없이 질문 생성/채점만 하므로 하나를 공유
 recall_session = RT_ChatRecallSession(db_manager=global_db_manager)
-theme_bot = RT_Theme_Chatbot(db_manager=global_db_manager)
+# 일기가 저장되면 회상 퀴즈를 미리 만들어 두는 캐시
+recall_quizzes = RecallQuizCache(recall_session, global_db_manager)
+# 회상 세션 진행 상태(질문·정답·일기·시도 횟수)는 서버에 보관하고 클라이언트에는 session_id만 전달
+RECALL_SESSION_IDLE_SECONDS = int(os.getenv("RECALL_SESSION_IDLE_SECONDS", "1800"))
+recall_states = SessionManager(
+    RecallSessionState,
+    max_sessions=SESSION_MAX_COUNT,
+    idle_timeout=RECALL_SESSION_IDLE_SECONDS,
+)
 
 # 구글 TTS, STT 클라이언트
 tts_client = texttospeech.TextToSpeechClient()
-stt_client = speech.SpeechClient()
+stt_client = create_speech_client()
+tts_cache = TTSCache(tts_client)
+# 이 길이(글자 수)를 넘는 텍스트는 기본적으로 문장 단위로 나눠 동시에 합성
+TTS_CHUNK_MIN_CHARS = int(os.getenv("TTS_CHUNK_MIN_CHARS", "80"))
+stt_streams = StreamingRecognitionManager(stt_client)
+
+def synthesize_tts(text, mode=None):
+    """
+    TTS 합성 후 파일 경로 목록을 반환 (/tts와 워밍업이 같은 캐시 키를 쓰도록 공용으로 사용)
+    mode: "single"(한 번에 합성) / "concat"(문장별 동시 합성 후 한 파일로) / "playlist"(문장별 파일 목록)
+    지정하지 않으면 긴 텍스트는 concat으로 처리
+    """
+    mode = mode or ("concat" if len(text) > TTS_CHUNK_MIN_CHARS else "single")
+
+    # 같은 텍스트·목소리·설정이면 이미 합성한 파일을 그대로 사용
+    if mode == "playlist":
+        paths = tts_cache.synthesize_playlist(text)
+    elif mode == "concat":
+        paths = [tts_cache.synthesize_concat(text)]
+    else:
+        paths = [tts_cache.synthesize(text)]
+    return [path.replace(os.sep, "/") for path in paths]
+
+# 고정 문구 음성 합성, gRPC 채널 연결, 최근 사용자 샤드 로드를 백그라운드에서 미리 수행
+if os.getenv("WARMUP_ENABLED", "1") == "1":
+    start_warm_up(synthesize_tts, {"tts": tts_client, "stt": stt_client}, global_db_manager)
 
 @app.route("/auth/token", methods=["POST"])
 def get_token():
@@ -100,14 +186,15 @@ def get_token():
 
 @app.route("/start", methods=["GET"])
 def start_conversation():
-    # payload, error_response, status_code = get_jwt_payload()
-    # if error_response:
-    #     return error_response, status_code
+    payload, error_response, status_code = get_jwt_payload()
+    if error_response:
+        # 세션을 찾을 수 없으면 /ask와 마찬가지로 거절 (이전 대화 기록이 이어지지 않도록)
+        return error_response, status_code
 
-    # user_id = payload["user_id"]
+    user_id = payload["user_id"]
 
-    daily_bot.reset()
-    first_message = daily_bot.start_conversation()
+    with daily_sessions.session(get_session_key(user_id), fresh=True) as daily_bot:
+        first_message = daily_bot.start_conversation()
     return jsonify({"response": first_message})
 
 @app.route("/ask", methods=["POST"])
@@ -123,10 +210,35 @@ def ask():
         return jsonify({"error": "message is required"}), 400
 
     try:
-        result = daily_bot.ask(user_input, user_id=user_id)
+        with daily_sessions.session(get_session_key(user_id)) as daily_bot:
+            # 독립적인 LLM 호출을 동시에 실행하는 비동기 파이프라인 사용
+            result = run_coroutine(daily_bot.ask_async(user_input, user_id=user_id))
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+@app.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    """/ask와 같지만 답변 토큰을 SSE로 바로바로 전송"""
+    payload, error_response, status_code = get_jwt_payload()
+    if error_response:
+        return error_response, status_code
+
+    user_id = payload["user_id"]
+    user_input = request.json.get("message", "")
+    if not user_input:
+        return jsonify({"error": "message is required"}), 400
+    session_key = get_session_key(user_id)
+
+    def events():
+        # 스트림이 끝날 때까지 세션을 잡고 있어야 같은 세션의 다음 요청이 대화 기록을 섞지 않음
+        try:
+            with daily_sessions.session(session_key) as daily_bot:
+                yield from daily_bot.ask_stream(user_input, user_id=user_id)
+        except Exception as e:
+            yield {"type": "error", "error": str(e)}
+
+    return sse_response(events())
     
 # tts
 @app.route("/tts", methods=["POST"])
@@ -141,18 +253,14 @@ def generate_tts():
     if not text:
         return jsonify({"error": "text is required"}), 400
 
-    synthesis_input = texttospeech.SynthesisInput(text=text)
-    voice = texttospeech.VoiceSelectionParams(
-        language_code="ko-KR",
-        name="ko-KR-Chirp3-HD-Achernar",
-        ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
-    )
-    audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
-    response = tts_client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
-
-    filename = f"static/audio_{uuid.uuid4().hex}.mp3"
-    with open(filename, "wb") as out:
-        out.write(response.audio_content)
+    filenames = synthesize_tts(text, request.json.get("mode"))
+    if len(filenames) > 1:
+        return jsonify({
+            "audio_url": "/" + filenames[0],
+            "audio_urls": ["/" + filename for filename in filenames],
+            "filename": filenames[0],
+        })
+    filename = filenames[0]
 
     return jsonify({"audio_url": "/" + filename, "filename": filename})
 
@@ -166,18 +274,86 @@ def stt():
     user_id = payload["user_id"]
     file = request.files["file"]
     audio = file.read()
-    config = speech.RecognitionConfig(
-        encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
-        language_code="ko-KR"
-    )
-    audio_config = speech.RecognitionAudio(content=audio)
     try:
-        response = stt_client.recognize(config=config, audio=audio_config)
-        transcript = "".join([r.alternatives[0].transcript for r in response.results])
+        transcript = recognize(stt_client, audio)
         return jsonify({"transcript": transcript})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
+@app.route("/stt/stream", methods=["POST"])
+def stt_stream_start():
+    """
+    스트리밍 STT 세션 시작. 이후 흐름:
+    1) POST /stt/stream/<stream_id>/audio 로 녹음 조각(WebM/Opus)을 도착하는 대로 전송 (마지막 조각은 ?end=1)
+    2) GET /stt/stream/<stream_id>/events 로 중간/확정 인식 결과를 SSE로 수신
+    """
+    payload, error_response, status_code = get_jwt_payload()
+    if error_response:
+        return error_response, status_code
+
+    stream_id = stt_streams.create(owner=str(payload["user_id"]))
+    return jsonify({"stream_id": stream_id})
+
+@app.route("/stt/stream/<stream_id>/audio", methods=["POST"])
+def stt_stream_audio(stream_id):
+    payload, error_response, status_code = get_jwt_payload()
+    if error_response:
+        return error_response, status_code
+
+    stream = stt_streams.get(stream_id, owner=str(payload["user_id"]))
+    if stream is None:
+        return jsonify({"error": "stream not found"}), 404
+
+    stream.feed(request.get_data())
+    if request.args.get("end") == "1":
+        stream.close()
+    return jsonify({"ok": True})
+
+@app.route("/stt/stream/<stream_id>/events", methods=["GET"])
+def stt_stream_events(stream_id):
+    payload, error_response, status_code = get_jwt_payload()
+    if error_response:
+        return error_response, status_code
+
+    stream = stt_streams.get(stream_id, owner=str(payload["user_id"]))
+    if stream is None:
+        return jsonify({"error": "stream not found"}), 404
+
+    def events():
+        try:
+            yield from stream.events()
+        finally:
+            stt_streams.discard(stream_id)
+
+    return sse_response(events())
+
+@app.route("/voice-turn", methods=["POST"])
+def voice_turn():
+    """
+    음성 한 턴을 한 번의 요청으로 처리 (/stt → /ask → /tts 세 번 왕복 대신)
+    녹음 파일(file)을 받아 인식 결과, 답변 토큰, 문장별 오디오 URL, 단계별 소요 시간을 SSE로 전송
+    form의 mode가 "theme"이면 테마 챗봇, 아니면 일상 챗봇으로 대화
+    """
+    payload, error_response, status_code = get_jwt_payload()
+    if error_response:
+        return error_response, status_code
+
+    user_id = payload["user_id"]
+    if "file" not in request.files:
+        return jsonify({"error": "file is required"}), 400
+    audio = request.files["file"].read()
+    sessions = theme_sessions if request.form.get("mode") == "theme" else daily_sessions
+    session_key = get_session_key(user_id)
+
+    def events():
+        try:
+            with sessions.session(session_key) as bot:
+                yield from run_voice_turn(bot, audio, user_id, stt_client, tts_cache)
+        except Exception as e:
+            yield {"type": "error", "error": str(e)}
+
+    return sse_response(events())
+
 @app.route("/recall-session/test", methods=["GET"])
 def recall_test_page():
     return render_template("recall_chatbot.html")
@@ -192,29 +368,26 @@ def start_recall_session():
     date = request.json.get("date", datetime.today().strftime("%Y-%m-%d"))
 
     try:
-        diary_content = recall_session.get_diary_content(date, user_id)
+        # 일기 저장 시 백그라운드에서 미리 만들어 둔 퀴즈를 사용 (없으면 여기서 생성)
+        quiz = recall_quizzes.get(user_id, date)
+        diary_content = quiz["diary_content"]
         if not diary_content:
             return jsonify({"error": f"No diary content found for date: {date}"}), 404
 
-        diary_content_serializable = [
-            {"page_content": doc.page_content, "metadata": doc.metadata}
-            for doc in diary_content
-        ]
-
-        qnas = recall_session.generate_recall_questions(user_id)
+        qnas = quiz["questions"]
         if not qnas:
             return jsonify({"error": "Failed to generate recall questions"}), 500
 
-        question_types = ["시간 지남력", "장소 지남력", "기억력"]
-        questions_with_types = [
-            {"type": question_types[idx], "question": qa["질문"], "answer": qa["답변"]}
-            for idx, qa in enumerate(qnas)
-        ]
+        session_id = uuid.uuid4().hex
+        with recall_states.session(session_id, fresh=True) as state:
+            state.start(user_id, date, diary_content, qnas)
+            current_question = state.public_question()
+            question_count = len(state.questions)
 
         return jsonify({
-            "questions": questions_with_types,
-            "current_question": questions_with_types[0],
-            "diary_content": diary_content_serializable,
+            "session_id":           session_id,
+            "current_question":     current_question,
+            "question_count":       question_count,
             "question_index":       0,          # 현재 인덱스
             "attempt":              1           # 시도 횟수 초기값
         })
@@ -232,62 +405,65 @@ def process_recall_answer():
     user_id = payload["user_id"]
     print("Request data:", request.json)  # 요청 데이터 출력
 
+    session_id = request.json.get("session_id", "")
     user_answer = request.json.get("user_answer", "")
-    question_index = request.json.get("question_index", 0)
-    questions = request.json.get("questions", []) 
-    diary_content = request.json.get("diary_content", "")
-    attempt = request.json.get("attempt", 1)   # ← 여기를 추가
-
-    if not questions or question_index >= len(questions):
-        return jsonify({"error": "No more questions available."}), 400
-
-    current_qa = questions[question_index]
-    is_correct, feedback, hint, score = recall_session.evaluate_user_answer(
-        recall_question=current_qa["question"],
-        recall_answer=current_qa["answer"],
-        user_answer=user_answer,
-        diary_content=diary_content
-    )
-
-
-    # 기본 응답 구조
-    resp = {
-        "is_correct":    is_correct,
-        "feedback":      feedback,
-        "hint":          hint or "",
-        "score":         score,
-    }
 
-    if is_correct:
-        # → 정답: 다음 문제, attempt 리셋
-        next_idx = question_index + 1
-        resp.update({
-            "next_question": questions[next_idx] if next_idx < len(questions) else None,
-            "question_index": next_idx,
-            "attempt":       1,
-            "message":       ""
-        })
+    try:
+        # 같은 세션의 답변이 동시에 들어와도 시도 횟수가 꼬이지 않도록 세션 잠금 안에서 채점
+        with recall_states.session(session_id, create=False) as state:
+            if state.user_id != user_id:
+                raise SessionNotFound(session_id)
+            if state.finished:
+                return jsonify({"error": "No more questions available."}), 400
+
+            current_qa = state.current
+            is_correct, feedback, hint, score = recall_session.evaluate_user_answer(
+                recall_question=current_qa["question"],
+                recall_answer=current_qa["answer"],
+                user_answer=user_answer,
+                diary_content=state.diary_content,
+                question_type=current_qa["type"],
+                date=state.date,
+            )
+            message = state.record(is_correct)
+            resp = {
+                "is_correct":     is_correct,
+                "feedback":       feedback,
+                "hint":           hint or "",
+                "score":          score,
+                "next_question":  state.public_question(),
+                "question_index": state.question_index,
+                "attempt":        state.attempt,
+                "message":        message,
+            }
+            finished = state.finished
+    except SessionNotFound:
+        return jsonify({"error": "Recall session not found or expired. Please start a new session."}), 404
+
+    if finished:
+        recall_states.discard(session_id)
+    return jsonify(resp)
 
-    else:
-        # → 오답
-        if attempt < 3:
-            # 3회 미만: 같은 문제, attempt++
-            resp.update({
-                "next_question": questions[question_index],
-                "question_index": question_index,
-                "attempt":       attempt + 1,
-                "message":       ""
-            })
-        else:
-            # 3회째 오답: 다음 문제, attempt 리셋
-            next_idx = question_index + 1
-            resp.update({
-                "next_question": questions[next_idx] if next_idx < len(questions) else None,
-                "question_index": next_idx,
-                "attempt":       1,
-                "message":       "세 번 모두 틀리셨어요. 다음 문항으로 넘어갑니다."
-            })
+@app.route("/diary-jobs/<job_id>", methods=["GET"])
+def get_diary_job(job_id):
+    """
+    대화 종료 시 응답의 diary_job.job_id로 일기 작업 상태를 조회합니다.
+    ?wait=초 를 주면 작업이 끝날 때까지 최대 그 시간(30초 이하)만큼 기다렸다가 응답합니다. (롱 폴링)
+    """
+    payload, error_response, status_code = get_jwt_payload()
+    if error_response:
+        return error_response, status_code
+
+    wait = min(request.args.get("wait", 0, type=float), 30.0)
+    job = diary_jobs.wait(job_id, wait) if wait > 0 else diary_jobs.get(job_id)
+    if job is None or job["user_id"] != str(payload["user_id"]):
+        return jsonify({"error": "Diary job not found"}), 404
 
+    resp = {"job_id": job_id, "status": job["status"]}
+    if job["status"] == "done":
+        resp["diary"] = job["result"]
+    elif job["status"] == "failed":
+        resp["error"] = job["error"]
     return jsonify(resp)
 
 @app.route("/theme/start", methods=["GET"])
@@ -299,8 +475,8 @@ def theme_start_conversation():
     user_id = payload["user_id"]
 
     try:
-        theme_bot.reset()
-        first_message = theme_bot.start_conversation(user_id=user_id)
+        with theme_sessions.session(get_session_key(user_id), fresh=True) as theme_bot:
+            first_message = theme_bot.start_conversation(user_id=user_id)
         return jsonify({"response": first_message})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -317,10 +493,33 @@ def theme_ask():
         return jsonify({"error": "message is required"}), 400
 
     try:
-        result = theme_bot.ask(user_input, user_id=user_id)
+        with theme_sessions.session(get_session_key(user_id)) as theme_bot:
+            result = theme_bot.ask(user_input, user_id=user_id)
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+@app.route("/theme/ask/stream", methods=["POST"])
+def theme_ask_stream():
+    """/theme/ask와 같지만 답변 토큰을 SSE로 바로바로 전송"""
+    payload, error_response, status_code = get_jwt_payload()
+    if error_response:
+        return error_response, status_code
+
+    user_id = payload["user_id"]
+    user_input = request.json.get("message", "")
+    if not user_input:
+        return jsonify({"error": "message is required"}), 400
+    session_key = get_session_key(user_id)
+
+    def events():
+        try:
+            with theme_sessions.session(session_key) as theme_bot:
+                yield from theme_bot.ask_stream(user_input, user_id=user_id)
+        except Exception as e:
+            yield {"type": "error", "error": str(e)}
+
+    return sse_response(events())
     
     
 if __name__ == "__main__":
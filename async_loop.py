@@ -0,0 +1,23 @@
+import asyncio
+import threading
+from typing import Any, Coroutine, Optional
+
+# Flask 요청 스레드에서 비동기 파이프라인을 돌리기 위한 공용 이벤트 루프.
+# 요청마다 asyncio.run()으로 루프를 새로 만들면 AsyncOpenAI의 커넥션 풀을 재사용할 수 없으므로
+# 백그라운드 스레드 하나에서 루프를 계속 돌리고 코루틴을 넘겨 실행합니다.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-loop", daemon=True).start()
+        return _loop
+
+
+def run_coroutine(coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+    """공용 루프에서 코루틴을 실행하고 결과를 기다립니다. (동기 코드에서 호출)"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
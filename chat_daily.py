@@ -1,55 +1,122 @@
+import asyncio
+import json
 import openai
 from datetime import datetime
 import os
+import time
 from dotenv import load_dotenv
+from async_loop import run_coroutine
 from diary_db_management import DiaryDBManager
-from typing import List, Tuple
+from diary_jobs import DiaryJobQueue
+from end_intent import end_intent_classifier, last_turn
+from profile_client import profile_client
+from prompt_registry import prompts
+from typing import Iterator, List, Optional, Tuple
 from langchain_core.documents import Document
 from datetime import datetime
 import re
-import requests
 
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
-class RT_Daily_Chatbot:
+
+# 턴 계획 방식: "fused"는 종료 판단·키워드·검색 쿼리를 한 번의 구조화 응답으로,
+# "legacy"는 기존처럼 세 번의 호출로 처리 (지연 시간/품질 A/B 비교용)
+TURN_PLANNER_MODE = os.getenv("DAILY_TURN_PLANNER", "fused")
+TURN_PLAN_PROMPT_PATH = "./prompt/daily_turn_plan_prompt.txt"
+DAILY_PROMPT_PATH = "./prompt/daily_prompt_test3.txt"
+RECALL_PROMPT_PATH = "./prompt/recall_prompt_test3.txt"
+DIARY_GEN_PROMPT_PATH = "./prompt/diary_gen_prompt.txt"
+
+# 프롬프트는 모듈 로드 시 한 번 읽고 변수를 검사 (누락되면 서버 시작 단계에서 실패)
+prompts.register(DAILY_PROMPT_PATH, ["profile_info", "chat_history"])
+prompts.register(RECALL_PROMPT_PATH, ["profile_info", "chat_history", "diary_content"])
+prompts.register(TURN_PLAN_PROMPT_PATH, ["chat_history"])
+prompts.register(DIARY_GEN_PROMPT_PATH)
+
+TURN_PLAN_SCHEMA = {
+    "name": "turn_plan",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "is_ending": {"type": "boolean"},
+            "keywords": {"type": "array", "items": {"type": "string"}},
+            "query": {"type": "string"},
+        },
+        "required": ["is_ending", "keywords", "query"],
+        "additionalProperties": False,
+    },
+}
+
+# 스트리밍 회상 응답에서 '아니오'(관련 없음) 여부를 판단하려고 먼저 모아 보는 글자 수
+RECALL_HEAD_CHARS = 8
+
+
+class _StageTimer:
+    """비동기 턴 파이프라인의 단계별 소요 시간 측정"""
+
     def __init__(self):
-        self.prompt_path = "./prompt/daily_prompt_test3.txt"
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.cancelled: list[str] = []
+
+    async def track(self, name: str, awaitable):
+        stage_started = time.perf_counter()
+        try:
+            return await awaitable
+        except asyncio.CancelledError:
+            self.cancelled.append(name)
+            raise
+        finally:
+            self.stages[name] = round((time.perf_counter() - stage_started) * 1000, 1)
+
+    def report(self) -> dict:
+        # sum_ms(단계별 합) 대비 total_ms(실제 경과)가 작을수록 동시 실행으로 절약한 시간이 큼
+        return {
+            "stages_ms": dict(self.stages),
+            "cancelled": list(self.cancelled),
+            "sum_ms": round(sum(self.stages.values()), 1),
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+        }
+
+
+class RT_Daily_Chatbot:
+    FIRST_MESSAGE = "안녕하세요. 오늘 하루는 어땠어요? 기억에 남는 일이 있었나요?"
+    FAREWELL_MESSAGE = "오늘 이야기를 들을 수 있어서 기뻤어요. 내일도 기다리고 있을게요 😊"
+    DIARY_SAVED_NOTICE = "\n\n(일기가 저장되었어요. 프로그램을 종료합니다.)"
+    # 일기를 백그라운드 작업으로 넘겼을 때의 안내 (완성된 일기는 /diary-jobs/<job_id>로 조회)
+    DIARY_PENDING_NOTICE = "\n\n(일기를 정리해서 저장하고 있어요. 프로그램을 종료합니다.)"
+    ERROR_MESSAGE = "음... 지금은 대화가 조금 어려운 것 같아요. 조금 있다가 다시 얘기해볼까요?"
+
+    def __init__(self, db_manager: DiaryDBManager = None, planner_mode: str = None, diary_jobs: DiaryJobQueue = None):
+        self.prompt_path = DAILY_PROMPT_PATH
+        self.planner_mode = planner_mode or TURN_PLANNER_MODE
         self.client = openai.OpenAI(api_key=openai.api_key)
+        self.async_client = openai.AsyncOpenAI(api_key=openai.api_key)
         self.chat_history = []
-        self.db_manager = DiaryDBManager(persist_path="vectorstore/diary_faiss")
+        # 사용자 샤드를 여러 인스턴스가 따로 들고 있지 않도록 전역 DB 매니저를 공유
+        self.db_manager = db_manager if db_manager else DiaryDBManager(persist_path="vectorstore/diary_faiss")
+        # 작업 큐가 있으면 일기 생성·저장을 백그라운드로 넘기고 마무리 인사를 바로 반환
+        self.diary_jobs = diary_jobs
 
     def _fetch_user_profile(self, user_id: str) -> dict:
         """
-        Django API (https://nabiya.site/api/users/get_user_info/?user_id=…)
-        엔드포인트를 호출해서 JSON 응답을 dict로 반환합니다.
+        Django API (https://nabiya.site/api/users/get_user_info/?user_id=…) 응답을 dict로 반환합니다.
+        공유 프로필 클라이언트의 캐시를 거치므로 대부분의 턴에서는 API를 호출하지 않습니다.
         """
-        try:
-            url = f"https://nabiya.site/api/users/get_user_info/?user_id={user_id}"
-            resp = requests.get(url, timeout=5)
-            resp.raise_for_status()
-            return resp.json()  # e.g. {"user_id":"1","name":"김철수","gender":"남성", ...}
-        except Exception as e:
-            print(f"[프로필 조회 실패] user_id={user_id} / error={e}")
-            return {}
+        return profile_client.get(user_id)  # e.g. {"user_id":"1","name":"김철수","gender":"남성", ...}
 
-    def _load_prompt(self, path: str) -> str:
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
-        
     def start_conversation(self) -> str:
          # 첫 인사 및 유도 질문
-        first_message = "안녕하세요. 오늘 하루는 어땠어요? 기억에 남는 일이 있었나요?"
+        first_message = self.FIRST_MESSAGE
         self.chat_history.append({"role": "assistant", "content": first_message})
         return first_message
     
     def reset(self):
         """챗봇 상태 초기화"""
-        self.history = []
+        self.chat_history = []
         
-    def ask(self, user_input: str, user_id: str) -> dict:
-        self.chat_history.append({"role": "user", "content": user_input})
-
-        user_profile = self._fetch_user_profile(user_id)
+    def _format_profile_info(self, user_profile: dict) -> str:
         user_name = user_profile.get("name")
         user_gender = user_profile.get("gender")
         user_age = user_profile.get("birth_date")
@@ -57,36 +124,79 @@ class RT_Daily_Chatbot:
         user_married = user_profile.get("married")
         user_family = user_profile.get("family_relationship")  # 가족 정보
 
-        profile_info = f"이름: {user_name}, 성별: {user_gender}, 나이: {user_age}, 결혼 여부: {user_married}, 가족 관계: {user_family}"
+        return f"이름: {user_name}, 성별: {user_gender}, 나이: {user_age}, 결혼 여부: {user_married}, 가족 관계: {user_family}"
 
-        # ✅ 대화 종료 여부 판단 후 일기 저장
-        if self.is_conversation_ending():
-            self.chat_history.append({"role": "user", "content": "대화를 종료합니다."})
-
-            # 💬 대화 마무리 멘트 추가
-            farewell = "오늘 이야기를 들을 수 있어서 기뻤어요. 내일도 기다리고 있을게요 😊"
-            self.chat_history.append({"role": "assistant", "content": farewell})
+    def _finish_conversation(self, user_id: str) -> dict:
+        """
+        종료 의도가 확인되면 마무리 인사 후 일기를 생성·저장합니다.
+        끝난 대화 기록은 일기로 넘기고 비워서, 같은 세션의 다음 대화가 이어 붙지 않게 합니다.
+        """
+        self.chat_history.append({"role": "user", "content": "대화를 종료합니다."})
 
-            diary_title, diary_body = self.generate_diary()
-            diary_result = self.save_diary(diary_title, diary_body, user_id)
+        # 💬 대화 마무리 멘트 추가
+        farewell = self.FAREWELL_MESSAGE
+        self.chat_history.append({"role": "assistant", "content": farewell})
+        chat_history = list(self.chat_history)
+        self.reset()
 
+        if self.diary_jobs is not None:
+            job_id = self.diary_jobs.submit(
+                "daily", user_id, {"user_id": user_id, "chat_history": chat_history}
+            )
             return {
-                "response": farewell + "\n\n(일기가 저장되었어요. 프로그램을 종료합니다.)",
-                "diary": diary_result
+                "response": farewell + self.DIARY_PENDING_NOTICE,
+                "diary_job": {"job_id": job_id, "status": "queued"}
             }
 
-        # 키워드 추출
-        keywords = self.extract_keywords(user_input)
-
-        # 키워드 통합 검색
-        query = self.gpt_build_query(keywords)
+        return {
+            "response": farewell + self.DIARY_SAVED_NOTICE,
+            "diary": self.write_diary(user_id, chat_history)
+        }
 
-        results = self.db_manager.search(user_id, keywords, query)
+    def write_diary(self, user_id: str, chat_history: List[dict], raise_errors: bool = False) -> dict:
+        """
+        대화 기록으로 일기를 생성해 저장합니다. (일기 작업 큐의 처리 함수로도 사용)
+        raise_errors=True면 생성 실패 시 예외를 그대로 던져 아무것도 저장하지 않습니다. (작업 큐가 재시도하도록)
+        """
+        diary_title, diary_body = self.generate_diary(chat_history, raise_errors=raise_errors)
+        return self.save_diary(diary_title, diary_body, user_id)
 
+    @staticmethod
+    def _pair_recalled(keywords: List[str], results: List[Document]) -> List[Tuple[str, Document]]:
         recalled_diaries = []
         for i, doc in enumerate(results):
             kw = keywords[i] if i < len(keywords) else "관련된 주제"
             recalled_diaries.append((kw, doc))
+        return recalled_diaries
+
+    def ask(self, user_input: str, user_id: str) -> dict:
+        self.chat_history.append({"role": "user", "content": user_input})
+
+        profile_info = self._format_profile_info(self._fetch_user_profile(user_id))
+
+        # 플래너 모드면 종료 판단·키워드·검색 쿼리를 한 번의 호출로 받음 (실패 시 기존 방식)
+        plan = None
+        if self.planner_mode == "fused":
+            if self._local_end_check():
+                return self._finish_conversation(user_id)
+            plan = self._reconcile_plan(self.plan_turn())
+
+        # ✅ 대화 종료 여부 판단 후 일기 저장
+        if plan["is_ending"] if plan else self.is_conversation_ending():
+            return self._finish_conversation(user_id)
+
+        if plan:
+            keywords, query = plan["keywords"], plan["query"]
+        else:
+            # 키워드 추출
+            keywords = self.extract_keywords(user_input)
+
+            # 키워드 통합 검색
+            query = self.gpt_build_query(keywords)
+
+        results = self.db_manager.search(user_id, keywords, query)
+
+        recalled_diaries = self._pair_recalled(keywords, results)
 
         # 회상 없으면 일반 대화
         try:
@@ -97,13 +207,7 @@ class RT_Daily_Chatbot:
                     return {"response": recall_reply}
 
             # 일반 대화 응답 생성
-            prompt = self.load_prompt(self.prompt_path, profile_info=profile_info, chat_history=self.get_chat_history_as_text())
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[{"role": "system", "content": prompt}],
-                temperature=0.7,
-                max_tokens=200
-            )
+            response = self.client.chat.completions.create(**self._general_reply_request(profile_info))
             reply = response.choices[0].message.content
             self.chat_history.append({"role": "assistant", "content": reply})
 
@@ -111,74 +215,310 @@ class RT_Daily_Chatbot:
 
         except Exception as e:
             print(f"❗예외 발생: {e}")
-            return {"response": "음... 지금은 대화가 조금 어려운 것 같아요. 조금 있다가 다시 얘기해볼까요?"}
+            return {"response": self.ERROR_MESSAGE}
 
-    def gpt_build_query(self, keywords: list[str]) -> str:
+    async def ask_async(self, user_input: str, user_id: str) -> dict:
+        """
+        ask()와 같은 대화 한 턴을 비동기로 처리합니다.
+        서로 의존하지 않는 종료 판단 / 키워드 추출 / 프로필 조회를 동시에 시작하고,
+        종료로 판정되면 나머지 단계는 취소합니다.
+        반환값의 "timings"에 단계별 소요 시간(ms)과 전체 소요 시간이 들어갑니다.
+        """
+        timer = _StageTimer()
+        try:
+            prepared = await self._prepare_turn_async(user_input, user_id, timer)
+            if "result" in prepared:
+                return {**prepared["result"], "timings": timer.report()}
+
+            profile_info, recalled_diaries = prepared["profile_info"], prepared["recalled_diaries"]
+            if recalled_diaries:
+                response = await timer.track(
+                    "recall_reply",
+                    self.async_client.chat.completions.create(**self._recall_reply_request(profile_info, recalled_diaries)),
+                )
+                recall_reply = response.choices[0].message.content.strip()
+                if not '아니오' in recall_reply:
+                    self.chat_history.append({"role": "assistant", "content": recall_reply})
+                    return {"response": recall_reply, "timings": timer.report()}
+
+            response = await timer.track(
+                "general_reply",
+                self.async_client.chat.completions.create(**self._general_reply_request(profile_info)),
+            )
+            reply = response.choices[0].message.content
+            self.chat_history.append({"role": "assistant", "content": reply})
+            return {"response": reply, "timings": timer.report()}
+
+        except Exception as e:
+            print(f"❗예외 발생: {e}")
+            return {"response": self.ERROR_MESSAGE, "timings": timer.report()}
+
+        finally:
+            print(f"[턴 소요 시간] {timer.report()}")
+
+    def ask_stream(self, user_input: str, user_id: str) -> Iterator[dict]:
+        """
+        ask_async()의 스트리밍 버전. 답변 토큰이 도착하는 대로 {"type": "delta", "text": ...}를 내보내고,
+        마지막에 {"type": "done", "response": 최종 답변, ...}을 보냅니다.
+        답변 전 단계(종료 판단·검색 등)는 ask_async()와 같은 비동기 파이프라인을 공용 루프에서 실행합니다.
+        대화 기록에는 스트림이 끝난 뒤 완성된 답변이 추가됩니다.
+        """
+        timer = _StageTimer()
+        try:
+            prepared = run_coroutine(self._prepare_turn_async(user_input, user_id, timer))
+            if "result" in prepared:
+                # 마무리 인사는 고정 문구라 한 번에 전송
+                yield {"type": "delta", "text": prepared["result"]["response"]}
+                yield {"type": "done", **prepared["result"], "timings": timer.report()}
+                return
+
+            parts = []
+            first_token_ms = None
+            for text in self._stream_reply(prepared["profile_info"], prepared["recalled_diaries"], timer):
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - timer.started) * 1000, 1)
+                parts.append(text)
+                yield {"type": "delta", "text": text}
+
+            reply = "".join(parts).strip()
+            self.chat_history.append({"role": "assistant", "content": reply})
+            yield {"type": "done", "response": reply, "timings": {**timer.report(), "first_token_ms": first_token_ms}}
+
+        except Exception as e:
+            print(f"❗예외 발생: {e}")
+            # 이미 일부 토큰을 보냈더라도 클라이언트는 done의 response로 말풍선을 덮어씀
+            yield {"type": "done", "response": self.ERROR_MESSAGE, "timings": timer.report()}
+
+        finally:
+            print(f"[턴 소요 시간] {timer.report()}")
+
+    async def _prepare_turn_async(self, user_input: str, user_id: str, timer: _StageTimer) -> dict:
+        """
+        답변 생성 직전까지(종료 판단 / 키워드·쿼리 / 검색 / 프로필)를 처리합니다.
+        종료로 판정되면 {"result": 마무리 결과}, 아니면 {"profile_info": ..., "recalled_diaries": ...}를 반환합니다.
+        """
+        self.chat_history.append({"role": "user", "content": user_input})
+
+        # 로컬 분류기가 분명한 종료로 판단하면 LLM 호출 없이 바로 마무리
+        if self.planner_mode == "fused" and self._local_end_check():
+            return {"result": await timer.track("diary", asyncio.to_thread(self._finish_conversation, user_id))}
+
+        profile_task = asyncio.create_task(
+            timer.track("profile", asyncio.to_thread(self._fetch_user_profile, user_id))
+        )
+        keyword_task = None
+
+        try:
+            plan = None
+            if self.planner_mode == "fused":
+                plan = self._reconcile_plan(await timer.track("plan", self._plan_turn_async()))
+
+            if plan:
+                is_ending = plan["is_ending"]
+            else:
+                end_task = asyncio.create_task(timer.track("end_check", self._is_conversation_ending_async()))
+                keyword_task = asyncio.create_task(timer.track("keywords", self._extract_keywords_async(user_input)))
+                is_ending = await end_task
+
+            if is_ending:
+                for task in (keyword_task, profile_task):
+                    if task:
+                        task.cancel()
+                return {"result": await timer.track("diary", asyncio.to_thread(self._finish_conversation, user_id))}
+
+            if plan:
+                keywords, query = plan["keywords"], plan["query"]
+            else:
+                keywords = await keyword_task
+                query = await timer.track("query", self._build_query_async(keywords))
+            results = await timer.track(
+                "search", asyncio.to_thread(self.db_manager.search, user_id, keywords, query)
+            )
+            return {
+                "profile_info": self._format_profile_info(await profile_task),
+                "recalled_diaries": self._pair_recalled(keywords, results),
+            }
+
+        except Exception:
+            for task in (keyword_task, profile_task):
+                if task:
+                    task.cancel()
+            raise
+
+    def _stream_completion(self, request: dict) -> Iterator[str]:
+        stream = self.client.chat.completions.create(**request, stream=True)
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+    def _stream_reply(self, profile_info: str, recalled_diaries: List[Tuple[str, Document]], timer: _StageTimer) -> Iterator[str]:
+        """회상 응답을 먼저 스트리밍하고, 회상이 없거나 '아니오'(관련 없음)면 일반 응답을 스트리밍합니다."""
+        if recalled_diaries:
+            started = time.perf_counter()
+            tokens = self._stream_completion(self._recall_reply_request(profile_info, recalled_diaries))
+            # 회상 프롬프트는 관련 없는 일기면 '아니오'로 답하므로, 앞부분을 모아 확인한 뒤에 흘려보냄
+            head = ""
+            for token in tokens:
+                head += token
+                if len(head.strip()) >= RECALL_HEAD_CHARS:
+                    break
+            rejected = '아니오' in head
+            if rejected:
+                tokens.close()
+            else:
+                yield head.lstrip()
+                yield from tokens
+            timer.stages["recall_reply"] = round((time.perf_counter() - started) * 1000, 1)
+            if not rejected:
+                return
+
+        started = time.perf_counter()
+        yield from self._stream_completion(self._general_reply_request(profile_info))
+        timer.stages["general_reply"] = round((time.perf_counter() - started) * 1000, 1)
+
+    # ──────────────────────────────────
+    # LLM 요청 구성 (동기/비동기 호출이 같은 요청을 쓰도록 분리)
+    def _build_query_request(self, keywords: list[str]) -> dict:
         prompt = f"다음 키워드를 기반으로 기존 일기에서 비슷한 내용이 있는지 검색할거야. FAISS 벡터 DB에서 검색할 거고, 다른 말을 덧붙이지 말고 그걸 위한 자연스러운 문장 쿼리 하나만 출력해. {', '.join(keywords)}"
-        response = self.client.chat.completions.create(
+        return dict(
             model="gpt-4.1-mini",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.5,
         )
+
+    def _keywords_request(self, text: str) -> dict:
+        return dict(
+            model="gpt-4.1-mini",
+            messages=[
+                {"role": "system", "content": "다음 문장에서 중요한 키워드 3개만 뽑아줘. 장소, 사람, 사건 중심으로. 다른 말은 붙이지말고 키워드만 추출해."},
+                {"role": "user", "content": text}
+            ],
+            temperature=0.3,
+            max_tokens=30
+        )
+
+    @staticmethod
+    def _parse_keywords(keywords_text: str) -> List[str]:
+        keywords = [kw.strip() for kw in keywords_text.replace('\n', ',').split(',') if kw.strip()]
+        return keywords[:3]
+
+    def _recall_reply_request(self, profile_info: str, recalled_diaries: List[Tuple[str, Document]]) -> dict:
+        # 전체 일기 내용을 하나로 합치기
+        combined_diary_content = "\n\n".join(
+            f"[{kw}]\n{doc.page_content}" for kw, doc in recalled_diaries
+        )
+
+        # 프롬프트 로딩 및 포맷팅
+        prompt = self.load_prompt(
+            RECALL_PROMPT_PATH,
+            profile_info = profile_info,
+            chat_history=self.get_chat_history_as_text(),
+            diary_content=combined_diary_content
+        )
+        return dict(
+            model="gpt-4.1-mini",
+            messages=[
+                {"role": "system", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=300
+        )
+
+    def _general_reply_request(self, profile_info: str) -> dict:
+        prompt = self.load_prompt(self.prompt_path, profile_info=profile_info, chat_history=self.get_chat_history_as_text())
+        return dict(
+            model="gpt-4.1-mini",
+            messages=[{"role": "system", "content": prompt}],
+            temperature=0.7,
+            max_tokens=200
+        )
+
+    def _turn_plan_request(self) -> dict:
+        prompt = self.load_prompt(TURN_PLAN_PROMPT_PATH, chat_history=self.get_chat_history_as_text(limit=6))
+        return dict(
+            model="gpt-4.1-mini",
+            messages=[{"role": "system", "content": prompt}],
+            temperature=0.0,
+            max_tokens=150,
+            response_format={"type": "json_schema", "json_schema": TURN_PLAN_SCHEMA},
+        )
+
+    def _parse_turn_plan(self, content: str) -> Optional[dict]:
+        try:
+            parsed = json.loads(content)
+            keywords = [kw.strip() for kw in parsed["keywords"] if kw.strip()][:3]
+            return {
+                # 기존 판단과 마찬가지로 대화가 너무 짧으면 종료로 보지 않음
+                "is_ending": bool(parsed["is_ending"]) and len(self.chat_history) > 2,
+                "keywords": keywords,
+                "query": parsed["query"].strip() or " ".join(keywords),
+            }
+        except Exception as e:
+            print(f"[❗턴 계획 파싱 실패] {e} / 원본: {content}")
+            return None
+
+    def _end_check_request(self) -> Optional[dict]:
+        """대화가 너무 짧아 종료 판단이 필요 없으면 None을 반환합니다."""
+        # 대화 히스토리가 너무 짧은 경우, 종료로 간주하지 않음
+        if len(self.chat_history) <= 2:
+            return None
+
+        # 최근 대화 6개만 사용
+        recent_history = self.chat_history[-6:]
+
+        # 시스템 지시 및 히스토리 포함 메시지 구성
+        messages = [
+            {"role": "system", "content": (
+                "다음은 사용자와 챗봇 사이의 최근 대화입니다.\n"
+                "이 대화의 마지막 사용자 발화가 대화를 끝내려는 의도인지 판단해 주세요.\n"
+                "반드시 '예' 또는 '아니오'로만 대답해 주세요.\n"
+                "대화 시작 인사('안녕', '하이', '안녕하세요') 등은 종료가 아닙니다.\n"
+            )}
+        ]
+        messages.extend(recent_history)
+        messages.append({
+            "role": "system",
+            "content": "위 대화에서 마지막 사용자의 발화는 대화를 끝내려는 의도입니까? 반드시 '예' 또는 '아니오'로만 대답하세요."
+        })
+        return dict(
+            model="gpt-4.1-mini",  # 또는 "gpt-3.5-turbo", "gpt-4" 등
+            messages=messages,
+            temperature=0.0,
+            max_tokens=5
+        )
+
+    # ──────────────────────────────────
+    # 동기 호출
+    def gpt_build_query(self, keywords: list[str]) -> str:
+        response = self.client.chat.completions.create(**self._build_query_request(keywords))
         return response.choices[0].message.content.strip()
 
     # 사용자의 답변에서 회상의 키워드 추출하기
     def extract_keywords(self, text: str) -> List[str]:
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[
-                    {"role": "system", "content": "다음 문장에서 중요한 키워드 3개만 뽑아줘. 장소, 사람, 사건 중심으로. 다른 말은 붙이지말고 키워드만 추출해."},
-                    {"role": "user", "content": text}
-                ],
-                temperature=0.3,
-                max_tokens=30
-            )
-            keywords_text = response.choices[0].message.content
-            keywords = [kw.strip() for kw in keywords_text.replace('\n', ',').split(',') if kw.strip()]
-            return keywords[:3]
+            response = self.client.chat.completions.create(**self._keywords_request(text))
+            return self._parse_keywords(response.choices[0].message.content)
         except:
             return []       
         
 
     def load_prompt(self, filepath: str, **kwargs) -> str:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            prompt_template = f.read()
-        return prompt_template.format(**kwargs)
+        return prompts.render(filepath, **kwargs)
     
     
     # 회상된 일기 내용으로 감정 회상 응답 생성하기
     def generate_emotional_recall_reply(self,profile_info: str, recalled_diaries: List[Tuple[str, Document]]) -> str:
+        # 대화 기록에는 호출한 쪽(ask)에서 회상 응답을 채택할 때만 추가
         try:
-            # 전체 일기 내용을 하나로 합치기
-            combined_diary_content = "\n\n".join(
-                f"[{kw}]\n{doc.page_content}" for kw, doc in recalled_diaries
-            )
-
-            # 프롬프트 로딩 및 포맷팅
-            prompt = self.load_prompt(
-                "./prompt/recall_prompt_test3.txt",
-                profile_info = profile_info,
-                chat_history=self.get_chat_history_as_text(),
-                diary_content=combined_diary_content
-            )
-
-            # GPT 호출
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[
-                    {"role": "system", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=300
-            )
+            response = self.client.chat.completions.create(**self._recall_reply_request(profile_info, recalled_diaries))
             generated_reply = response.choices[0].message.content.strip()
         except Exception as e:
             print(f"❗회상 생성 실패: {e}")
             generated_reply = "과거의 일기 내용을 회상하는 데 문제가 발생했어요."
 
-        # 대화 기록 및 응답 반환
-        self.chat_history.append({"role": "assistant", "content": generated_reply})
         return generated_reply
 
     def get_chat_history_as_text(self, limit=5) -> str:
@@ -188,38 +528,54 @@ class RT_Daily_Chatbot:
             lines.append(f"{role}: {msg['content']}")
         return "\n".join(lines)
 
+    def _local_end_check(self) -> bool:
+        """플래너 호출 전에, 로컬 분류기가 분명한 종료로 판단하면 True (LLM 호출 없이 종료)"""
+        if len(self.chat_history) <= 2:
+            return False
+        utterance, prev_assistant = last_turn(self.chat_history)
+        verdict, p_end = end_intent_classifier.decide(utterance, prev_assistant)
+        if verdict:
+            end_intent_classifier.record_decision(p_end, verdict)
+            return True
+        return False
+
+    def _reconcile_plan(self, plan: Optional[dict]) -> Optional[dict]:
+        """
+        플래너의 종료 판단을 로컬 분류기 판단과 맞춰 보고 기록합니다.
+        로컬이 분명하면 로컬을 따르되, 플래너의 종료 판단은 로컬 '계속'이 확실할 때만 뒤집습니다.
+        """
+        if plan is None or len(self.chat_history) <= 2:
+            return plan
+        utterance, prev_assistant = last_turn(self.chat_history)
+        verdict, p_end = end_intent_classifier.decide(utterance, prev_assistant)
+        plan["is_ending"] = end_intent_classifier.record_decision(p_end, verdict, plan["is_ending"])
+        return plan
+
+    # 종료 판단 + 키워드 + 검색 쿼리를 한 번에 (실패하면 None)
+    def plan_turn(self) -> Optional[dict]:
+        try:
+            response = self.client.chat.completions.create(**self._turn_plan_request())
+            return self._parse_turn_plan(response.choices[0].message.content)
+        except Exception as e:
+            print(f"[❗턴 계획 실패] {e}")
+            return None
+
     # 사용자가 대화를 종료하려는 의도 확인하기
+    # 분명한 경우는 로컬 분류기로 바로 판단하고, 애매할 때만 LLM 호출
     def is_conversation_ending(self) -> bool:
+        if len(self.chat_history) <= 2:
+            return False
+        utterance, prev_assistant = last_turn(self.chat_history)
+        return end_intent_classifier.resolve(utterance, prev_assistant, self._is_conversation_ending_llm)
+
+    def _is_conversation_ending_llm(self) -> bool:
         try:
-            # 대화 히스토리가 너무 짧은 경우, 종료로 간주하지 않음
-            if len(self.chat_history) <= 2:
+            request = self._end_check_request()
+            if request is None:
                 return False
 
-            # 최근 대화 6개만 사용
-            recent_history = self.chat_history[-6:]
-
-            # 시스템 지시 및 히스토리 포함 메시지 구성
-            messages = [
-                {"role": "system", "content": (
-                    "다음은 사용자와 챗봇 사이의 최근 대화입니다.\n"
-                    "이 대화의 마지막 사용자 발화가 대화를 끝내려는 의도인지 판단해 주세요.\n"
-                    "반드시 '예' 또는 '아니오'로만 대답해 주세요.\n"
-                    "대화 시작 인사('안녕', '하이', '안녕하세요') 등은 종료가 아닙니다.\n"
-                )}
-            ]
-            messages.extend(recent_history)
-            messages.append({
-                "role": "system",
-                "content": "위 대화에서 마지막 사용자의 발화는 대화를 끝내려는 의도입니까? 반드시 '예' 또는 '아니오'로만 대답하세요."
-            })
-
             # GPT 모델 호출
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-mini",  # 또는 "gpt-3.5-turbo", "gpt-4" 등
-                messages=messages,
-                temperature=0.0,
-                max_tokens=5
-            )
+            response = self.client.chat.completions.create(**request)
             answer = response.choices[0].message.content.strip().lower()
             return "예" in answer
 
@@ -227,18 +583,57 @@ class RT_Daily_Chatbot:
             print(f"[❗대화 종료 판단 실패] {e}")
             return False
 
+    # ──────────────────────────────────
+    # 비동기 호출 (ask_async에서 사용)
+    async def _plan_turn_async(self) -> Optional[dict]:
+        try:
+            response = await self.async_client.chat.completions.create(**self._turn_plan_request())
+            return self._parse_turn_plan(response.choices[0].message.content)
+        except Exception as e:
+            print(f"[❗턴 계획 실패] {e}")
+            return None
+
+    async def _build_query_async(self, keywords: list[str]) -> str:
+        response = await self.async_client.chat.completions.create(**self._build_query_request(keywords))
+        return response.choices[0].message.content.strip()
+
+    async def _extract_keywords_async(self, text: str) -> List[str]:
+        try:
+            response = await self.async_client.chat.completions.create(**self._keywords_request(text))
+            return self._parse_keywords(response.choices[0].message.content)
+        except Exception:
+            return []
+
+    async def _is_conversation_ending_async(self) -> bool:
+        if len(self.chat_history) <= 2:
+            return False
+        utterance, prev_assistant = last_turn(self.chat_history)
+        return await end_intent_classifier.aresolve(utterance, prev_assistant, self._is_conversation_ending_llm_async)
+
+    async def _is_conversation_ending_llm_async(self) -> bool:
+        try:
+            request = self._end_check_request()
+            if request is None:
+                return False
+            response = await self.async_client.chat.completions.create(**request)
+            answer = response.choices[0].message.content.strip().lower()
+            return "예" in answer
+        except Exception as e:
+            print(f"[❗대화 종료 판단 실패] {e}")
+            return False
+
 
     # 일기 생성하기    
-    def generate_diary(self) -> Tuple[str, str]:
+    def generate_diary(self, chat_history: List[dict] = None, raise_errors: bool = False) -> Tuple[str, str]:
         summary_prompt = {
             "role": "system",
-            "content": self._load_prompt("./prompt/diary_gen_prompt.txt")
+            "content": prompts.render(DIARY_GEN_PROMPT_PATH)
         }
 
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4.1-mini",
-                messages=[summary_prompt] + self.chat_history,
+                messages=[summary_prompt] + (self.chat_history if chat_history is None else chat_history),
                 temperature=0.7,
                 max_tokens=300
             )
@@ -254,6 +649,9 @@ class RT_Daily_Chatbot:
 
             return title, body
         except Exception as e:
+            print(f"[일기 생성 실패] {e}")
+            if raise_errors:
+                raise
             return "에러", "일기를 생성하는 데 문제가 발생했어요."
 
 
@@ -2,8 +2,11 @@ import os
 import json
 import openai
 from datetime import datetime
+from typing import Optional
 from dotenv import load_dotenv
 from diary_db_management import DiaryDBManager
+from orientation_eval import orientation_evaluator
+from prompt_registry import prompts
 # .env에서 API 키 로드
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -13,21 +16,71 @@ QUIZ_PROMPT_PATH = "./prompt/recall_sess_quiz_gen_prompt_3.txt"
 ASSISTANT_SYSTEM_PATH = "./prompt/recall_sess_assistant_prompt_2.txt"
 EVALUATION_SYSTEM_PATH = "./prompt/recall_sess_evaluation_system.txt"
 
+# 프롬프트는 모듈 로드 시 한 번 읽고 변수를 검사 (누락되면 서버 시작 단계에서 실패)
+prompts.register(QUIZ_PROMPT_PATH, ["date", "diary_content"])
+prompts.register(EVALUATION_SYSTEM_PATH, ["recall_question", "recall_answer", "user_answer", "diary_content"])
+
+class RecallSessionState:
+    """
+    회상 세션 한 번의 진행 상태. 서버에 session_id로 보관하고 클라이언트에는 질문(정답 제외)만 보냅니다.
+    """
+    QUESTION_TYPES = ["시간 지남력", "장소 지남력", "기억력"]
+    MAX_ATTEMPTS = 3
+
+    def __init__(self):
+        self.user_id = None
+        self.date = None
+        self.diary_content = []  # 채점 프롬프트에 넣을 일기 [{"page_content", "metadata"}, ...]
+        self.questions = []  # [{"type", "question", "answer"}, ...]
+        self.question_index = 0
+        self.attempt = 1
+
+    def start(self, user_id: str, date: str, diary_content: list, qnas: list[dict]) -> None:
+        self.user_id, self.date = user_id, date
+        self.diary_content = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in diary_content]
+        self.questions = [
+            {"type": self.QUESTION_TYPES[idx], "question": qa["질문"], "answer": qa["답변"]}
+            for idx, qa in enumerate(qnas[:len(self.QUESTION_TYPES)])
+        ]
+        self.question_index, self.attempt = 0, 1
+
+    @property
+    def finished(self) -> bool:
+        return self.question_index >= len(self.questions)
+
+    @property
+    def current(self) -> dict:
+        return self.questions[self.question_index]
+
+    def public_question(self) -> Optional[dict]:
+        """현재 질문 (정답은 빼고)"""
+        if self.finished:
+            return None
+        return {"type": self.current["type"], "question": self.current["question"]}
+
+    def record(self, is_correct: bool) -> str:
+        """채점 결과로 진행 상태를 옮기고, 안내 문구(없으면 빈 문자열)를 반환합니다."""
+        if is_correct or self.attempt >= self.MAX_ATTEMPTS:
+            message = "" if is_correct else RT_ChatRecallSession.TOO_MANY_WRONG_MESSAGE
+            self.question_index += 1
+            self.attempt = 1
+            return message
+        self.attempt += 1
+        return ""
+
+
 class RT_ChatRecallSession:
+    # 한 문항을 세 번 모두 틀렸을 때 안내 문구
+    TOO_MANY_WRONG_MESSAGE = "세 번 모두 틀리셨어요. 다음 문항으로 넘어갑니다."
+
     def __init__(self, db_manager: DiaryDBManager = None):
         self.db_manager = db_manager if db_manager else DiaryDBManager()
         self.chat_history = []  # 대화 기록 저장용
         self.client = openai.OpenAI(api_key=openai.api_key)
 
     def load_prompt(self, path: str, **kwargs) -> str:
-        """프롬프트 파일을 로드하고 필요시 형식을 지정합니다."""
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                template = f.read()
-            return template.format(**kwargs) if kwargs else template
-        except FileNotFoundError:
-            print(f"[프롬프트 파일 없음] {path}")
-            return ""
+        """프롬프트를 (공유 저장소에서) 가져와 필요시 형식을 지정합니다."""
+        return prompts.render(path, **kwargs)
     
     def get_diary_content(self, date: str, user_id: str):
         """최근 일주일의 일기 작성 가져오기"""
@@ -38,11 +91,13 @@ class RT_ChatRecallSession:
             raise ValueError(f"해당 날짜의 일기가 없습니다: {date}")
 
     # 일기 내용 기반으로 회상 질문 생성하기
-    def generate_recall_questions(self, user_id: str):  
-        today = datetime.today().strftime("%Y-%m-%d")
-        diary_contents = self.get_diary_content(today, user_id)
+    def generate_recall_questions(self, user_id: str, date: str = None, diary_contents=None):
+        """date(기본 오늘)까지 최근 일주일 일기로 회상 질문을 만듭니다. 이미 불러온 일기가 있으면 diary_contents로 전달"""
+        date = date or datetime.today().strftime("%Y-%m-%d")
+        if diary_contents is None:
+            diary_contents = self.get_diary_content(date, user_id)
 
-        prompt = self.load_prompt(QUIZ_PROMPT_PATH, date=today, diary_content=diary_contents)
+        prompt = self.load_prompt(QUIZ_PROMPT_PATH, date=date, diary_content=diary_contents)
         response = self.client.chat.completions.create(
             model="gpt-4.1-mini",
             messages=[{"role": "system", "content": prompt}],
@@ -61,7 +116,17 @@ class RT_ChatRecallSession:
             print("📝 원본 응답:", reply)
             return []  # 빈 리스트 반환하여 이후 코드에서 예외 처리 가능하게
 
-    def evaluate_user_answer(self, recall_question, recall_answer, user_answer, diary_content):
+    def evaluate_user_answer(self, recall_question, recall_answer, user_answer, diary_content,
+                             question_type: str = None, date: str = None):
+        """
+        (정답 여부, 피드백, 힌트, 점수)를 반환합니다.
+        시간/장소 지남력 문항은 날짜·요일·장소를 로컬에서 먼저 비교하고, 애매한 답만 LLM으로 채점합니다.
+        date는 '어제', '사흘 전' 같은 표현의 기준일 (기본 오늘)
+        """
+        local = orientation_evaluator.evaluate(question_type, recall_answer, user_answer, date)
+        if local is not None:
+            return local
+
         # 시스템 명령어 프롬프트 로드
         # system_instruction = self.load_prompt(ASSSISTANT_SYSTEM_PATH)
         
@@ -108,7 +173,7 @@ class RT_ChatRecallSession:
                 user_answer = input("👉 당신의 답변: ")
                 self.chat_history.append({"role": "user", "content": user_answer})
                 is_correct, feedback, hint, score = self.evaluate_user_answer(
-                    qa["질문"], qa["답변"], user_answer, diary_content
+                    qa["질문"], qa["답변"], user_answer, diary_content, question_type=recall_type
                 )
 
                 print("✅ 평가 결과:", feedback)
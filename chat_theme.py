@@ -2,10 +2,12 @@ import openai
 from datetime import datetime
 import os
 from dotenv import load_dotenv
-import requests
 from diary_db_management import DiaryDBManager
-from typing import List, Tuple, Dict, Optional
-from collections import Counter
+from diary_jobs import DiaryJobQueue
+from end_intent import end_intent_classifier, last_turn
+from profile_client import profile_client
+from prompt_registry import prompts
+from typing import Dict, Iterator, List, Optional, Tuple
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -18,11 +20,25 @@ PROMPT_FIRST_QUESTION_PATH = "./prompt/theme_first_question_prompt.txt"
 PROMPT_FOLLOW_UP_PATH = "./prompt/theme_follow_up_prompt.txt"
 PROMPT_END_CHECK_PATH = "./prompt/end_check_prompt.txt"
 
+# 프롬프트는 모듈 로드 시 한 번 읽고 변수를 검사 (누락되면 서버 시작 단계에서 실패)
+prompts.register(PROMPT_DIARY_GEN_PATH)
+prompts.register(PROMPT_SELECT_THEME_PATH, ["profile_info", "theme_list_str", "theme_count_str"])
+prompts.register(PROMPT_FIRST_QUESTION_PATH, ["theme_name", "profile_info", "chat_history", "observation"])
+prompts.register(PROMPT_FOLLOW_UP_PATH, ["profile_info", "chat_history", "user_input"])
+prompts.register(PROMPT_END_CHECK_PATH, ["chat_history"])
+
 class RT_Theme_Chatbot:
-    def __init__(self, db_manager: DiaryDBManager = None):
+    FAREWELL_MESSAGE = "오늘 이야기를 들을 수 있어서 기뻤어요. 내일도 기다리고 있을게요 😊"
+    DIARY_SAVED_NOTICE = "\n\n(일기가 저장되었어요. 프로그램을 종료합니다.)"
+    DIARY_PENDING_NOTICE = "\n\n(일기를 정리해서 저장하고 있어요. 프로그램을 종료합니다.)"
+    END_CONFIRM_MESSAGE = "혹시 지금 대화를 마무리하시고 싶으신가요? 다른 이야기는 다음에 또 나눠요 😊"
+
+    def __init__(self, db_manager: DiaryDBManager = None, diary_jobs: DiaryJobQueue = None):
         openai.api_key = OPENAI_API_KEY
         self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
         self.db_manager = db_manager
+        # 작업 큐가 있으면 일기 생성·저장을 백그라운드로 넘기고 마무리 인사를 바로 반환
+        self.diary_jobs = diary_jobs
         self.chat_history: List[Dict[str, str]] = []
         self.awaiting_end_confirmation: bool = False
         self.current_theme: str = "학교/학창시절"  # 기본 테마 설정
@@ -30,6 +46,7 @@ class RT_Theme_Chatbot:
     def reset(self) -> None:
         """챗봇 상태 초기화"""
         self.chat_history.clear()
+        self.awaiting_end_confirmation = False
 
     # ──────────────────────────────────   
     # 1) 테마 선택 단계 (ReACT)
@@ -38,9 +55,8 @@ class RT_Theme_Chatbot:
         profile_info = self._format_profile_info(profile)
 
         # 테마별 회상 횟수 가져오기
-        docs = self.db_manager.search_all_diaries(user_id)
-        themes = [doc.metadata.get("theme", "").strip() for doc in docs if doc.metadata.get("theme")]
-        counts = Counter(themes)
+        theme_stats = self.db_manager.get_theme_stats(user_id)
+        counts = {theme: entry["count"] for theme, entry in theme_stats.items()}
 
         # 테마 리스트 문자열
         theme_order = {
@@ -55,8 +71,8 @@ class RT_Theme_Chatbot:
         )
 
         # 프롬프트 파일 로드 및 형식 지정
-        select_prompt_template = self._load_prompt(PROMPT_SELECT_THEME_PATH)
-        select_prompt = select_prompt_template.format(
+        select_prompt = prompts.render(
+            PROMPT_SELECT_THEME_PATH,
             profile_info=profile_info,
             theme_list_str=theme_list_str,
             theme_count_str=theme_count_str
@@ -86,8 +102,8 @@ class RT_Theme_Chatbot:
         observation = "없음"  # (필요 시 여기에 과거 일기 요약 삽입)
 
         # 프롬프트 파일 로드 및 형식 지정
-        question_prompt_template = self._load_prompt(PROMPT_FIRST_QUESTION_PATH)
-        question_prompt = question_prompt_template.format(
+        question_prompt = prompts.render(
+            PROMPT_FIRST_QUESTION_PATH,
             theme_name=theme_name,
             profile_info=profile_info,
             chat_history=self._get_chat_history_text(limit=5),
@@ -113,6 +129,47 @@ class RT_Theme_Chatbot:
     # ──────────────────────────────────
     # 4) 후속 대화 (ask)
     def ask(self, user_input: str, user_id: str) -> Dict[str, Optional[str]]:
+        result, request = self._prepare_turn(user_input, user_id)
+        if result is not None:
+            return result
+
+        resp2 = self.client.chat.completions.create(**request)
+        answer = resp2.choices[0].message.content.strip()
+        self.chat_history.append({"role": "assistant", "content": answer})
+        return {"response": answer}
+
+    def ask_stream(self, user_input: str, user_id: str) -> Iterator[Dict[str, Optional[str]]]:
+        """
+        ask()의 스트리밍 버전. 후속 질문 토큰이 도착하는 대로 {"type": "delta", "text": ...}를 내보내고,
+        마지막에 ask()와 같은 결과를 {"type": "done", ...}으로 보냅니다.
+        대화 기록에는 스트림이 끝난 뒤 완성된 답변이 추가됩니다.
+        """
+        result, request = self._prepare_turn(user_input, user_id)
+        if result is not None:
+            # 종료 확인 질문·마무리 인사는 고정 문구라 한 번에 전송
+            yield {"type": "delta", "text": result["response"]}
+            yield {"type": "done", **result}
+            return
+
+        parts = []
+        stream = self.client.chat.completions.create(**request, stream=True)
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield {"type": "delta", "text": chunk.choices[0].delta.content}
+        finally:
+            stream.close()
+
+        answer = "".join(parts).strip()
+        self.chat_history.append({"role": "assistant", "content": answer})
+        yield {"type": "done", "response": answer}
+
+    def _prepare_turn(self, user_input: str, user_id: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """
+        후속 질문 생성 직전까지 처리합니다.
+        종료 확인/마무리로 턴이 끝나면 (결과, None)을, 아니면 (None, 후속 질문 요청 인자)를 반환합니다.
+        """
         # 1) 사용자 메시지 기록
         self.chat_history.append({"role": "user", "content": user_input})
 
@@ -126,16 +183,25 @@ class RT_Theme_Chatbot:
             # 이번 턴(지금 들어온 user_input)이 실제로 다시 "끝내고 싶다"는 뉘앙스인지 확인
             if self._is_conversation_ending():
                 # 두 번째로 종료 의사를 보였으므로 진짜 종료 처리
-                farewell = "오늘 이야기를 들을 수 있어서 기뻤어요. 내일도 기다리고 있을게요 😊"
+                farewell = self.FAREWELL_MESSAGE
                 self._append_assistant_message(farewell)
-                diary_title, diary_body, diary_theme = self._generate_diary()
-                diary_result = self._save_diary(diary_title, diary_body, diary_theme, user_id)
-                # awaiting_end_confirmation 초기화
-                self.awaiting_end_confirmation = False
+                theme = self._extract_theme_from_chat()
+                # 끝난 대화는 일기로 넘기고 상태를 초기화해 다음 대화에 이어 붙지 않게 함
+                chat_history = list(self.chat_history)
+                self.reset()
+                if self.diary_jobs is not None:
+                    job_id = self.diary_jobs.submit(
+                        "theme", user_id,
+                        {"user_id": user_id, "chat_history": chat_history, "theme": theme},
+                    )
+                    return {
+                        "response": farewell + self.DIARY_PENDING_NOTICE,
+                        "diary_job": {"job_id": job_id, "status": "queued"},
+                    }, None
                 return {
-                    "response": f"{farewell}\n\n(일기가 저장되었어요. 프로그램을 종료합니다.)",
-                    "diary": diary_result,
-                }
+                    "response": farewell + self.DIARY_SAVED_NOTICE,
+                    "diary": self.write_diary(user_id, chat_history, theme),
+                }, None
             else:
                 # 두 번째로 종료 의사를 보이지 않았으므로 "확인 대기" 상태 해제
                 self.awaiting_end_confirmation = False
@@ -146,39 +212,30 @@ class RT_Theme_Chatbot:
         if self._is_conversation_ending():
             # 첫 번째로 종료 의도가 감지됨 → 확인 질문만 던지고 반환
             self.awaiting_end_confirmation = True
-            confirm = "혹시 지금 대화를 마무리하시고 싶으신가요? 다른 이야기는 다음에 또 나눠요 😊"
+            confirm = self.END_CONFIRM_MESSAGE
             self._append_assistant_message(confirm)
-            return {"response": confirm}
+            return {"response": confirm}, None
         
         # 4) Thought 1: "사용자 발화를 이해하고, 어떤 후속 질문을 던질지 고민"
         # 프롬프트 파일 로드 및 형식 지정
-        thought2_prompt_template = self._load_prompt(PROMPT_FOLLOW_UP_PATH)
-        thought2_prompt = thought2_prompt_template.format(
+        thought2_prompt = prompts.render(
+            PROMPT_FOLLOW_UP_PATH,
             profile_info=profile_info,
             chat_history=self._get_chat_history_text(limit=5),
             user_input=user_input
         )
 
-        resp2 = self.client.chat.completions.create(
+        return None, dict(
             model=OPENAI_MODEL,
             messages=[{"role": "system", "content": thought2_prompt}],
             temperature=0.7,
             max_tokens=200
         )
-        answer = resp2.choices[0].message.content.strip()
-        self.chat_history.append({"role": "assistant", "content": answer})
-        return {"response": answer}
 
 
     def _fetch_user_profile(self, user_id: str) -> Dict[str, Optional[str]]:
-        url = f"https://nabiya.site/api/users/get_user_info/?user_id={user_id}"
-        try:
-            resp = requests.get(url, timeout=5)
-            resp.raise_for_status()
-            return resp.json()
-        except Exception as e:
-            print(f"[프로필 조회 실패] user_id={user_id} / error={e}")
-            return {}
+        # 테마 선택·첫 질문·매 턴마다 불리므로 공유 프로필 클라이언트의 캐시를 사용
+        return profile_client.get(user_id)
 
     def _format_profile_info(self, profile: Dict[str, Optional[str]]) -> str:
         name = profile.get("name", "알 수 없음")
@@ -214,12 +271,32 @@ class RT_Theme_Chatbot:
         if len(self.chat_history) <= 2:
             return False
 
+        # 분명한 경우는 로컬 분류기로 바로 판단하고, 애매할 때만 LLM 호출
+        utterance, prev_assistant = last_turn(self.chat_history)
+        is_intent = end_intent_classifier.resolve(utterance, prev_assistant, self._is_conversation_ending_llm)
+
+        # ── 검증 로직 ──
+        if is_intent:
+            if self.awaiting_end_confirmation:
+                # 이미 한번 "끝내도 되겠냐" 물어본 뒤, 사용자가 다시 종료 의사 표시 → 진짜 종료
+                self.awaiting_end_confirmation = False
+                return True
+            else:
+                # 처음으로 "끝내고 싶다"는 의도로 판정 → 확인 질문을 던지기 위해 True가 아닌 "확인 필요" 상태만 표시
+                self.awaiting_end_confirmation = True
+                return False
+        else:
+            # 종료 의사 없음 → confirmation 대기 상태 초기화
+            self.awaiting_end_confirmation = False
+            return False
+        
+    def _is_conversation_ending_llm(self) -> bool:
         # 최근 6개 메시지 가져오기
         recent_msgs = self.chat_history[-6:]
         
         # 프롬프트 파일 로드 및 형식 지정
-        system_prompt_template = self._load_prompt(PROMPT_END_CHECK_PATH)
-        system_prompt = system_prompt_template.format(
+        system_prompt = prompts.render(
+            PROMPT_END_CHECK_PATH,
             chat_history=self._get_chat_history_text(limit=6)
         )
         
@@ -235,39 +312,14 @@ class RT_Theme_Chatbot:
                 max_tokens=5,
             )
             answer = response.choices[0].message.content.strip().lower()
-            is_intent = "예" in answer
+            return "예" in answer
         except Exception as e:
             print(f"[대화 종료 판단 실패] {e}")
             return False
 
-        # ── 검증 로직 ──
-        if is_intent:
-            if self.awaiting_end_confirmation:
-                # 이미 한번 "끝내도 되겠냐" 물어본 뒤, 사용자가 다시 종료 의사 표시 → 진짜 종료
-                self.awaiting_end_confirmation = False
-                return True
-            else:
-                # 처음으로 "끝내고 싶다"는 의도로 판정 → 확인 질문을 던지기 위해 True가 아닌 "확인 필요" 상태만 표시
-                self.awaiting_end_confirmation = True
-                return False
-        else:
-            # 종료 의사 없음 → confirmation 대기 상태 초기화
-            self.awaiting_end_confirmation = False
-            return False
-        
     def _append_assistant_message(self, content: str) -> None:
         self.chat_history.append({"role": "assistant", "content": content})
 
-    def _load_prompt(self, file_path: str) -> str:
-        """프롬프트 파일을 로드합니다."""
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            print(f"[프롬프트 파일 없음] {file_path}")
-            # 기본 프롬프트 반환 또는 에러 처리
-            return ""
-
     def _extract_theme_from_chat(self) -> str:
         """대화 내용에서 현재 테마를 추출합니다."""
         # 이미 테마가 저장되어 있으면 그대로 반환
@@ -309,10 +361,19 @@ class RT_Theme_Chatbot:
         return "학교/학창시절"  # 기본값은 가장 우선순위가 높은 테마로 설정
 
 
-    def _generate_diary(self) -> Tuple[str, str, str]:
-        """대화 기록을 바탕으로 일기 제목, 본문, 테마를 생성합니다."""
-        prompt = self._load_prompt(PROMPT_DIARY_GEN_PATH)
-        messages = [{"role": "system", "content": prompt}] + self.chat_history
+    def write_diary(self, user_id: str, chat_history: List[Dict[str, str]], theme: str,
+                    raise_errors: bool = False) -> Dict[str, str]:
+        """
+        대화 기록으로 일기를 생성해 저장합니다. (일기 작업 큐의 처리 함수로도 사용)
+        raise_errors=True면 생성 실패 시 예외를 그대로 던져 아무것도 저장하지 않습니다. (작업 큐가 재시도하도록)
+        """
+        diary_title, diary_body = self._generate_diary(chat_history, raise_errors=raise_errors)
+        return self._save_diary(diary_title, diary_body, theme, user_id)
+
+    def _generate_diary(self, chat_history: List[Dict[str, str]], raise_errors: bool = False) -> Tuple[str, str]:
+        """대화 기록을 바탕으로 일기 제목과 본문을 생성합니다."""
+        prompt = prompts.render(PROMPT_DIARY_GEN_PATH)
+        messages = [{"role": "system", "content": prompt}] + chat_history
         try:
             response = self.client.chat.completions.create(
                 model=OPENAI_MODEL,
@@ -328,14 +389,13 @@ class RT_Theme_Chatbot:
                 body = diary_text.split("본문 :")[1].strip()
             else:
                 title, body = "무제", diary_text
-                
-            # 대화 내용에서 현재 테마 추출
-            theme = self._extract_theme_from_chat()
-            
-            return title, body, theme
+
+            return title, body
         except Exception as e:
             print(f"[일기 생성 실패] {e}")
-            return "에러", "일기를 생성하는 데 문제가 발생했어요.", "일반"
+            if raise_errors:
+                raise
+            return "에러", "일기를 생성하는 데 문제가 발생했어요."
 
     def _save_diary(self, title: str, body: str, theme:str,user_id: str):
         today = datetime.now().strftime("%Y-%m-%d")
@@ -362,7 +422,8 @@ class RT_Theme_Chatbot:
         # JSON 형식으로 반환
         return {
             "title": title,
-            "body": body
+            "body": body,
+            "theme": theme
         }
 
 
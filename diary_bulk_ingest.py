@@ -0,0 +1,155 @@
+"""
+dataset_diary CSV를 벡터 DB에 한 번에 적재하는 스크립트.
+
+    python diary_bulk_ingest.py --csv dataset_diary/filtered_diary_4079.csv
+
+CSV를 청크 단위로 읽어 큰 배치로 임베딩하고(동시 요청 수 제한),
+청크마다 임베딩 결과를 체크포인트로 남깁니다. 중간에 끊겨도 다시 실행하면
+이미 임베딩한 청크는 건너뛰고, 마지막에 사용자별 인덱스를 한 번에 만듭니다.
+각 author_id는 '<prefix><author_id>' 형태의 user_id로 매핑됩니다.
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from diary_db_management import DiaryDBManager
+
+load_dotenv()
+
+METADATA_COLUMNS = ["title", "author_age", "author_sex", "author_occupation", "age_group"]
+
+
+def _normalize_date(value) -> Optional[str]:
+    """'20200512' 같은 text_date를 'YYYY-MM-DD'로 변환합니다. 월/일이 00이면 None."""
+    try:
+        return datetime.strptime(str(value), "%Y%m%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _chunk_paths(checkpoint_dir: str, chunk_no: int) -> tuple[str, str]:
+    base = os.path.join(checkpoint_dir, f"chunk_{chunk_no:06d}")
+    return base + ".npy", base + ".json"
+
+
+def _rows_from_chunk(df: pd.DataFrame, start_row: int, user_prefix: str) -> list[dict]:
+    rows = []
+    for offset, record in enumerate(df.to_dict(orient="records")):
+        text = str(record.get("sentence") or "").strip()
+        if not text:
+            continue
+        author_id = str(record["author_id"])
+        meta = {col: str(record[col]) for col in METADATA_COLUMNS if col in record and pd.notna(record[col])}
+        meta["author_id"] = author_id
+        meta["source"] = "dataset_diary"
+        date = _normalize_date(record.get("text_date"))
+        if date:
+            meta["date"] = date
+        rows.append({
+            # 행 번호 기반의 고정 ID라서 재실행해도 같은 문서가 중복 적재되지 않음
+            "doc_id": f"dataset-{author_id}-{start_row + offset}",
+            "user_id": f"{user_prefix}{author_id}",
+            "text": text,
+            "metadata": meta,
+        })
+    return rows
+
+
+def _embed_rows(db: DiaryDBManager, rows: list[dict], batch_size: int, pool: ThreadPoolExecutor) -> np.ndarray:
+    texts = [row["text"] for row in rows]
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    # pool의 작업자 수가 동시에 나가는 임베딩 요청 수의 상한
+    results = list(pool.map(db.embedding.embed_documents, batches))
+    return np.asarray([vector for batch in results for vector in batch], dtype=np.float32)
+
+
+def _save_checkpoint(checkpoint_dir: str, chunk_no: int, rows: list[dict], vectors: np.ndarray) -> None:
+    vec_path, rec_path = _chunk_paths(checkpoint_dir, chunk_no)
+    with open(vec_path + ".tmp", "wb") as f:
+        np.save(f, vectors)
+    os.replace(vec_path + ".tmp", vec_path)
+    # 레코드 파일이 마지막에 생기므로 이 파일이 있으면 청크가 완료된 것
+    with open(rec_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False)
+    os.replace(rec_path + ".tmp", rec_path)
+
+
+def ingest(csv_path: str, persist_path: str, checkpoint_dir: str, user_prefix: str,
+           chunk_size: int, batch_size: int, concurrency: int) -> dict[str, int]:
+    db = DiaryDBManager(persist_path=persist_path)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    # 청크 번호가 행 범위와 1:1로 대응해야 하므로, 다른 설정으로 이어서 돌리는 것은 막음
+    settings = {"csv": os.path.abspath(csv_path), "chunk_size": chunk_size, "user_prefix": user_prefix}
+    settings_path = os.path.join(checkpoint_dir, "settings.json")
+    if os.path.exists(settings_path):
+        with open(settings_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous != settings:
+            raise ValueError(f"체크포인트 설정이 다릅니다: {previous} != {settings} (다른 --checkpoint-dir 를 사용하세요)")
+    else:
+        with open(settings_path, "w", encoding="utf-8") as f:
+            json.dump(settings, f, ensure_ascii=False)
+
+    # 1) CSV를 청크 단위로 읽으며 임베딩 → 체크포인트
+    chunk_count = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        reader = pd.read_csv(csv_path, chunksize=chunk_size, dtype=str)
+        for chunk_no, df in enumerate(reader):
+            chunk_count += 1
+            if os.path.exists(_chunk_paths(checkpoint_dir, chunk_no)[1]):
+                print(f"[체크포인트] chunk {chunk_no} 건너뜀")
+                continue
+            rows = _rows_from_chunk(df, chunk_no * chunk_size, user_prefix)
+            vectors = _embed_rows(db, rows, batch_size, pool) if rows else np.zeros((0, 0), dtype=np.float32)
+            _save_checkpoint(checkpoint_dir, chunk_no, rows, vectors)
+            print(f"[임베딩 완료] chunk {chunk_no} / {len(rows)}건")
+
+    # 2) 체크포인트를 사용자별로 모아 인덱스를 한 번에 생성
+    grouped: dict[str, list[tuple[str, str, dict, list[float]]]] = {}
+    for chunk_no in range(chunk_count):
+        vec_path, rec_path = _chunk_paths(checkpoint_dir, chunk_no)
+        with open(rec_path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        vectors = np.load(vec_path)
+        for row, vector in zip(rows, vectors):
+            grouped.setdefault(row["user_id"], []).append(
+                (row["doc_id"], row["text"], row["metadata"], vector.tolist())
+            )
+
+    added = {}
+    for user_id, rows in grouped.items():
+        added[user_id] = db.bulk_add_embeddings(user_id, rows)
+
+    print(f"[적재 완료] 사용자 {len(grouped)}명, 새 일기 {sum(added.values())}개 / 임베딩 캐시 {db.embedding.stats()}")
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="dataset_diary CSV를 사용자별 FAISS 인덱스로 일괄 적재합니다.")
+    parser.add_argument("--csv", default="dataset_diary/preproc_4079_diary.csv")
+    parser.add_argument("--persist-path", default="vectorstore/diary_faiss")
+    parser.add_argument("--checkpoint-dir", default=None, help="기본값: <persist-path>/bulk_ingest/<csv 파일명>")
+    parser.add_argument("--user-prefix", default="dataset_", help="author_id 앞에 붙일 user_id 접두어")
+    parser.add_argument("--chunk-size", type=int, default=500, help="CSV에서 한 번에 읽을 행 수")
+    parser.add_argument("--batch-size", type=int, default=100, help="임베딩 요청 1회에 보낼 텍스트 수")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시에 보낼 임베딩 요청 수")
+    args = parser.parse_args()
+
+    checkpoint_dir = args.checkpoint_dir or os.path.join(
+        args.persist_path, "bulk_ingest", os.path.splitext(os.path.basename(args.csv))[0]
+    )
+    ingest(
+        csv_path=args.csv,
+        persist_path=args.persist_path,
+        checkpoint_dir=checkpoint_dir,
+        user_prefix=args.user_prefix,
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+    )
@@ -1,59 +1,907 @@
 from datetime import datetime, timedelta
+import bisect
+import copy
+import heapq
+import json
 import os
+import pickle
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from urllib.parse import quote, unquote
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import openai
+from embedding_cache import CachedEmbeddings
+from rwlock import ReadWriteLock
+
+# 사용자별 샤드가 저장되는 하위 디렉토리와, 분리 후 기존 전역 인덱스를 보관할 디렉토리
+SHARD_DIR_NAME = "users"
+LEGACY_DIR_NAME = "legacy_global"
+LEGACY_INDEX_FILES = ("index.faiss", "index.pkl")
+DATE_FORMAT = "%Y-%m-%d"
+MIN_DATE, MAX_DATE = "0000-01-01", "9999-12-31"
+
+# 샤드 디렉토리 구성
+#   index.faiss / index.pkl : 마지막으로 압축(compaction)된 스냅샷 (FAISS.save_local 형식)
+#   manifest.json           : 스냅샷에 반영된 마지막 세그먼트 번호
+#   segments/<seq>.npy      : 일기 저장 1회분의 임베딩 벡터
+#   segments/<seq>.json     : 같은 회차의 docstore 레코드 (이 파일이 있어야 세그먼트가 유효)
+SEGMENT_DIR_NAME = "segments"
+MANIFEST_FILE = "manifest.json"
+COMPACT_SEGMENT_THRESHOLD = 32
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_CACHE_FILE = "embedding_cache.sqlite3"
+
+# 테마별 회상 횟수 / 마지막 회상 날짜 ({테마: {"count": n, "last_date": "YYYY-MM-DD"}})
+THEME_STATS_FILE = "theme_stats.json"
+
+# 쓰기 지연(write-behind): 새 일기는 저널에 먼저 기록하고, 모아서 한 번에 임베딩·색인
+#   write_behind.jsonl : 아직 색인에 반영되지 않은 일기 (한 줄에 하나, 반영되면 지워짐)
+WRITE_BEHIND_JOURNAL_FILE = "write_behind.jsonl"
+# 이만큼 쌓이거나 가장 오래된 일기가 이 시간(초)만큼 기다렸으면 반영
+WRITE_BEHIND_MAX_DOCS = int(os.getenv("WRITE_BEHIND_MAX_DOCS", "16"))
+WRITE_BEHIND_MAX_DELAY = float(os.getenv("WRITE_BEHIND_MAX_DELAY", "2.0"))
+
+
+def _fsync_write(path: str, data: bytes) -> None:
+    """임시 파일에 쓰고 fsync 한 뒤 원자적으로 교체합니다."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _read_manifest(shard_path: str) -> dict:
+    try:
+        with open(os.path.join(shard_path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"compacted_seq": 0}
+
+
+def _list_segments(shard_path: str) -> list[int]:
+    """커밋된(.json이 존재하는) 세그먼트 번호를 오름차순으로 반환합니다."""
+    seg_dir = os.path.join(shard_path, SEGMENT_DIR_NAME)
+    if not os.path.isdir(seg_dir):
+        return []
+    seqs = []
+    for name in os.listdir(seg_dir):
+        stem, ext = os.path.splitext(name)
+        if ext == ".json" and stem.isdigit():
+            seqs.append(int(stem))
+    return sorted(seqs)
+
+
+def _segment_paths(shard_path: str, seq: int) -> tuple[str, str]:
+    base = os.path.join(shard_path, SEGMENT_DIR_NAME, f"{seq:010d}")
+    return base + ".npy", base + ".json"
+
+
+def diary_type_of(metadata: dict) -> str:
+    """일기 종류: 'daily'(일상 대화), 'theme'(테마 회상), 그 밖에는 source 값 (예: 'dataset_diary')"""
+    if metadata.get("daily_diary") == "daily_diary":
+        return "daily"
+    if metadata.get("theme"):
+        return "theme"
+    return metadata.get("source", "other")
+
+
+def _bump_theme_stats(stats: dict, metadata: dict) -> bool:
+    theme = (metadata.get("theme") or "").strip()
+    if not theme:
+        return False
+    entry = stats.setdefault(theme, {"count": 0, "last_date": None})
+    entry["count"] += 1
+    date = metadata.get("date")
+    if date and (entry["last_date"] is None or date > entry["last_date"]):
+        entry["last_date"] = date
+    return True
+
+
+class _DateIndex:
+    """
+    (날짜, 문서 ID)를 날짜순으로 정렬해 둔 보조 인덱스.
+    날짜는 'YYYY-MM-DD' 문자열이라 사전순 비교가 곧 날짜순 비교이므로,
+    기간 조회는 문서 전체를 훑지 않고 이진 탐색으로 범위만 잘라냅니다.
+    """
+
+    def __init__(self):
+        self._entries: list[tuple[str, str]] = []
+
+    @staticmethod
+    def _valid(date: Optional[str]) -> bool:
+        if not date:
+            return False
+        try:
+            datetime.strptime(date, DATE_FORMAT)
+            return True
+        except ValueError:
+            return False
+
+    def add(self, date: Optional[str], doc_id: str) -> None:
+        if self._valid(date):
+            bisect.insort(self._entries, (date, doc_id))
+
+    def extend(self, items: list[tuple[Optional[str], str]]) -> None:
+        """(날짜, 문서 ID) 여러 개를 한 번에 추가합니다. (하나씩 insort하는 것보다 정렬 한 번이 빠름)"""
+        self._entries.extend((date, doc_id) for date, doc_id in items if self._valid(date))
+        self._entries.sort()
+
+    def copy(self) -> "_DateIndex":
+        clone = _DateIndex()
+        clone._entries = list(self._entries)
+        return clone
+
+    def range(self, start_date: str, end_date: str) -> list[tuple[str, str]]:
+        """start_date 이상 end_date 이하인 (날짜, 문서 ID)를 날짜순으로 반환합니다."""
+        lo = bisect.bisect_left(self._entries, (start_date, ""))
+        hi = bisect.bisect_right(self._entries, (end_date, chr(0x10FFFF)))
+        return self._entries[lo:hi]
+
+
+class _ShardView:
+    """
+    샤드의 한 시점 스냅샷. 한 번 공개된 뷰는 절대 수정하지 않고, 쓰기는 새 뷰를 만들어 통째로 바꿔 끼웁니다.
+    - base: 마지막 압축(또는 불러오기) 시점의 인덱스와 날짜 인덱스. 여러 뷰가 복사 없이 함께 씀
+    - overlay: 그 뒤에 반영된 일기만 담은 작은 인덱스. 저장할 때마다 overlay만 새로 만들므로
+      저장 비용은 전체 일기 수가 아니라 overlay 크기에 비례하고, overlay는 압축 때 base로 합쳐짐
+    읽기는 락 없이 shard.view를 한 번 읽어 끝까지 그 뷰만 쓰면 저장과 섞이지 않습니다.
+    """
+
+    def __init__(self, base: Optional[FAISS], base_dates: _DateIndex, seq: int,
+                 overlay_rows: tuple = (), overlay: Optional[FAISS] = None, overlay_dates: Optional[_DateIndex] = None):
+        self.base = base
+        self.base_dates = base_dates
+        self.seq = seq
+        # overlay에 든 (doc_id, 본문, 메타데이터, 벡터) — overlay를 다시 만들거나 base로 합칠 때 사용
+        self.overlay_rows = overlay_rows
+        self.overlay = overlay
+        self.overlay_dates = overlay_dates or _DateIndex()
+
+    def stores(self) -> list[FAISS]:
+        return [db for db in (self.base, self.overlay) if db is not None]
+
+    def has(self, doc_id: str) -> bool:
+        return any(doc_id in db.docstore._dict for db in self.stores())
+
+    def documents(self) -> list[Document]:
+        return [doc for db in self.stores() for doc in db.docstore._dict.values()]
+
+    def documents_between(self, start_date: str, end_date: str) -> list[Document]:
+        stores = [db.docstore._dict for db in self.stores()]
+        entries = heapq.merge(self.base_dates.range(start_date, end_date), self.overlay_dates.range(start_date, end_date))
+        docs = []
+        for _, doc_id in entries:
+            for store in stores:
+                if doc_id in store:
+                    docs.append(store[doc_id])
+                    break
+        return docs
+
+
+class _UserShard:
+    """한 사용자의 일기만 담고 있는 FAISS 인덱스 (일기가 없으면 view.base는 None)"""
+
+    def __init__(self, user_id: str, path: str, vectordb: Optional[FAISS] = None, seq: int = 0):
+        self.user_id = user_id
+        self.path = path
+        self.last_access = time.monotonic()
+        # 스냅샷 파일 쓰기는 한 번에 하나만 (쓰기 락과 별개라 압축 중에도 일기 저장은 가능)
+        self.compact_lock = threading.Lock()
+        self.compacted_seq = 0
+        date_index = _DateIndex()
+        if vectordb:
+            # 한 건씩 insort하면 O(n²)이므로 모아서 한 번에 정렬
+            date_index.extend([(doc.metadata.get("date"), doc_id) for doc_id, doc in vectordb.docstore._dict.items()])
+        self.view = _ShardView(vectordb, date_index, seq)
+
+    def touch(self) -> None:
+        self.last_access = time.monotonic()
+
+    @property
+    def last_seq(self) -> int:
+        return self.view.seq
+
+    def documents(self) -> list[Document]:
+        return self.view.documents()
+
+    def documents_between(self, start_date: str, end_date: str) -> list[Document]:
+        return self.view.documents_between(start_date, end_date)
+
+    @property
+    def pending_segments(self) -> int:
+        return self.last_seq - self.compacted_seq
+
+
+class _PendingDiary:
+    """저널에 기록됐지만 아직 임베딩·색인되지 않은 일기 한 건"""
+
+    def __init__(self, doc_id: str, user_id: str, text: str, metadata: dict, queued_at: Optional[float] = None):
+        self.doc_id = doc_id
+        self.user_id = user_id
+        self.text = text
+        self.metadata = metadata
+        self.queued_at = queued_at if queued_at is not None else time.monotonic()
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"doc_id": self.doc_id, "user_id": self.user_id, "text": self.text, "metadata": self.metadata},
+            ensure_ascii=False,
+        )
+
+    def document(self) -> Document:
+        return Document(page_content=self.text, metadata=self.metadata)
 
 
 class DiaryDBManager:
-    def __init__(self, persist_path="vectorstore/diary_faiss"):
+    def __init__(self, persist_path="vectorstore/diary_faiss", max_loaded_shards: int = 128, shard_idle_seconds: int = 1800,
+                 write_behind_max_docs: int = WRITE_BEHIND_MAX_DOCS, write_behind_max_delay: float = WRITE_BEHIND_MAX_DELAY):
         self.persist_path = persist_path
-        self.embedding = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            openai_api_key=os.getenv("OPENAI_API_KEY")
+        self.shard_root = os.path.join(persist_path, SHARD_DIR_NAME)
+        self.max_loaded_shards = max_loaded_shards
+        self.shard_idle_seconds = shard_idle_seconds
+        # 같은 텍스트(재저장된 일기, 반복 질의 등)는 다시 임베딩하지 않도록 디스크 캐시로 감쌈
+        self.embedding = CachedEmbeddings(
+            OpenAIEmbeddings(
+                model=EMBEDDING_MODEL,
+                openai_api_key=os.getenv("OPENAI_API_KEY")
+            ),
+            model=EMBEDDING_MODEL,
+            cache_path=os.path.join(persist_path, EMBEDDING_CACHE_FILE),
         )
         self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-        # FAISS 데이터베이스 로드 또는 초기화
-        if os.path.exists(persist_path):
+        # 메모리에 올라와 있는 사용자 샤드 (LRU 순서: 가장 오래 안 쓴 샤드가 맨 앞)
+        self._shards: "OrderedDict[str, _UserShard]" = OrderedDict()
+        self._shards_lock = threading.Lock()
+        # 세그먼트 압축은 요청 스레드를 막지 않도록 백그라운드에서 한 번에 하나씩
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="faiss-compact")
+        self._compacting: set[str] = set()
+        # 디스크에서 불러오는 중인 샤드 (같은 사용자를 동시에 요청하면 한 번만 불러오고 나머지는 기다림)
+        self._loading: dict[str, Future] = {}
+        # 같은 사용자에 대한 쓰기(저장·반영)는 쓰기 락, 테마 카운터 조회는 읽기 락
+        # 인덱스 검색·문서 조회는 뷰를 쓰므로 이 락을 잡지 않음
+        # 락을 쓰는 중이거나 기다리는 스레드 수를 세어, 아무도 안 쓰고 샤드도 내려간 사용자의 락만 정리
+        self._user_locks: dict[str, ReadWriteLock] = {}
+        self._user_lock_refs: dict[str, int] = {}
+        # 사용자별 테마 카운터 캐시 (파일이 원본이므로 락과 함께 정리하고 필요하면 다시 읽음)
+        self._theme_stats: dict[str, dict] = {}
+        # 일기가 저장될 때 호출할 콜백 (user_id, 메타데이터 목록) → 회상 퀴즈 미리 생성 등
+        self._listeners: list[Callable[[str, list[dict]], None]] = []
+
+        # 쓰기 지연 버퍼 (doc_id → 대기 중인 일기, 들어온 순서 유지)
+        self.write_behind_max_docs = write_behind_max_docs
+        self.write_behind_max_delay = write_behind_max_delay
+        self._journal_path = os.path.join(persist_path, WRITE_BEHIND_JOURNAL_FILE)
+        self._pending: "OrderedDict[str, _PendingDiary]" = OrderedDict()
+        self._pending_lock = threading.Lock()
+        self._pending_changed = threading.Condition(self._pending_lock)
+        # 반영(임베딩 → 세그먼트 기록)은 한 번에 하나씩
+        self._flush_lock = threading.Lock()
+
+        os.makedirs(self.shard_root, exist_ok=True)
+
+        # 전역 인덱스가 남아 있으면 사용자별 샤드로 분리
+        if os.path.exists(os.path.join(persist_path, LEGACY_INDEX_FILES[0])):
+            self.migrate_global_index()
+
+        # 지난번 종료 전에 반영되지 못한 일기를 저널에서 되살림
+        self._load_journal()
+        self._flusher = threading.Thread(target=self._flush_loop, name="faiss-write-behind", daemon=True)
+        self._flusher.start()
+
+    # ──────────────────────────────────
+    # 샤드 관리
+    def _shard_path(self, user_id: str) -> str:
+        return os.path.join(self.shard_root, quote(str(user_id), safe=""))
+
+    def _load_shard(self, user_id: str) -> _UserShard:
+        """스냅샷을 불러온 뒤, 스냅샷 이후에 추가된 세그먼트를 순서대로 다시 적용합니다."""
+        path = self._shard_path(user_id)
+        vectordb = None
+        if os.path.exists(os.path.join(path, LEGACY_INDEX_FILES[0])):
             try:
-                self.vectordb = FAISS.load_local(persist_path, self.embedding, allow_dangerous_deserialization=True)
-                print(f"[FAISS 로드 완료] '{persist_path}'에서 데이터베이스를 로드했습니다.")
+                vectordb = FAISS.load_local(path, self.embedding, allow_dangerous_deserialization=True)
             except Exception as e:
-                print(f"[FAISS 로드 실패] {e}. 새로 생성합니다.")
-                self._initialize_faiss_database()
-        else:
-            print(f"[FAISS 초기화] '{persist_path}' 경로가 없습니다. 새로 생성합니다.")
-            os.makedirs(persist_path, exist_ok=True)
-            self._initialize_faiss_database()
+                print(f"[FAISS 로드 실패] user_id={user_id} / error={e}")
+
+        compacted_seq = _read_manifest(path).get("compacted_seq", 0)
+        last_seq = compacted_seq
+        for seq in _list_segments(path):
+            last_seq = max(last_seq, seq)
+            if seq <= compacted_seq:
+                continue
+            try:
+                vectordb = self._replay_segment(vectordb, path, seq)
+            except Exception as e:
+                print(f"[세그먼트 복원 실패] user_id={user_id} / seq={seq} / error={e}")
+
+        shard = _UserShard(str(user_id), path, vectordb, seq=last_seq)
+        shard.compacted_seq = compacted_seq
+        return shard
+
+    def _replay_segment(self, vectordb: Optional[FAISS], shard_path: str, seq: int) -> Optional[FAISS]:
+        vec_path, rec_path = _segment_paths(shard_path, seq)
+        with open(rec_path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+        vectors = np.load(vec_path)
+
+        # 압축 도중 중단되어 스냅샷에 이미 들어간 문서는 건너뜀
+        existing = vectordb.docstore._dict if vectordb else {}
+        rows = [
+            (doc_id, text, meta, vector.tolist())
+            for doc_id, text, meta, vector in zip(record["ids"], record["texts"], record["metadatas"], vectors)
+            if doc_id not in existing
+        ]
+        if not rows:
+            return vectordb
+        return self._add_embeddings(vectordb, rows)
+
+    def _add_embeddings(self, vectordb: Optional[FAISS], rows: list[tuple[str, str, dict, list[float]]]) -> FAISS:
+        """rows를 vectordb에 추가합니다. (vectordb가 None이면 새로 만듦, 이미 공개된 인덱스에는 호출하지 말 것)"""
+        text_embeddings = [(text, vector) for _, text, _, vector in rows]
+        metadatas = [meta for _, _, meta, _ in rows]
+        ids = [doc_id for doc_id, _, _, _ in rows]
+        if vectordb is None:
+            return FAISS.from_embeddings(text_embeddings, self.embedding, metadatas=metadatas, ids=ids)
+        vectordb.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        return vectordb
+
+    @staticmethod
+    def _clone_vectordb(vectordb: FAISS) -> FAISS:
+        """인덱스·docstore·ID 매핑을 복사한 FAISS (정규화·거리 설정 등 나머지 속성은 그대로)"""
+        clone = copy.copy(vectordb)
+        clone.index = faiss.clone_index(vectordb.index)
+        clone.docstore = InMemoryDocstore(dict(vectordb.docstore._dict))
+        clone.index_to_docstore_id = dict(vectordb.index_to_docstore_id)
+        return clone
+
+    def _with_overlay(self, base: Optional[FAISS], base_dates: _DateIndex, seq: int, overlay_rows: tuple) -> _ShardView:
+        """overlay_rows로 overlay 인덱스와 날짜 인덱스를 새로 만들어 뷰를 구성합니다. (비용은 overlay 크기에 비례)"""
+        if not overlay_rows:
+            return _ShardView(base, base_dates, seq)
+        overlay_dates = _DateIndex()
+        overlay_dates.extend([(meta.get("date"), doc_id) for doc_id, _, meta, _ in overlay_rows])
+        return _ShardView(base, base_dates, seq, overlay_rows, self._add_embeddings(None, list(overlay_rows)), overlay_dates)
+
+    def _publish(self, shard: _UserShard, rows: list[tuple[str, str, dict, list[float]]], seq: int) -> None:
+        """
+        rows를 overlay에 더한 새 뷰로 샤드의 뷰를 교체합니다. (사용자 쓰기 락을 잡은 상태에서 호출)
+        base는 복사하지 않고 그대로 함께 쓰므로, 그동안에도 검색은 이전 뷰로 계속됩니다.
+        """
+        view = shard.view
+        shard.view = self._with_overlay(view.base, view.base_dates, seq, view.overlay_rows + tuple(rows))
+
+    def _merge_overlay(self, view: _ShardView) -> tuple[Optional[FAISS], _DateIndex]:
+        """
+        overlay를 base에 합친 인덱스와 날짜 인덱스를 만듭니다. (압축 때 백그라운드에서 호출)
+        공개된 base는 검색 중일 수 있으므로 복사본에 합치며, 여기서만 전체 크기(N)만큼 복사합니다.
+        """
+        if not view.overlay_rows:
+            return view.base, view.base_dates
+        rows = list(view.overlay_rows)
+        merged = self._add_embeddings(self._clone_vectordb(view.base) if view.base else None, rows)
+        dates = view.base_dates.copy()
+        dates.extend([(meta.get("date"), doc_id) for doc_id, _, meta, _ in rows])
+        return merged, dates
+
+    def _append_segment(self, shard: _UserShard, rows: list[tuple[str, str, dict, list[float]]]) -> int:
+        """
+        일기 저장 1회분을 새 세그먼트로 기록하고 세그먼트 번호를 반환합니다. (사용자 쓰기 락을 잡은 상태에서 호출)
+        기존 인덱스 크기와 무관하게 이번에 추가된 벡터와 레코드만 쓰므로 저장 비용이 일정합니다.
+        새 번호는 _publish()로 뷰를 교체할 때 함께 반영됩니다.
+        """
+        seq = shard.last_seq + 1
+        vec_path, rec_path = _segment_paths(shard.path, seq)
+        os.makedirs(os.path.dirname(vec_path), exist_ok=True)
+
+        with open(vec_path, "wb") as f:
+            np.save(f, np.asarray([vector for _, _, _, vector in rows], dtype=np.float32))
+            f.flush()
+            os.fsync(f.fileno())
+        record = {
+            "ids": [doc_id for doc_id, _, _, _ in rows],
+            "texts": [text for _, text, _, _ in rows],
+            "metadatas": [meta for _, _, meta, _ in rows],
+        }
+        # 레코드(.json)가 마지막에 원자적으로 생기므로, 중간에 죽으면 세그먼트 전체가 무시됨
+        _fsync_write(rec_path, json.dumps(record, ensure_ascii=False).encode("utf-8"))
+        return seq
+
+    def _schedule_compaction(self, shard: _UserShard) -> None:
+        if shard.pending_segments < COMPACT_SEGMENT_THRESHOLD:
+            return
+        with self._shards_lock:
+            if shard.user_id in self._compacting:
+                return
+            self._compacting.add(shard.user_id)
+        self._compactor.submit(self._compact_shard, shard)
+
+    def _compact_shard(self, shard: _UserShard) -> None:
+        """
+        overlay를 base에 합친 인덱스를 스냅샷으로 저장하고, 반영된 세그먼트를 지운 뒤 합친 인덱스를 새 base로 씁니다.
+        합치기·직렬화는 락 없이 하므로 그동안에도 일기 저장과 검색이 가능하고,
+        마지막에 뷰를 바꿔 끼울 때만 잠깐 사용자 쓰기 락을 잡습니다.
+        """
+        try:
+            with shard.compact_lock:
+                view = shard.view
+                if view.base is None and not view.overlay_rows:
+                    return
+                seq = view.seq
+                # 내려간 뒤 다시 불러온 샤드가 이미 더 새 스냅샷을 썼다면, 옛 샤드 객체의 뷰로 덮어쓰지 않음
+                # (같은 번호는 덮어씀 — bulk_add_embeddings는 세그먼트 번호를 올리지 않고 스냅샷으로 저장)
+                if _read_manifest(shard.path).get("compacted_seq", 0) > seq:
+                    return
+                merged, merged_dates = self._merge_overlay(view)
+                index_bytes = faiss.serialize_index(merged.index).tobytes()
+                store_bytes = pickle.dumps((merged.docstore, merged.index_to_docstore_id))
+
+                # FAISS.save_local과 같은 파일 구성으로 저장해 load_local로 그대로 읽을 수 있게 함
+                _fsync_write(os.path.join(shard.path, LEGACY_INDEX_FILES[0]), index_bytes)
+                _fsync_write(os.path.join(shard.path, LEGACY_INDEX_FILES[1]), store_bytes)
+                _fsync_write(
+                    os.path.join(shard.path, MANIFEST_FILE),
+                    json.dumps({"compacted_seq": seq}).encode("utf-8"),
+                )
+                shard.compacted_seq = seq
+
+                if view.overlay_rows:
+                    # 압축하는 동안 더 반영된 일기는 overlay에 남김 (overlay는 뒤에 덧붙기만 하고, 압축은 한 번에 하나)
+                    with self._user_locked(shard.user_id):
+                        current = shard.view
+                        rest = current.overlay_rows[len(view.overlay_rows):]
+                        shard.view = self._with_overlay(merged, merged_dates, current.seq, rest)
+
+                for old_seq in _list_segments(shard.path):
+                    if old_seq > seq:
+                        continue
+                    vec_path, rec_path = _segment_paths(shard.path, old_seq)
+                    os.remove(rec_path)
+                    if os.path.exists(vec_path):
+                        os.remove(vec_path)
+            print(f"[FAISS 압축 완료] user_id={shard.user_id} / seq={seq}")
+        except Exception as e:
+            print(f"[FAISS 압축 실패] user_id={shard.user_id} / error={e}")
+        finally:
+            with self._shards_lock:
+                self._compacting.discard(shard.user_id)
+
+    def compact_all(self) -> None:
+        """대기 중인 일기를 반영하고, 메모리에 올라와 있는 모든 샤드를 즉시 압축합니다. (종료 직전 등에 사용)"""
+        self.flush()
+        # 이미 예약된 백그라운드 압축이 끝나길 기다림 (끝나기 전에 돌아가면 스냅샷을 쓰는 도중일 수 있음)
+        self._compactor.submit(lambda: None).result()
+        with self._shards_lock:
+            # 압축 중인 샤드는 내려가지 않으므로, 다시 불러오는 것과 스냅샷 쓰기가 겹치지 않음
+            # (그 사이 새로 예약된 압축이 진행 중인 샤드는 건너뜀 — 남은 세그먼트는 불러올 때 다시 적용됨)
+            shards = [shard for shard in self._shards.values()
+                      if shard.pending_segments > 0 and shard.user_id not in self._compacting]
+            self._compacting.update(shard.user_id for shard in shards)
+        for shard in shards:
+            self._compact_shard(shard)
+
+    @contextmanager
+    def _user_locked(self, user_id: str, write: bool = True) -> Iterator[None]:
+        """사용자 락을 쓰기(write=True) 또는 읽기로 잡습니다. 잡고 있는 동안 그 사용자의 샤드·락은 정리되지 않음"""
+        user_id = str(user_id)
+        with self._shards_lock:
+            lock = self._user_locks.setdefault(user_id, ReadWriteLock())
+            self._user_lock_refs[user_id] = self._user_lock_refs.get(user_id, 0) + 1
+        try:
+            with lock.write() if write else lock.read():
+                yield
+        finally:
+            with self._shards_lock:
+                self._user_lock_refs[user_id] -= 1
+                if not self._user_lock_refs[user_id]:
+                    del self._user_lock_refs[user_id]
+
+    def _evict_idle_shards(self) -> None:
+        """
+        오래 안 쓴 샤드를 메모리에서 내립니다. 쓰기·압축 중인 샤드는 건드리지 않습니다. (_shards_lock을 잡은 상태에서 호출)
+        샤드가 내려갔고 아무도 쓰지 않는 사용자의 락과 테마 카운터도 함께 정리해, 사용자 수만큼 계속 쌓이지 않게 합니다.
+        """
+        now = time.monotonic()
+        evictable = [
+            uid for uid in self._shards
+            if uid not in self._user_lock_refs and uid not in self._compacting
+        ]
+        overflow = len(self._shards) - self.max_loaded_shards
+        for uid in evictable:
+            if now - self._shards[uid].last_access > self.shard_idle_seconds or overflow > 0:
+                del self._shards[uid]
+                overflow -= 1
+
+        idle = [
+            uid for uid in set(self._user_locks) | set(self._theme_stats)
+            if uid not in self._shards and uid not in self._user_lock_refs and uid not in self._loading
+        ]
+        for uid in idle:
+            self._user_locks.pop(uid, None)
+            self._theme_stats.pop(uid, None)
+
+    def _get_shard(self, user_id: str) -> _UserShard:
+        """
+        사용자 샤드를 반환합니다. 메모리에 없으면 디스크에서 불러옵니다.
+        불러오기(디스크 읽기)는 전역 락 밖에서 하므로 다른 사용자의 검색·저장을 막지 않고,
+        같은 사용자를 동시에 요청한 스레드는 먼저 시작한 불러오기를 기다립니다.
+        """
+        user_id = str(user_id)
+        with self._shards_lock:
+            shard = self._shards.get(user_id)
+            if shard is not None:
+                self._shards.move_to_end(user_id)
+                shard.touch()
+                self._evict_idle_shards()
+                return shard
+            future = self._loading.get(user_id)
+            loader = future is None
+            if loader:
+                future = self._loading[user_id] = Future()
+        if not loader:
+            return future.result()
+
+        try:
+            shard = self._load_shard(user_id)
+        except BaseException as e:
+            with self._shards_lock:
+                del self._loading[user_id]
+            future.set_exception(e)
+            raise
+        with self._shards_lock:
+            self._shards[user_id] = shard
+            del self._loading[user_id]
+            shard.touch()
+            self._evict_idle_shards()
+        future.set_result(shard)
+        return shard
+
+    def warm_up(self, max_shards: int = 8) -> list[str]:
+        """
+        최근에 기록이 바뀐 사용자 샤드를 미리 메모리에 올려, 첫 요청이 인덱스 로드 비용을 내지 않게 합니다.
+        불러온 user_id 목록을 반환합니다.
+        """
+        def last_modified(name: str) -> float:
+            path = os.path.join(self.shard_root, name)
+            segments = os.path.join(path, SEGMENT_DIR_NAME)
+            return max(os.path.getmtime(path), os.path.getmtime(segments) if os.path.isdir(segments) else 0)
+
+        names = [name for name in os.listdir(self.shard_root) if os.path.isdir(os.path.join(self.shard_root, name))]
+        recent = sorted(names, key=last_modified, reverse=True)[:min(max_shards, self.max_loaded_shards)]
+        loaded = []
+        for name in recent:
+            user_id = unquote(name)
+            shard = self._get_shard(user_id)
+            base = shard.view.base
+            if base is not None and base.index.ntotal:
+                # 인덱스 메모리를 실제로 한 번 읽어 둠
+                base.index.reconstruct(0)
+            loaded.append(user_id)
+        # 임베딩 캐시(SQLite) 연결도 미리 사용
+        self.embedding.stats()
+        return loaded
 
-    def _initialize_faiss_database(self):
-        # 기본 텍스트를 사용하여 FAISS 데이터베이스 생성
-        default_texts = ["기본 텍스트입니다. 데이터베이스를 초기화합니다."]
-        self.vectordb = FAISS.from_texts(default_texts, self.embedding)
-        self.vectordb.save_local(self.persist_path)
-        print(f"[FAISS 저장 완료] '{self.persist_path}'에 새 데이터베이스를 생성했습니다.")
+    def migrate_global_index(self) -> dict:
+        """
+        기존 전역 인덱스(persist_path/index.faiss)를 사용자별 샤드로 분리합니다.
+        임베딩은 다시 계산하지 않고 FAISS 인덱스에 저장된 벡터를 그대로 옮기며,
+        분리가 끝난 전역 인덱스는 legacy_global/ 로 옮겨 다시 실행되지 않도록 합니다.
+        user_id가 없어 옮기지 못한 문서 수는 skipped로 알려 주고, 모든 문서를 건너뛰었으면
+        잘못된 인덱스일 수 있으므로 전역 인덱스를 그대로 둡니다.
+        반환값: {"migrated": {user_id: 일기 수}, "skipped": 건너뛴 문서 수}
+        """
+        legacy = FAISS.load_local(self.persist_path, self.embedding, allow_dangerous_deserialization=True)
+
+        grouped: dict[str, list[tuple[str, Document, list[float]]]] = {}
+        skipped = 0
+        for pos, doc_id in legacy.index_to_docstore_id.items():
+            doc = legacy.docstore.search(doc_id)
+            user_id = doc.metadata.get("user_id") if isinstance(doc, Document) else None
+            if not user_id:  # 초기화용 기본 텍스트 등
+                skipped += 1
+                continue
+            vector = legacy.index.reconstruct(int(pos)).tolist()
+            grouped.setdefault(str(user_id), []).append((doc_id, doc, vector))
+
+        migrated = {}
+        for user_id, rows in grouped.items():
+            shard_db = FAISS.from_embeddings(
+                [(doc.page_content, vector) for _, doc, vector in rows],
+                self.embedding,
+                metadatas=[doc.metadata for _, doc, _ in rows],
+                ids=[doc_id for doc_id, _, _ in rows],
+            )
+            shard_db.save_local(self._shard_path(user_id))
+            migrated[user_id] = len(rows)
+
+        if skipped:
+            print(f"[FAISS 마이그레이션 경고] user_id가 없는 문서 {skipped}개는 샤드로 옮기지 않았습니다.")
+        if skipped and not migrated:
+            print(f"[FAISS 마이그레이션 중단] 옮길 수 있는 일기가 없어 전역 인덱스를 그대로 둡니다. / path={self.persist_path}")
+            return {"migrated": migrated, "skipped": skipped}
+
+        legacy_dir = os.path.join(self.persist_path, LEGACY_DIR_NAME)
+        os.makedirs(legacy_dir, exist_ok=True)
+        for name in LEGACY_INDEX_FILES:
+            src = os.path.join(self.persist_path, name)
+            if os.path.exists(src):
+                shutil.move(src, os.path.join(legacy_dir, name))
+
+        print(f"[FAISS 마이그레이션 완료] 사용자 {len(migrated)}명, 일기 {sum(migrated.values())}개를 샤드로 분리했습니다. (건너뜀 {skipped}개)")
+        return {"migrated": migrated, "skipped": skipped}
+
+    # ──────────────────────────────────
+    # 저장 알림
+    def add_listener(self, callback: Callable[[str, list[dict]], None]) -> None:
+        """일기가 저장된 뒤 callback(user_id, metadata_list)를 호출하도록 등록합니다."""
+        self._listeners.append(callback)
+
+    def _notify_saved(self, user_id: str, metadata_list: list[dict]) -> None:
+        for callback in self._listeners:
+            try:
+                callback(user_id, metadata_list)
+            except Exception as e:
+                print(f"[저장 알림 실패] user_id={user_id} / error={e}")
 
+    # ──────────────────────────────────
+    # 인덱스 갱신 및 검색
     def create_or_update_index(self, user_id: str, diary_texts: list[str], metadata_list: list[dict]):
-        docs = []
+        """
+        일기를 쓰기 지연 버퍼에 넣습니다. 저널에 fsync로 기록한 뒤 바로 반환하므로 임베딩을 기다리지 않고,
+        조회(기간·전체 목록)에는 즉시 보이며, 임베딩과 색인 반영은 다른 사용자 일기와 모아서 한 번에 합니다.
+        """
+        user_id = str(user_id)
+        entries = []
         for text, meta in zip(diary_texts, metadata_list):
             meta["user_id"] = user_id  # 사용자 ID 포함
-            docs.append(Document(page_content=text, metadata=meta))
+            entries.append(_PendingDiary(uuid.uuid4().hex, user_id, text, meta))
 
-        new_db = FAISS.from_documents(docs, self.embedding)
+        with self._user_locked(user_id):
+            with self._pending_changed:
+                # 저널에 먼저 남겨야 반영 전에 서버가 죽어도 일기가 사라지지 않음
+                with open(self._journal_path, "a", encoding="utf-8") as f:
+                    f.write("".join(entry.to_json() + "\n" for entry in entries))
+                    f.flush()
+                    os.fsync(f.fileno())
+                for entry in entries:
+                    self._pending[entry.doc_id] = entry
+                self._pending_changed.notify_all()
+            self._record_themes(user_id, [entry.metadata for entry in entries])
 
-        if self.vectordb:
-            self.vectordb.merge_from(new_db)
-        else:
-            self.vectordb = new_db
+        self._notify_saved(user_id, [entry.metadata for entry in entries])
+
+    # ──────────────────────────────────
+    # 쓰기 지연 버퍼
+    def _load_journal(self) -> None:
+        try:
+            with open(self._journal_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 기록 도중 끊긴 마지막 줄
+            entry = _PendingDiary(record["doc_id"], record["user_id"], record["text"], record["metadata"])
+            self._pending[entry.doc_id] = entry
+        if self._pending:
+            print(f"[쓰기 지연 복구] 반영되지 않은 일기 {len(self._pending)}개를 다시 색인합니다.")
+
+    def _rewrite_journal(self) -> None:
+        """반영된 일기를 저널에서 지웁니다. (_pending_lock을 잡은 상태에서 호출)"""
+        _fsync_write(self._journal_path, "".join(entry.to_json() + "\n" for entry in self._pending.values()).encode("utf-8"))
+
+    def _pending_entries(self, user_id: str) -> list[_PendingDiary]:
+        with self._pending_lock:
+            return [e for e in self._pending.values() if e.user_id == user_id]
+
+    @staticmethod
+    def _pending_documents(entries: list[_PendingDiary], view: _ShardView, start_date: Optional[str] = None,
+                           end_date: Optional[str] = None) -> list[Document]:
+        """
+        대기 중이던 일기 중 view에 아직 들어 있지 않은 것 (날짜 범위가 있으면 그 구간만)
+        반영은 '뷰 교체 → 대기 목록에서 삭제' 순서이므로, entries를 view보다 먼저 읽어야 반영 도중에도 빠지지 않음
+        """
+        entries = [e for e in entries if not view.has(e.doc_id)]
+        if start_date is not None or end_date is not None:
+            start_date, end_date = start_date or MIN_DATE, end_date or MAX_DATE
+            entries = [e for e in entries if e.metadata.get("date") and start_date <= e.metadata["date"] <= end_date]
+        return [entry.document() for entry in entries]
+
+    def pending_count(self, user_id: Optional[str] = None) -> int:
+        with self._pending_lock:
+            if user_id is None:
+                return len(self._pending)
+            return sum(1 for e in self._pending.values() if e.user_id == str(user_id))
+
+    def flush(self, user_id: Optional[str] = None) -> int:
+        """
+        대기 중인 일기(user_id를 주면 그 사용자 것만)를 한 번의 임베딩 호출로 벡터화해 샤드에 반영합니다.
+        반영한 일기 수를 반환합니다. 임베딩이 실패하면 버퍼에 그대로 남아 다음 반영 때 다시 시도합니다.
+        """
+        with self._flush_lock:
+            with self._pending_lock:
+                entries = [e for e in self._pending.values() if user_id is None or e.user_id == str(user_id)]
+            if not entries:
+                return 0
+
+            started = time.perf_counter()
+            vectors = self.embedding.embed_documents([entry.text for entry in entries])
 
-        self.vectordb.save_local(self.persist_path)
+            by_user: dict[str, list[tuple[str, str, dict, list[float]]]] = {}
+            for entry, vector in zip(entries, vectors):
+                by_user.setdefault(entry.user_id, []).append((entry.doc_id, entry.text, entry.metadata, vector))
 
+            for uid, rows in by_user.items():
+                with self._user_locked(uid):
+                    # 락을 잡은 뒤 샤드를 가져와야 쓰는 도중 샤드가 내려가지 않음
+                    shard = self._get_shard(uid)
+                    # 저널 정리 전에 죽어 다시 올라온 일기는 이미 들어 있으므로 건너뜀
+                    view = shard.view
+                    rows = [row for row in rows if not view.has(row[0])]
+                    if rows:
+                        # 디스크에 세그먼트가 먼저 기록된 뒤에 새 뷰로 교체
+                        self._publish(shard, rows, self._append_segment(shard, rows))
+                    # 락을 놓기 전에 압축 대상으로 올려야, 그 사이 샤드가 내려가 다시 불러오는 중에 압축이 겹치지 않음
+                    self._schedule_compaction(shard)
+
+            with self._pending_lock:
+                for entry in entries:
+                    self._pending.pop(entry.doc_id, None)
+                self._rewrite_journal()
+
+        print(f"[쓰기 지연 반영] 일기 {len(entries)}개 / 사용자 {len(by_user)}명 / {(time.perf_counter() - started) * 1000:.0f}ms")
+        return len(entries)
+
+    def _flush_loop(self) -> None:
+        """버퍼가 max_docs만큼 차거나 가장 오래된 일기가 max_delay초를 기다렸으면 반영합니다."""
+        while True:
+            with self._pending_changed:
+                while True:
+                    if len(self._pending) >= self.write_behind_max_docs:
+                        break
+                    if self._pending:
+                        oldest = next(iter(self._pending.values())).queued_at
+                        remaining = oldest + self.write_behind_max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._pending_changed.wait(remaining)
+                    else:
+                        self._pending_changed.wait()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[쓰기 지연 반영 실패] error={e}")
+                time.sleep(self.write_behind_max_delay)
+
+    def bulk_add_embeddings(self, user_id: str, rows: list[tuple[str, str, dict, list[float]]]) -> int:
+        """
+        이미 임베딩된 일기 (doc_id, 본문, 메타데이터, 벡터) 목록을 사용자 샤드에 한 번에 추가하고
+        바로 스냅샷으로 저장합니다. 이미 들어 있는 doc_id는 건너뛰므로 여러 번 실행해도 안전합니다.
+        """
+        with self._user_locked(user_id):
+            shard = self._get_shard(user_id)
+            view = shard.view
+            new_rows = [
+                (doc_id, text, {**meta, "user_id": user_id}, vector)
+                for doc_id, text, meta, vector in rows
+                if not view.has(doc_id)
+            ]
+            if not new_rows:
+                return 0
+            # 세그먼트 없이 바로 스냅샷으로 저장하므로 세그먼트 번호는 그대로
+            self._publish(shard, new_rows, shard.last_seq)
+            self._record_themes(user_id, [meta for _, _, meta, _ in new_rows])
+            with self._shards_lock:
+                self._compacting.add(shard.user_id)
+        self._compact_shard(shard)
+        self._notify_saved(user_id, [meta for _, _, meta, _ in new_rows])
+        return len(new_rows)
+
+
+    # ──────────────────────────────────
+    # 테마 카운터
+    def _load_theme_stats(self, user_id: str) -> dict:
+        """사용자 락을 잡은 상태에서 호출합니다."""
+        user_id = str(user_id)
+        stats = self._theme_stats.get(user_id)
+        if stats is not None:
+            return stats
+
+        shard_path = self._shard_path(user_id)
+        try:
+            with open(os.path.join(shard_path, THEME_STATS_FILE), "r", encoding="utf-8") as f:
+                stats = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            # 카운터 도입 이전에 저장된 샤드라면 한 번만 docstore에서 다시 계산
+            stats = {}
+            if os.path.isdir(shard_path):
+                for doc in self._get_shard(user_id).documents():
+                    _bump_theme_stats(stats, doc.metadata)
+                # 테마 일기가 없어도 파일을 남겨, 캐시가 정리된 뒤 다시 읽을 때 샤드를 훑지 않게 함
+                self._write_theme_stats(user_id, stats)
+
+        self._theme_stats[user_id] = stats
+        return stats
+
+    def _write_theme_stats(self, user_id: str, stats: dict) -> None:
+        _fsync_write(
+            os.path.join(self._shard_path(user_id), THEME_STATS_FILE),
+            json.dumps(stats, ensure_ascii=False).encode("utf-8"),
+        )
+
+    def _record_themes(self, user_id: str, metadata_list: list[dict]) -> None:
+        """새로 저장된 일기의 테마를 카운터에 반영합니다. (사용자 락을 잡은 상태에서 호출)"""
+        stats = self._load_theme_stats(user_id)
+        changed = False
+        for meta in metadata_list:
+            changed = _bump_theme_stats(stats, meta) or changed
+        if changed:
+            self._write_theme_stats(user_id, stats)
+
+    def get_theme_stats(self, user_id: str) -> dict[str, dict]:
+        """
+        {테마: {"count": 회상 횟수, "last_date": 마지막 회상 날짜}}를 반환합니다.
+        일기를 저장할 때마다 갱신되는 카운터를 읽기만 하므로 벡터 DB를 건드리지 않습니다.
+        """
+        with self._user_locked(user_id, write=False):
+            stats = self._theme_stats.get(str(user_id))
+            if stats is not None:
+                return {theme: dict(entry) for theme, entry in stats.items()}
+        # 처음 읽을 때는 파일을 읽고(필요하면 다시 계산해 쓰고) 캐시에 넣으므로 쓰기 락
+        with self._user_locked(user_id):
+            return {theme: dict(entry) for theme, entry in self._load_theme_stats(user_id).items()}
+
+
+    def _embed_for_search(self, query: str, pending: list[_PendingDiary]) -> tuple[list[float], list[list[float]]]:
+        """
+        질의와 대기 중인 일기를 한 번의 호출로 임베딩합니다. 결과가 임베딩 캐시에 남으므로 나중에 반영할 때는 다시 호출하지 않음
+        대기 중인 일기 임베딩에 실패하면 질의만 임베딩하고, 그 일기들은 이번 검색에서 빠집니다.
+        """
+        if pending:
+            try:
+                vectors = self.embedding.embed_documents([query] + [entry.text for entry in pending])
+                return vectors[0], vectors[1:]
+            except Exception as e:
+                print(f"[대기 일기 임베딩 실패] 색인된 일기로만 검색합니다. / error={e}")
+        return self.embedding.embed_query(query), []
 
     def search(self, user_id: str, kw_list: list[str], query: str, top_k=3, score_threshold=2.0, min_match: int = 1):
-        results = self.vectordb.similarity_search_with_score(query, k=top_k * 10)
+        # 검색하는 동안 저장이 일어나도 섞이지 않도록 지금 뷰의 인덱스(base + overlay)만 사용
+        # 대기 중인 일기는 반영(전역 반영 락 + 임베딩)을 기다리지 않고 따로 점수를 매김 (뷰보다 먼저 읽어야 반영 도중에도 빠지지 않음)
+        shard = self._get_shard(user_id)
+        pending = self._pending_entries(shard.user_id)
+        view = shard.view
+        pending = [entry for entry in pending if not view.has(entry.doc_id)]
+        stores = view.stores()
+        if not stores and not pending:
+            return []
+
+        query_vector, pending_vectors = self._embed_for_search(query, pending)
+        if pending_vectors:
+            rows = [(entry.doc_id, entry.text, entry.metadata, vector) for entry, vector in zip(pending, pending_vectors)]
+            stores.append(self._add_embeddings(None, rows))
+        results = sorted(
+            (hit for db in stores for hit in db.similarity_search_with_score_by_vector(query_vector, k=top_k * 10)),
+            key=lambda hit: hit[1],
+        )[:top_k * 10]
         seen_texts = set()
         filtered_docs = []
 
@@ -65,17 +913,17 @@ class DiaryDBManager:
             return len(matched), matched
 
         for doc, score in results:
-            if doc.metadata.get("user_id") != user_id:  # 유저 필터
-                continue
-
             doc_text = doc.page_content.strip()
             if doc_text in seen_texts or score > score_threshold:
                 continue
 
             match_count, matched_keywords = keyword_match_info(doc)
             if match_count >= min_match:
-                doc.metadata["match_count"] = match_count
-                doc.metadata["matched_keywords"] = matched_keywords
+                # docstore의 문서는 다른 검색과 공유되므로 복사본에 매칭 정보를 기록
+                doc = Document(
+                    page_content=doc.page_content,
+                    metadata={**doc.metadata, "match_count": match_count, "matched_keywords": matched_keywords},
+                )
                 filtered_docs.append((doc, score))
                 seen_texts.add(doc_text)
 
@@ -86,42 +934,79 @@ class DiaryDBManager:
 
         return [doc for doc, _ in re_ranked[:top_k]]
 
-    
+
+    def iter_user_diaries(self, user_id: str, theme: Optional[str] = None, diary_type: Optional[str] = None,
+                          start_date: Optional[str] = None, end_date: Optional[str] = None) -> Iterator[Document]:
+        """
+        사용자의 일기를 docstore에서 바로 꺼내 하나씩 돌려줍니다. (임베딩 호출·개수 제한 없음)
+        theme, diary_type('daily' / 'theme' / ...), 날짜 범위('YYYY-MM-DD', 양 끝 포함)로 거를 수 있고,
+        날짜 범위가 있으면 날짜 인덱스로 해당 구간만 읽습니다.
+        """
+        shard = self._get_shard(user_id)
+        pending = self._pending_entries(shard.user_id)
+        view = shard.view
+        if start_date or end_date:
+            docs = view.documents_between(start_date or MIN_DATE, end_date or MAX_DATE)
+        else:
+            docs = view.documents()
+        # 아직 색인되지 않은 일기도 바로 보이도록 함께 돌려줌
+        docs += self._pending_documents(pending, view, start_date, end_date)
+
+        for doc in docs:
+            if theme is not None and (doc.metadata.get("theme") or "").strip() != theme:
+                continue
+            if diary_type is not None and diary_type_of(doc.metadata) != diary_type:
+                continue
+            yield doc
+
+    def list_user_diaries(self, user_id: str, offset: int = 0, limit: int = 50, **filters) -> tuple[list[Document], Optional[int]]:
+        """
+        iter_user_diaries의 페이지 단위 버전.
+        (이번 페이지 문서들, 다음 페이지 offset 또는 마지막 페이지면 None)을 반환합니다.
+        """
+        page = []
+        for idx, doc in enumerate(self.iter_user_diaries(user_id, **filters)):
+            if idx < offset:
+                continue
+            if len(page) == limit:
+                return page, idx
+            page.append(doc)
+        return page, None
+
+
     def search_all_diaries(self, user_id: str) -> list[Document]:
         """
         주어진 user_id에 해당하는 모든 일기 문서를 반환합니다.
         """
         try:
-            all_docs = self.vectordb.similarity_search(query="", k=1000)  # 일단 다 가져오기
-            user_docs = [doc for doc in all_docs if doc.metadata.get("user_id") == user_id]
-            return user_docs
+            return list(self.iter_user_diaries(user_id))
         except Exception as e:
             print(f"[ERROR] search_all_diaries 실패: {e}")
             return []
 
 
-    def get_diary_7days_by_date(self, user_id: str, date: str) -> list[Document]:
-        if not self.vectordb:
-            return []
+    def get_diaries_by_date_range(self, user_id: str, start_date: str, end_date: str) -> list[Document]:
+        """start_date ~ end_date('YYYY-MM-DD', 양 끝 포함) 사이에 작성된 사용자의 일기를 날짜순으로 반환합니다."""
+        # 형식이 잘못된 날짜는 여기서 ValueError로 알림
+        datetime.strptime(start_date, DATE_FORMAT)
+        datetime.strptime(end_date, DATE_FORMAT)
+        shard = self._get_shard(user_id)
+        pending = self._pending_entries(shard.user_id)
+        view = shard.view
+        docs = view.documents_between(start_date, end_date) + self._pending_documents(pending, view, start_date, end_date)
+        return sorted(docs, key=lambda doc: doc.metadata.get("date", ""))
 
-        reference_date = datetime.strptime(date, "%Y-%m-%d")
-        start_date = reference_date - timedelta(days=6)
-        results = []
 
-        for doc in self.vectordb.docstore._dict.values():
-            if doc.metadata.get("user_id") != user_id and doc.metadata.get('daily_diary') == "daily_diary":
-                continue
-
-            diary_date_str = doc.metadata.get("date")
-            if not diary_date_str:
-                continue
+    def get_diary_7days_by_date(self, user_id: str, date: str, days: int = 7) -> list[Document]:
+        reference_date = datetime.strptime(date, DATE_FORMAT)
+        start_date = reference_date - timedelta(days=days - 1)
+        return self.get_diaries_by_date_range(
+            user_id,
+            start_date.strftime(DATE_FORMAT),
+            reference_date.strftime(DATE_FORMAT),
+        )
 
-            try:
-                diary_date = datetime.strptime(diary_date_str, "%Y-%m-%d")
-                if start_date <= diary_date <= reference_date:
-                    results.append(doc)
-            except ValueError:
-                continue
 
-        return results
-    
\ No newline at end of file
+if __name__ == "__main__":
+    # 전역 인덱스를 사용자별 샤드로 분리 (이미 분리된 경우 아무 작업도 하지 않음)
+    DiaryDBManager(persist_path="vectorstore/diary_faiss")
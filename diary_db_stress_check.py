@@ -0,0 +1,232 @@
+"""
+DiaryDBManager 동시성 점검 스크립트. (OpenAI 호출 없이 가짜 임베딩으로 실행)
+
+    python diary_db_stress_check.py --seconds 10 --readers 8 --writers 4
+    python diary_db_stress_check.py --users 12 --max-loaded-shards 2   # 샤드 내리기·다시 불러오기까지 섞어서
+    python diary_db_stress_check.py --users 1 --preload 20000 --dim 1536   # 큰 샤드에서 반영 비용 측정
+
+임시 디렉토리에 매니저를 만들고, 여러 스레드가 동시에 일기를 저장(쓰기 지연 반영·세그먼트 압축 포함)하는 동안
+다른 스레드들이 검색·기간 조회·전체 조회를 반복합니다. 다음을 확인하고 하나라도 어긋나면 종료 코드 1로 끝납니다.
+- 어떤 스레드에서도 예외가 나지 않을 것
+- 조회 결과가 다른 사용자의 일기를 섞거나, 같은 사용자에게서 이미 보였던 일기 수보다 줄어들지 않을 것
+- 기간 조회 결과가 날짜순일 것
+- 방금 저장한(아직 반영 전일 수 있는) 일기가 바로 검색될 것, 검색이 다른 반영을 기다리지 않을 것
+- 끝난 뒤 디스크에서 다시 불러온 샤드에 저장한 일기가 빠짐없이, 중복 없이 들어 있을 것
+"""
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+# 매니저가 만드는 OpenAI 클라이언트는 키가 없으면 생성이 실패하므로 자리 표시용 키를 넣어 둠 (실제 호출은 하지 않음)
+os.environ.setdefault("OPENAI_API_KEY", "stress-check")
+
+from langchain_core.embeddings import Embeddings
+import diary_db_management
+from diary_db_management import DATE_FORMAT, DiaryDBManager
+
+
+class FakeEmbeddings(Embeddings):
+    """텍스트 해시로 만든 고정 벡터. 호출마다 약간 지연해 실제 API 호출처럼 스레드가 겹치게 함"""
+
+    def __init__(self, dim: int = 64, delay: float = 0.002):
+        self.dim = dim
+        self.delay = delay
+
+    def _vector(self, text: str) -> list[float]:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [(digest[i % len(digest)] - 128) / 128.0 for i in range(self.dim)]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.delay)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+def _percentile(values: list[float], ratio: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def _preload(manager: DiaryDBManager, user_id: str, count: int, dim: int, today: datetime) -> set[str]:
+    """이미 일기가 count개 쌓인 샤드를 만듭니다. (임베딩 대신 난수 벡터, 스냅샷으로 바로 저장)"""
+    vectors = np.random.default_rng(len(user_id)).standard_normal((count, dim), dtype=np.float32)
+    rows = [
+        (f"{user_id}-pre-{i}", f"{user_id} 지난 일기 {i}",
+         {"date": (today - timedelta(days=10 + i % 400)).strftime(DATE_FORMAT)}, vectors[i].tolist())
+        for i in range(count)
+    ]
+    manager.bulk_add_embeddings(user_id, rows)
+    return {text for _, text, _, _ in rows}
+
+
+def run(users: int, writers: int, readers: int, seconds: float, dim: int, max_loaded_shards: int = 128,
+        preload: int = 0) -> bool:
+    workdir = tempfile.mkdtemp(prefix="diary_stress_")
+    # 짧은 시간 안에 압축도 여러 번 일어나도록 임계값을 낮춤
+    diary_db_management.COMPACT_SEGMENT_THRESHOLD = 4
+    manager = DiaryDBManager(persist_path=workdir, max_loaded_shards=max_loaded_shards,
+                             write_behind_max_docs=8, write_behind_max_delay=0.05)
+    manager.embedding.underlying = FakeEmbeddings(dim)
+
+    user_ids = [f"stress_{i}" for i in range(users)]
+    today = datetime.today()
+    written: dict[str, set[str]] = {uid: set() for uid in user_ids}
+    if preload:
+        started = time.perf_counter()
+        for uid in user_ids:
+            written[uid] |= _preload(manager, uid, preload, dim, today)
+        print(f"[사전 적재] 사용자당 일기 {preload}개 / {time.perf_counter() - started:.1f}초")
+    written_lock = threading.Lock()
+    errors: list[str] = []
+    search_ms: list[float] = []
+    flush_ms: list[float] = []
+    counts = {"saves": 0, "searches": 0, "range_reads": 0, "full_reads": 0}
+    counts_lock = threading.Lock()
+    stop = threading.Event()
+
+    def record_error(message: str) -> None:
+        with counts_lock:
+            errors.append(message)
+        stop.set()
+
+    def writer(worker: int) -> None:
+        rng = random.Random(worker)
+        seq = 0
+        try:
+            while not stop.is_set():
+                uid = rng.choice(user_ids)
+                seq += 1
+                text = f"{uid} 일기 w{worker}-{seq} 시장 산책 친구"
+                date = (today - timedelta(days=rng.randrange(10))).strftime(DATE_FORMAT)
+                manager.create_or_update_index(uid, [text], [{"date": date, "theme": rng.choice(["음식", "여행"])}])
+                with written_lock:
+                    written[uid].add(text)
+                with counts_lock:
+                    counts["saves"] += 1
+                if seq % 7 == 0:
+                    found = manager.search(uid, [f"w{worker}-{seq}"], text, score_threshold=1e9)
+                    if text not in [doc.page_content for doc in found]:
+                        record_error(f"writer {worker}: 방금 저장한 일기가 검색되지 않음 ({text})")
+                if seq % 5 == 0:
+                    started = time.perf_counter()
+                    if manager.flush(uid):
+                        with counts_lock:
+                            flush_ms.append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            record_error(f"writer {worker}: {e!r}")
+
+    def reader(worker: int) -> None:
+        rng = random.Random(1000 + worker)
+        seen = {uid: 0 for uid in user_ids}
+        try:
+            while not stop.is_set():
+                uid = rng.choice(user_ids)
+                action = rng.random()
+                if action < 0.4:
+                    started = time.perf_counter()
+                    docs = manager.search(uid, ["시장", "산책"], "시장 산책", score_threshold=1e9)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with counts_lock:
+                        counts["searches"] += 1
+                        search_ms.append(elapsed)
+                elif action < 0.7:
+                    docs = manager.get_diary_7days_by_date(uid, today.strftime(DATE_FORMAT))
+                    dates = [doc.metadata.get("date", "") for doc in docs]
+                    if dates != sorted(dates):
+                        record_error(f"reader {worker}: 기간 조회 결과가 날짜순이 아님 ({uid})")
+                    with counts_lock:
+                        counts["range_reads"] += 1
+                else:
+                    docs = manager.search_all_diaries(uid)
+                    if len(docs) < seen[uid]:
+                        record_error(f"reader {worker}: {uid} 일기 수가 {seen[uid]} → {len(docs)}로 줄어듦")
+                    seen[uid] = max(seen[uid], len(docs))
+                    with counts_lock:
+                        counts["full_reads"] += 1
+
+                foreign = [doc.page_content for doc in docs if not doc.page_content.startswith(f"{uid} ")]
+                if foreign:
+                    record_error(f"reader {worker}: {uid} 조회에 다른 사용자 일기가 섞임 {foreign[:1]}")
+        except Exception as e:
+            record_error(f"reader {worker}: {e!r}")
+
+    # 다른 스레드가 반영 중(반영 락을 쥔 상태)이어도 대기 중인 일기까지 검색돼야 함
+    manager.create_or_update_index(user_ids[0], [f"{user_ids[0]} 반영 전 일기 시장"], [{"date": today.strftime(DATE_FORMAT)}])
+    written[user_ids[0]].add(f"{user_ids[0]} 반영 전 일기 시장")
+    with manager._flush_lock:
+        probe = threading.Thread(target=lambda: search_ms.append(
+            len(manager.search(user_ids[0], ["반영"], "반영 전 일기", score_threshold=1e9))))
+        probe.start()
+        probe.join(timeout=5)
+        if probe.is_alive() or search_ms != [1]:
+            errors.append(f"반영 락을 쥔 동안 검색이 끝나지 않았거나 대기 중인 일기를 못 찾음 ({search_ms})")
+    probe.join()
+    search_ms.clear()
+
+    threads = [threading.Thread(target=writer, args=(i,), name=f"writer-{i}") for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,), name=f"reader-{i}") for i in range(readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # 남은 일기를 반영·압축한 뒤 디스크에서 새로 불러와 대조
+    manager.flush()
+    manager.compact_all()
+    # 쓰는 스레드가 모두 끝났으면 사용자 락·테마 카운터는 메모리에 올라온 샤드 수만큼만 남아 있어야 함
+    manager._get_shard(user_ids[0])
+    with manager._shards_lock:
+        loaded, locks, stats = len(manager._shards), len(manager._user_locks), len(manager._theme_stats)
+    if locks > loaded or stats > loaded:
+        errors.append(f"샤드 {loaded}개가 올라와 있는데 사용자 락 {locks}개, 테마 카운터 {stats}개가 남아 있음")
+    reloaded = DiaryDBManager(persist_path=workdir)
+    for uid in user_ids:
+        texts = [doc.page_content for doc in reloaded.search_all_diaries(uid)]
+        if len(texts) != len(set(texts)):
+            errors.append(f"{uid}: 다시 불러온 샤드에 중복 일기 {len(texts) - len(set(texts))}개")
+        missing = written[uid] - set(texts)
+        if missing:
+            errors.append(f"{uid}: 다시 불러온 샤드에 일기 {len(missing)}개가 없음")
+
+    print(f"[스트레스 점검] {elapsed:.1f}초 / 쓰기 {writers}개 · 읽기 {readers}개 스레드 / {counts}")
+    print(f"[검색 지연] p50={_percentile(search_ms, 0.5):.1f}ms "
+          f"p95={_percentile(search_ms, 0.95):.1f}ms max={max(search_ms, default=0.0):.1f}ms")
+    print(f"[반영 지연] p50={_percentile(flush_ms, 0.5):.1f}ms "
+          f"p95={_percentile(flush_ms, 0.95):.1f}ms max={max(flush_ms, default=0.0):.1f}ms")
+    print(f"[저장된 일기] {sum(len(texts) for texts in written.values())}개 / 사용자 {users}명")
+    for message in errors:
+        print(f"[점검 실패] {message}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    return not errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DiaryDBManager 동시 검색·저장 점검")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--max-loaded-shards", type=int, default=128)
+    parser.add_argument("--preload", type=int, default=0, help="시작 전에 사용자마다 미리 넣어 둘 일기 수")
+    args = parser.parse_args()
+
+    ok = run(args.users, args.writers, args.readers, args.seconds, args.dim, args.max_loaded_shards, args.preload)
+    print("✅ 통과" if ok else "❌ 실패")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,232 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+DIARY_JOB_DB_PATH = os.getenv("DIARY_JOB_DB_PATH", "diary/diary_jobs.sqlite3")
+DIARY_JOB_WORKERS = int(os.getenv("DIARY_JOB_WORKERS", "2"))
+# 실패한 작업을 몇 번까지 다시 시도할지
+DIARY_JOB_MAX_ATTEMPTS = 3
+# 실패한 작업을 다시 시도하기 전 대기 시간(초). 다시 실패할 때마다 두 배로 늘림
+DIARY_JOB_RETRY_DELAY_SECONDS = 5.0
+# 끝난 작업 기록을 며칠 동안 보관할지
+DIARY_JOB_KEEP_DAYS = 7
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class DiaryJobQueue:
+    """
+    대화 종료 후 일기 생성·색인을 백그라운드에서 처리하는 작업 큐.
+    - 작업은 SQLite 파일에 기록되므로 서버가 재시작돼도 남아 있고, 시작 시 끝나지 않은 작업을 다시 실행
+    - kind별 처리 함수는 register()로 등록 (payload dict → 결과 dict)
+    - 실패하면 retry_delay초부터 두 배씩 늘어나는 간격을 두고 max_attempts번까지 다시 시도한 뒤 failed로 남김
+    - get()으로 상태를 조회하고, wait()로 끝날 때까지(최대 timeout초) 기다릴 수 있음
+    """
+
+    def __init__(self, db_path: str = DIARY_JOB_DB_PATH, workers: int = DIARY_JOB_WORKERS,
+                 max_attempts: int = DIARY_JOB_MAX_ATTEMPTS, retry_delay: float = DIARY_JOB_RETRY_DELAY_SECONDS):
+        self.db_path = db_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._handlers: dict[str, Callable[[dict], dict]] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._threads: list[threading.Thread] = []
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS diary_jobs (
+                    job_id     TEXT PRIMARY KEY,
+                    kind       TEXT NOT NULL,
+                    user_id    TEXT NOT NULL,
+                    payload    TEXT NOT NULL,
+                    status     TEXT NOT NULL,
+                    result     TEXT,
+                    error      TEXT,
+                    attempts   INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    next_attempt_at REAL NOT NULL DEFAULT 0
+                )
+                """
+            )
+            # 재시도 대기 시간이 없던 예전 DB 파일에는 컬럼 추가
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(diary_jobs)")}
+            if "next_attempt_at" not in columns:
+                self._conn.execute("ALTER TABLE diary_jobs ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_diary_jobs_status ON diary_jobs (status, created_at)")
+            # 실행 중에 서버가 꺼진 작업은 다시 대기열로
+            recovered = self._conn.execute(
+                "UPDATE diary_jobs SET status = ?, updated_at = ? WHERE status = ?", (QUEUED, time.time(), RUNNING)
+            ).rowcount
+            self._conn.execute(
+                "DELETE FROM diary_jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - DIARY_JOB_KEEP_DAYS * 86400),
+            )
+        if recovered:
+            print(f"[일기 작업 복구] 중단된 작업 {recovered}건을 다시 실행합니다.")
+
+    def register(self, kind: str, handler: Callable[[dict], dict]) -> None:
+        self._handlers[kind] = handler
+
+    def start(self) -> None:
+        """작업자 스레드를 시작합니다. (처리 함수를 모두 등록한 뒤 호출)"""
+        for idx in range(self.workers - len(self._threads)):
+            thread = threading.Thread(target=self._work, name=f"diary-job-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # ──────────────────────────────────
+    # 등록 / 조회
+    def submit(self, kind: str, user_id: str, payload: dict) -> str:
+        if kind not in self._handlers:
+            raise ValueError(f"등록되지 않은 작업 종류입니다: {kind}")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._changed:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO diary_jobs (job_id, kind, user_id, payload, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, str(user_id), json.dumps(payload, ensure_ascii=False), QUEUED, now, now),
+                )
+            self._changed.notify_all()
+        return job_id
+
+    def _row_to_job(self, row: sqlite3.Row) -> dict:
+        return {
+            "job_id": row["job_id"],
+            "kind": row["kind"],
+            "user_id": row["user_id"],
+            "status": row["status"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+        }
+
+    def _get_locked(self, job_id: str) -> Optional[dict]:
+        row = self._conn.execute("SELECT * FROM diary_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._get_locked(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """작업이 done/failed가 될 때까지 최대 timeout초 기다린 뒤 현재 상태를 반환합니다."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._get_locked(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["status"] in (DONE, FAILED) or remaining <= 0:
+                    return job
+                self._changed.wait(remaining)
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM diary_jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    # ──────────────────────────────────
+    # 실행
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """
+        실행할 때가 된 대기 작업 중 가장 오래된 것을 running으로 바꿔 가져옵니다.
+        없으면 알림이 오거나 다음 재시도 시각이 될 때까지 대기합니다.
+        """
+        with self._changed:
+            while True:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT * FROM diary_jobs WHERE status = ? AND next_attempt_at <= ? ORDER BY created_at LIMIT 1",
+                    (QUEUED, now),
+                ).fetchone()
+                if row is not None:
+                    with self._conn:
+                        self._conn.execute(
+                            "UPDATE diary_jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+                            (RUNNING, now, row["job_id"]),
+                        )
+                    return row
+                next_at = self._conn.execute(
+                    "SELECT MIN(next_attempt_at) FROM diary_jobs WHERE status = ?", (QUEUED,)
+                ).fetchone()[0]
+                self._changed.wait(5.0 if next_at is None else min(5.0, max(next_at - now, 0.01)))
+
+    def _finish(self, job_id: str, status: str, result: Optional[dict] = None, error: Optional[str] = None,
+                next_attempt_at: float = 0) -> None:
+        with self._changed:
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE diary_jobs SET status = ?, result = ?, error = ?, updated_at = ?, next_attempt_at = ? "
+                    "WHERE job_id = ?",
+                    (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                     error, time.time(), next_attempt_at, job_id),
+                )
+            self._changed.notify_all()
+
+    def _work(self) -> None:
+        while True:
+            row = self._claim()
+            job_id, kind, attempts = row["job_id"], row["kind"], row["attempts"] + 1
+            started = time.perf_counter()
+            try:
+                handler = self._handlers[kind]
+                result = handler(json.loads(row["payload"]))
+                self._finish(job_id, DONE, result=result)
+                print(f"[일기 작업 완료] {kind} / job_id={job_id} / {(time.perf_counter() - started) * 1000:.0f}ms")
+            except Exception as e:
+                if attempts >= self.max_attempts:
+                    self._finish(job_id, FAILED, error=str(e))
+                    print(f"[일기 작업 실패] {kind} / job_id={job_id} / 시도={attempts} / error={e}")
+                    continue
+                # 일시적인 장애(API 한도 등)가 풀릴 시간을 주도록 재시도 간격을 두 배씩 늘림
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                self._finish(job_id, QUEUED, error=str(e), next_attempt_at=time.time() + delay)
+                print(f"[일기 작업 실패] {kind} / job_id={job_id} / 시도={attempts} / {delay:.1f}초 뒤 재시도 / error={e}")
+
+
+if __name__ == "__main__":
+    # 임시 DB로 작업 등록 → 완료 대기 → 재시작 복구를 확인
+    import tempfile
+
+    db_path = os.path.join(tempfile.mkdtemp(), "jobs.sqlite3")
+    calls = {"flaky": 0}
+
+    def write_diary(payload: dict) -> dict:
+        time.sleep(0.2)  # 일기 생성 + 색인 흉내
+        return {"title": "테스트", "body": f"대화 {len(payload['chat_history'])}턴으로 쓴 일기"}
+
+    def flaky(payload: dict) -> dict:
+        calls["flaky"] += 1
+        if calls["flaky"] < 2:
+            raise RuntimeError("일시적인 오류")
+        return {"ok": True}
+
+    queue = DiaryJobQueue(db_path, workers=2)
+    queue.register("daily", write_diary)
+    queue.register("flaky", flaky)
+
+    # 작업자를 시작하기 전에 등록한 작업은 '재시작 전에 남은 작업'처럼 대기열에 남음
+    pending_id = queue.submit("daily", "test_user", {"chat_history": [{"role": "user", "content": "안녕"}]})
+    restarted = DiaryJobQueue(db_path, workers=2, retry_delay=0.5)
+    restarted.register("daily", write_diary)
+    restarted.register("flaky", flaky)
+    restarted.start()
+
+    flaky_id = restarted.submit("flaky", "test_user", {})
+    print("재시작 후 처리:", restarted.wait(pending_id, timeout=5))
+    started = time.monotonic()
+    print("재시도 후 처리:", restarted.wait(flaky_id, timeout=5), f"({time.monotonic() - started:.1f}초)")
+    print(restarted.stats())
@@ -0,0 +1,297 @@
+import os
+import pickle
+import random
+import re
+import threading
+from typing import Awaitable, Callable, Optional
+
+# 챗봇에게 건네는 말의 앞머리 (이제, 그럼, 오늘은 …) — 분명한 종료 표현은 문장이 이것들로만 시작할 때 인정
+# "딸이 잘 자", "이 일을 끝낼게" 같은 서술 속 표현은 제외
+ADDRESS = r"^\s*(?:(?:이제|그럼|그러면|오늘은?|자|네|응|그래요?|좋아요?|알겠어요?|여기서|우리)\s*)*"
+
+# 종료 의도가 분명한 표현 (대화를 끝내자는 말, 챗봇에게 하는 작별 인사)
+# 마지막 문장의 끝에 올 때만 인정 (_ends_sentence 참고) → "대화를 마무리하고 집에 왔어" 같은 서술은 제외
+END_PATTERNS = [
+    ADDRESS + r"(그만|여기까지)(만|은|는)?\s*(할게|하자|할래|하겠|합시다|해요)",
+    ADDRESS + r"(대화|이야기|얘기)(를|는|은)?\s*(끝|마치|마무리|그만)",
+    ADDRESS + r"(끝낼게|끝내자|끝낼래|마칠게|마치자|마칠래|마무리\s*할게|마무리\s*하자|마무리\s*합시다)",
+    r"안녕히\s*(계세요|계십시오|주무세요|가세요)",
+    ADDRESS + r"잘\s*(있어요|자요|주무세요)",
+    ADDRESS + r"(다음에|내일|나중에)\s*(또\s*)?(봐|봬|뵐게|얘기해요|얘기하자|얘기할게|이야기해요|이야기하자|이야기할게|만나요|만나자)",
+    ADDRESS + r"(그만|이만)\s*(갈게|줄일게|할게|들어갈게|가볼게|쉴게|잘게)",
+    ADDRESS + r"이만\s*하면\s*(됐|충분|된\s*것\s*같)",
+    ADDRESS + r"(이만\s*)?(자러|쉬러)\s*(갈게|가볼게)",
+    ADDRESS + r"(대화\s*)?종료(할게|하자|해\s*줘|해요|합시다)?",
+    r"바이바이|\bbye\b",
+]
+
+# 종료 표현 뒤에 올 수 있는 것: 같은 어절의 어미(요, 어요 …)와 문장부호·웃음 정도
+END_TAIL = re.compile(r"^\S*[\s.!?~…ㅎㅋ^]*$")
+# 여러 문장이면 마지막 문장만 봄 ("그만할게. 아 근데 하나 더 있어"는 종료가 아님)
+SENTENCE_SPLIT = re.compile(r"[.!?\n]+")
+
+# 겉보기엔 비슷하지만 종료가 아닌 서술 (그만두다, 끝나고 등)
+NARRATIVE_PATTERNS = [
+    r"그만두|그만뒀|그만둔",
+    r"끝나고|끝난\s*(뒤|후|다음)|끝나서|마치고\s*(나서|집|와서)",
+]
+
+# 더 이야기하겠다는 표현
+CONTINUE_PATTERNS = [
+    r"(아니|아뇨|아니요).*(더|계속)",
+    r"(더|계속)\s*(얘기|이야기|하고\s*싶|할래|할게|하자)",
+]
+
+# 종료를 암시하지만 단정하기 어려운 표현 → LLM에 맡김
+# ("빨리 이 일을 끝내고 싶어요", "회사 그만할까", "딸이 잘 자", "그 드라마가 곧 종료돼" 등 서술일 수도 있는 말)
+WEAK_END_PATTERNS = [
+    r"피곤|졸려|졸리|자야|쉬어야|바빠|바쁘|나중에|이제\s*됐",
+    r"그만|끝내|끝낼|마치|마칠|마무리|종료|고\s*싶|할까",
+    r"잘\s*(자|있어|주무)",
+]
+
+# 직전 챗봇 발화가 종료 확인 질문일 때의 짧은 긍정/부정 답
+CONFIRM_QUESTION = re.compile(r"(마무리|끝내|그만).*(\?|싶으신가요|할까요)")
+AFFIRMATIVE = re.compile(r"^(응|어|네|예|넹|넵|웅|그래|그럼|좋아|맞아|그래요|그렇게\s*해)")
+NEGATIVE = re.compile(r"^(아니|아뇨|싫어|안\s*돼|더\s)")
+
+
+def _any(patterns: list[str], text: str) -> bool:
+    return any(re.search(p, text, flags=re.IGNORECASE) for p in patterns)
+
+
+def _last_sentence(text: str) -> str:
+    sentences = [s.strip() for s in SENTENCE_SPLIT.split(text) if s.strip()]
+    return sentences[-1] if sentences else text
+
+
+def _ends_sentence(patterns: list[str], text: str) -> bool:
+    """마지막 문장이 종료 표현으로 끝나는지 (인용·안긴 절 속의 '그만하고 싶다는 얘기' 등은 제외)"""
+    sentence = _last_sentence(text)
+    for p in patterns:
+        for match in re.finditer(p, sentence, flags=re.IGNORECASE):
+            if END_TAIL.match(sentence[match.end():]):
+                return True
+    return False
+
+
+class EndIntentClassifier:
+    """
+    마지막 사용자 발화가 대화를 끝내려는 의도인지 로컬에서 먼저 판단하는 분류기.
+    규칙(어휘·패턴)으로 종료 확률을 매기고, 확실한 경우(end_threshold 이상 / continue_threshold 이하)만
+    바로 답하며 애매하면 None을 돌려 LLM 판단으로 넘깁니다.
+    LLM(플래너)이 종료라고 본 것을 로컬 '계속' 판단으로 뒤집는 건 override_threshold 이하로 확실할 때뿐입니다.
+    END_INTENT_MODEL_PATH에 predict_proba를 지원하는 pickle 모델(예: sklearn 파이프라인)이 있으면
+    규칙으로 애매한 발화에 한해 그 모델 점수를 사용합니다.
+    shadow_rate 비율만큼은 로컬에서 결정한 경우에도 LLM을 함께 불러 일치율을 기록합니다. (임계값 조정용)
+    """
+
+    def __init__(self, end_threshold: float = 0.9, continue_threshold: float = 0.1,
+                 override_threshold: float = 0.05, model_path: Optional[str] = None,
+                 shadow_rate: float = 0.0, log_every: int = 50):
+        self.end_threshold = end_threshold
+        self.continue_threshold = continue_threshold
+        self.override_threshold = override_threshold
+        self.shadow_rate = shadow_rate
+        self.log_every = log_every
+        self.model = self._load_model(model_path)
+
+        self._lock = threading.Lock()
+        self.counts = {"local_end": 0, "local_continue": 0, "escalated": 0, "shadow": 0, "shadow_agree": 0}
+
+    @classmethod
+    def from_env(cls) -> "EndIntentClassifier":
+        return cls(
+            end_threshold=float(os.getenv("END_INTENT_END_THRESHOLD", "0.9")),
+            continue_threshold=float(os.getenv("END_INTENT_CONTINUE_THRESHOLD", "0.1")),
+            override_threshold=float(os.getenv("END_INTENT_OVERRIDE_THRESHOLD", "0.05")),
+            model_path=os.getenv("END_INTENT_MODEL_PATH"),
+            shadow_rate=float(os.getenv("END_INTENT_SHADOW_RATE", "0.05")),
+        )
+
+    @staticmethod
+    def _load_model(model_path: Optional[str]):
+        if not model_path:
+            return None
+        try:
+            with open(model_path, "rb") as f:
+                model = pickle.load(f)
+            print(f"[종료 분류 모델 로드] {model_path}")
+            return model
+        except Exception as e:
+            print(f"[종료 분류 모델 로드 실패] {model_path} / error={e}")
+            return None
+
+    # ──────────────────────────────────
+    # 점수 계산
+    def score(self, utterance: str, prev_assistant: str = "") -> float:
+        """발화가 종료 의도일 확률(0~1)을 규칙으로 추정합니다."""
+        text = utterance.strip()
+        if not text:
+            return 0.5
+
+        if prev_assistant and CONFIRM_QUESTION.search(prev_assistant):
+            if NEGATIVE.search(text) or _any(CONTINUE_PATTERNS, text):
+                return 0.03
+            if AFFIRMATIVE.search(text):
+                return 0.97
+
+        # 분명한 패턴에 걸릴 때만 로컬에서 결정할 만한 점수를 줌
+        if _any(CONTINUE_PATTERNS, text):
+            return 0.05
+        if _ends_sentence(END_PATTERNS, text):
+            return 0.95
+        if _any(NARRATIVE_PATTERNS, text):
+            return 0.08
+        if _any(WEAK_END_PATTERNS, text):
+            return 0.6
+
+        # 아무 단서도 없으면 판단하지 않고 LLM(또는 플래너)에 맡김
+        return 0.5
+
+    def _model_score(self, utterance: str) -> Optional[float]:
+        if self.model is None:
+            return None
+        try:
+            return float(self.model.predict_proba([utterance])[0][1])
+        except Exception as e:
+            print(f"[종료 분류 모델 예측 실패] {e}")
+            return None
+
+    def decide(self, utterance: str, prev_assistant: str = "") -> tuple[Optional[bool], float]:
+        """(판단, 종료 확률)을 반환합니다. 판단이 None이면 LLM에 물어봐야 합니다."""
+        p_end = self.score(utterance, prev_assistant)
+        if self.continue_threshold < p_end < self.end_threshold:
+            model_p = self._model_score(utterance)
+            if model_p is not None:
+                p_end = model_p
+
+        if p_end >= self.end_threshold:
+            return True, p_end
+        if p_end <= self.continue_threshold:
+            return False, p_end
+        return None, p_end
+
+    # ──────────────────────────────────
+    # 기록
+    def _record(self, key: str, shadow_agree: Optional[bool] = None) -> None:
+        with self._lock:
+            self.counts[key] += 1
+            if shadow_agree is not None:
+                self.counts["shadow"] += 1
+                self.counts["shadow_agree"] += int(shadow_agree)
+            total = self.counts["local_end"] + self.counts["local_continue"] + self.counts["escalated"]
+            if self.log_every and total % self.log_every == 0:
+                print(f"[종료 판단 통계] {self.stats()}")
+
+    def stats(self) -> dict:
+        counts = dict(self.counts)
+        total = counts["local_end"] + counts["local_continue"] + counts["escalated"]
+        return {
+            **counts,
+            "local_rate": (total - counts["escalated"]) / total if total else 0.0,
+            "agreement_rate": counts["shadow_agree"] / counts["shadow"] if counts["shadow"] else None,
+        }
+
+    def _log(self, source: str, p_end: float, verdict: bool, llm_verdict: Optional[bool] = None) -> None:
+        line = f"[종료 판단] 출처={source} p={p_end:.2f} 판단={'종료' if verdict else '계속'}"
+        if llm_verdict is not None:
+            line += f" LLM={'종료' if llm_verdict else '계속'}"
+        print(line)
+
+    # ──────────────────────────────────
+    # 판단 (로컬 → 필요할 때만 LLM)
+    def record_decision(self, p_end: float, verdict: Optional[bool], llm_verdict: Optional[bool] = None) -> bool:
+        """
+        로컬 판단과 (있다면) LLM 판단을 기록하고 최종 판단을 반환합니다.
+        로컬 판단이 있으면 그것을, 없으면 LLM 판단을 따릅니다.
+        단, LLM이 종료라고 했는데 로컬 '계속' 판단이 override_threshold만큼 확실하지 않으면 LLM을 따릅니다.
+        """
+        if verdict is False and llm_verdict and p_end > self.override_threshold:
+            verdict = None
+        if verdict is None:
+            self._record("escalated")
+            self._log("llm", p_end, bool(llm_verdict))
+            return bool(llm_verdict)
+
+        self._record("local_end" if verdict else "local_continue",
+                     None if llm_verdict is None else llm_verdict == verdict)
+        self._log("local", p_end, verdict, llm_verdict)
+        return verdict
+
+    def resolve(self, utterance: str, prev_assistant: str, llm_judge: Callable[[], bool]) -> bool:
+        verdict, p_end = self.decide(utterance, prev_assistant)
+        shadow = verdict is not None and random.random() < self.shadow_rate
+        llm_verdict = llm_judge() if verdict is None or shadow else None
+        return self.record_decision(p_end, verdict, llm_verdict)
+
+    async def aresolve(self, utterance: str, prev_assistant: str, llm_judge: Callable[[], Awaitable[bool]]) -> bool:
+        verdict, p_end = self.decide(utterance, prev_assistant)
+        shadow = verdict is not None and random.random() < self.shadow_rate
+        llm_verdict = await llm_judge() if verdict is None or shadow else None
+        return self.record_decision(p_end, verdict, llm_verdict)
+
+
+def last_turn(chat_history: list[dict]) -> tuple[str, str]:
+    """(마지막 사용자 발화, 그 직전 챗봇 발화)를 반환합니다."""
+    utterance, prev_assistant = "", ""
+    for idx in range(len(chat_history) - 1, -1, -1):
+        if chat_history[idx]["role"] == "user":
+            utterance = chat_history[idx]["content"]
+            for prev in reversed(chat_history[:idx]):
+                if prev["role"] == "assistant":
+                    prev_assistant = prev["content"]
+                    break
+            break
+    return utterance, prev_assistant
+
+
+# 세션마다 챗봇이 따로 만들어져도 통계가 한곳에 모이도록 공유 인스턴스 사용
+end_intent_classifier = EndIntentClassifier.from_env()
+
+
+if __name__ == "__main__":
+    # 회귀 사례: (직전 챗봇 발화, 사용자 발화, 기대 판단 — None이면 LLM에 넘겨야 함)
+    CASES = [
+        ("", "오늘은 여기까지만 할게요", True),
+        ("", "이제 그만 쉬고 싶어요", None),
+        ("", "그럼 잘 있어요", True),
+        ("", "대화를 끝낼게요", True),
+        ("", "오늘은 이만하면 된 것 같아요", True),
+        ("", "오늘 재밌었어. 이제 그만할게.", True),
+        ("", "안녕히 계세요~", True),
+        ("", "이만 자러 갈게", True),
+        ("", "친구랑 대화를 마무리하고 집에 왔어", None),
+        ("", "회사 그만하고 싶다는 얘기를 했어", None),
+        ("", "그만할게. 아 근데 하나 더 있어", None),
+        ("", "요즘은 잠을 잘 자요", None),
+        ("", "우리 엄마는 잘 있어요", None),
+        ("", "딸이 잘 자", None),
+        ("", "빨리 이 일을 끝내고 싶어요", None),
+        ("", "숙제를 마치고 싶어", None),
+        ("", "그 드라마가 곧 종료돼", None),
+        ("", "오늘은 손자랑 종료", None),
+        ("", "회사 그만할까", None),
+        ("", "오늘 시장에 가서 고등어를 샀어", None),
+        ("", "그게 뭐였더라?", None),
+        ("", "좀 피곤하네", None),
+        ("", "아니 더 얘기하고 싶어", False),
+        ("", "회사를 그만두고 싶었어", False),
+        ("오늘 대화는 여기서 마무리할까요?", "응", True),
+        ("오늘 대화는 여기서 마무리할까요?", "아니", False),
+    ]
+    classifier = EndIntentClassifier(log_every=0)
+    failed = 0
+    for prev, utterance, expected in CASES:
+        verdict, p_end = classifier.decide(utterance, prev)
+        ok = verdict == expected
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {utterance!r} → {verdict} (p={p_end:.2f}, 기대={expected})")
+
+    # 애매한 로컬 '계속'은 플래너의 종료 판단을 뒤집지 않음
+    weak_continue = classifier.record_decision(0.08, False, llm_verdict=True)
+    strong_continue = classifier.record_decision(0.03, False, llm_verdict=True)
+    print(f"{'✅' if weak_continue else '❌'} 약한 '계속'(0.08) + 플래너 종료 → {weak_continue}")
+    print(f"{'✅' if not strong_continue else '❌'} 확실한 '계속'(0.03) + 플래너 종료 → {strong_continue}")
+    failed += (not weak_continue) + strong_continue
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,377 @@
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+# 로컬 채점 대상 문항 유형 (기억력 문항은 의미 비교가 필요하므로 항상 LLM)
+ORIENTATION_TYPES = ("시간 지남력", "장소 지남력")
+
+WEEKDAYS = ["월", "화", "수", "목", "금", "토", "일"]
+WEEKDAY_PATTERN = re.compile(r"([월화수목금토일])\s*(요일|욜)")
+
+# 한자어 수사 (오월, 이십구일 등)
+SINO_DIGITS = {"일": 1, "이": 2, "삼": 3, "사": 4, "오": 5, "육": 6, "유": 6, "칠": 7, "팔": 8, "구": 9}
+NUMBER = r"(\d{1,2}|[일이삼사오육유칠팔구십]{1,4})"
+# 2025-05-29, 2025.5.29, 5/29, 5.29
+NUMERIC_DATE = re.compile(r"(?:\d{4}\s*[-./년]\s*)?(\d{1,2})\s*[-./]\s*(\d{1,2})(?!\d)")
+MONTH_DAY = re.compile(rf"(?<![가-힣]){NUMBER}\s*월\s*{NUMBER}\s*일")
+DAY_ONLY = re.compile(rf"(?<![가-힣\d]){NUMBER}\s*일(?![가-힣]*\s*전)(?!요)")
+
+# 오늘 기준 며칠 전인지
+RELATIVE_DAYS = [
+    (re.compile(r"그끄저께|그그저께"), 3),
+    (re.compile(r"그저께|그제|엊그제|엊그저께"), 2),
+    (re.compile(r"어제|어저께"), 1),
+    (re.compile(r"오늘"), 0),
+]
+NATIVE_DAYS = {"하루": 1, "이틀": 2, "사흘": 3, "나흘": 4, "닷새": 5, "엿새": 6, "이레": 7}
+DAYS_AGO = re.compile(r"(\d+)\s*일\s*전|(하루|이틀|사흘|나흘|닷새|엿새|이레)\s*전")
+
+# 같은 묶음은 같은 시간대로 봄
+TIME_OF_DAY = {
+    "새벽": "새벽",
+    "아침": "오전", "오전": "오전",
+    "점심": "낮", "정오": "낮", "낮": "낮",
+    "오후": "오후",
+    "저녁": "저녁",
+    "밤": "밤",
+}
+
+# 장소 뒤에 붙는 조사 (긴 것부터 검사)
+PLACE_PARTICLES = ("에서는", "에서도", "에서", "에는", "에도", "으로", "까지", "에", "로")
+# 답변 끝의 서술어/존댓말 (도서관이요, 카페였어요 등)
+COPULA_ENDINGS = ("이었어요", "였어요", "이에요", "예요", "입니다", "이요", "요", "이야", "야")
+# 기억이 안 난다는 답
+DONT_KNOW = re.compile(r"모르겠|몰라|모름|기억\s*(이|이\s*잘|이\s*안|안|잘\s*안)\s*(나|난)|생각\s*(이\s*)?안\s*(나|난)|까먹|잊어")
+# 장소로 보면 안 되는 시간 표현 (오후에, 어제, 3시에 등)
+TIME_WORD = re.compile(r"^(새벽|아침|오전|점심|정오|낮|오후|저녁|밤|오늘|어제|그제|그저께|주말|평일|지난주|이번주|때|후|전|\d+시|\d+일|.+요일)$")
+# 어디인지 특정하지 않는 장소 표현 (조용한 곳, 거기 등)
+VAGUE_PLACE = re.compile(r"(곳|데|거기|여기|저기|어디|장소|근처)$")
+# 조사 없이 장소 뒤에 오는 이동 동사 (학교 갔다가, 병원 들러서 등)
+MOVE_VERB = re.compile(r"^(가$|가서|가고|갔|갈래|다녀|들러|들렀|들른|왔|와서|놀러|나가|나갔)")
+# 장소 앞에 붙어 어느 곳인지 좁히는 말 (우리 집, 친구네 집, 학교 앞 카페)
+PLACE_POSSESSIVES = ("우리", "내", "제", "저희")
+PLACE_POSITIONS = ("앞", "뒤", "옆", "밖", "근처", "건너편", "맞은편", "입구", "안쪽")
+# 부정·망설임이 섞인 답 ("29일 아니고 28일", "30일이었나 29일이었나") → 로컬에서 채점하지 않음
+HEDGE = re.compile(r"아니|아닌|아마|을걸|일걸|이었나|였나|이었던가|였던가|인가|같은데|같기도|잘\s*모르|헷갈|긴가민가")
+
+
+def _sino_number(text: str) -> Optional[int]:
+    """'29', '이십구' 같은 수를 정수로 바꿉니다. (1~99)"""
+    if text.isdigit():
+        return int(text)
+    if "십" in text:
+        tens, _, ones = text.partition("십")
+        if len(tens) > 1 or len(ones) > 1:
+            return None
+        value = (SINO_DIGITS.get(tens, 0) if tens else 1) * 10
+        return value + (SINO_DIGITS.get(ones, 0) if ones else 0) if (not tens or tens in SINO_DIGITS) else None
+    return SINO_DIGITS.get(text) if len(text) == 1 else None
+
+
+def _resolve_date(month: int, day: int, today: datetime) -> Optional[datetime]:
+    """연도 없는 월/일을 오늘 이전의 가장 가까운 날짜로 봅니다."""
+    try:
+        date = today.replace(month=month, day=day)
+        if date > today:
+            date = date.replace(year=today.year - 1)
+        return date
+    except ValueError:
+        return None
+
+
+def extract_time_facts(text: str, today: datetime) -> dict:
+    """
+    답변에서 날짜·요일·시간대를 뽑습니다.
+    {"dates": {(월, 일)}, "days": {일}, "weekdays": {요일 번호}, "times": {시간대}}
+    '어제', '사흘 전' 같은 상대 표현은 today 기준 날짜와 요일로 바꿉니다.
+    """
+    facts = {"dates": set(), "days": set(), "weekdays": set(), "times": set()}
+
+    def add_date(date: Optional[datetime]) -> None:
+        if date is not None:
+            facts["dates"].add((date.month, date.day))
+            facts["weekdays"].add(date.weekday())
+
+    for pattern, days_ago in RELATIVE_DAYS:
+        if pattern.search(text):
+            add_date(today - timedelta(days=days_ago))
+            text = pattern.sub(" ", text)
+    for match in DAYS_AGO.finditer(text):
+        days_ago = int(match.group(1)) if match.group(1) else NATIVE_DAYS[match.group(2)]
+        add_date(today - timedelta(days=days_ago))
+    text = DAYS_AGO.sub(" ", text)
+
+    for pattern in (NUMERIC_DATE, MONTH_DAY):
+        for match in pattern.finditer(text):
+            month, day = _sino_number(match.group(1)), _sino_number(match.group(2))
+            if month and day and 1 <= month <= 12 and 1 <= day <= 31:
+                add_date(_resolve_date(month, day, today))
+        text = pattern.sub(" ", text)
+    for match in DAY_ONLY.finditer(text):
+        day = _sino_number(match.group(1))
+        if day and 1 <= day <= 31:
+            facts["days"].add(day)
+
+    for match in WEEKDAY_PATTERN.finditer(text):
+        facts["weekdays"].add(WEEKDAYS.index(match.group(1)))
+    for word, group in TIME_OF_DAY.items():
+        if word in text:
+            facts["times"].add(group)
+    return facts
+
+
+def _strip_ending(token: str) -> str:
+    token = token.strip(" .,!?~…\"'")
+    for ending in COPULA_ENDINGS:
+        # '집이요'처럼 '이'로 시작하는 서술어는 한 글자 장소에도 붙음
+        if token.endswith(ending) and len(token) > len(ending) + (0 if ending.startswith("이") else 1):
+            return token[: -len(ending)]
+    return token
+
+
+def _place_phrase(tokens: list[str], idx: int, head: str) -> str:
+    """장소 명사 앞의 꾸밈말을 붙여 '친구네 집', '학교 앞 카페' 같은 구로 만듭니다."""
+    words = [head]
+    for prev in reversed(tokens[:idx]):
+        if TIME_WORD.match(prev):
+            break
+        if prev in PLACE_POSSESSIVES or prev.endswith(("네", "의")) or prev in PLACE_POSITIONS or words[0] in PLACE_POSITIONS:
+            words.insert(0, prev)
+        else:
+            break
+    return " ".join(words)
+
+
+def extract_places(text: str) -> list[str]:
+    """
+    '도서관에서 쉬었어요' → ['도서관'], '학교 갔다가 병원에 갔어요' → ['학교', '병원']처럼
+    장소 조사나 이동 동사가 붙은 단어를 꾸밈말과 함께 뽑습니다. 한두 단어짜리 답은 시간 표현을 뺀
+    답 전체를 장소로 봅니다. ('한강 공원' → ['한강 공원'], '우리 집이요' → ['우리 집'])
+    """
+    tokens = [t for t in re.split(r"[\s,.!?~…]+", text) if t]
+    places = []
+
+    def add(idx: int, stem: str) -> None:
+        if stem and not TIME_WORD.match(stem) and not VAGUE_PLACE.search(stem) and not DONT_KNOW.search(stem):
+            phrase = _place_phrase(tokens, idx, stem)
+            if phrase not in places:
+                places.append(phrase)
+
+    for idx, token in enumerate(tokens):
+        particle = next((p for p in PLACE_PARTICLES if token.endswith(p) and len(token) > len(p)), None)
+        if particle:
+            add(idx, token[: -len(particle)])
+        elif idx + 1 < len(tokens) and MOVE_VERB.match(tokens[idx + 1]):
+            add(idx, token)
+    if not places and 0 < len(tokens) <= 2:
+        # 앞 단어도 꾸밈말로 보고 함께 묶어야 '공원'과 '한강 공원'을 '집'과 '우리 집'처럼 다르게 다룸
+        words = [t for t in tokens[:-1] if not TIME_WORD.match(t)] + [_strip_ending(tokens[-1])]
+        add(0, " ".join(words))
+    return places
+
+
+def _stems(text: str) -> set[str]:
+    """답변의 어절에서 조사·서술어를 뗀 단어 집합 (어절 단위 비교용)"""
+    stems = set()
+    for token in re.split(r"[\s,.!?~…]+", text):
+        particle = next((p for p in PLACE_PARTICLES if token.endswith(p) and len(token) > len(p)), "")
+        stem = _strip_ending(token[: len(token) - len(particle)])
+        if stem:
+            stems.add(stem)
+    return stems
+
+
+def _compact(text: str) -> str:
+    return re.sub(r"\s+", "", text)
+
+
+def _weekday_name(index: int) -> str:
+    return WEEKDAYS[index] + "요일"
+
+
+class OrientationEvaluator:
+    """
+    시간/장소 지남력 답변을 로컬 규칙으로 채점하는 평가기.
+    정답에 들어 있는 날짜·요일·시간대·장소를 사용자 답과 비교해 확실히 맞거나 틀린 경우만
+    evaluate_user_answer와 같은 (정답 여부, 피드백, 힌트, 점수) 튜플을 돌려주고,
+    애매하면 None을 돌려 LLM 채점으로 넘깁니다.
+    """
+
+    CORRECT_FEEDBACK = "맞아요! 정확하게 기억하고 계시네요."
+    WRONG_FEEDBACK = "아쉽지만 정답과 달라요. 힌트를 보고 다시 한 번 떠올려 볼까요?"
+    DONT_KNOW_FEEDBACK = "괜찮아요, 천천히 떠올려 보세요. 힌트를 드릴게요."
+
+    def __init__(self, log_every: int = 50):
+        self.log_every = log_every
+        self._lock = threading.Lock()
+        self.counts = {"local_correct": 0, "local_wrong": 0, "escalated": 0}
+
+    # ──────────────────────────────────
+    # 채점
+    @staticmethod
+    def _has_several_candidates(answer: dict) -> bool:
+        """날짜·일·요일 후보를 여러 개 늘어놓은 답인지 ("28일 29일", "목요일인지 금요일인지")"""
+        days = answer["days"] | {d for _, d in answer["dates"]}
+        return len(answer["dates"]) > 1 or len(days) > 1 or len(answer["weekdays"]) > 1
+
+    @staticmethod
+    def _judge_time(expected: dict, answer: dict) -> Optional[bool]:
+        """날짜/요일/시간대 비교. 비교할 정보가 부족하면 None"""
+        verdicts = []
+        if expected["dates"]:
+            if answer["dates"]:
+                verdicts.append(bool(expected["dates"] & answer["dates"]))
+            elif answer["days"]:
+                verdicts.append(bool({d for _, d in expected["dates"]} & answer["days"]))
+            elif answer["weekdays"]:
+                # 날짜를 물었는데 요일만 말한 경우: 요일이 다르면 오답, 같으면 애매
+                if not expected["weekdays"] & answer["weekdays"]:
+                    verdicts.append(False)
+                else:
+                    return None
+        elif expected["days"] and (answer["days"] or answer["dates"]):
+            verdicts.append(bool(expected["days"] & (answer["days"] | {d for _, d in answer["dates"]})))
+        elif expected["weekdays"] and answer["weekdays"]:
+            verdicts.append(bool(expected["weekdays"] & answer["weekdays"]))
+
+        if expected["times"] and answer["times"]:
+            if not expected["times"] & answer["times"]:
+                # 날짜는 맞는데 시간대만 다르면 애매 (오후/저녁 경계 등)
+                return False if verdicts and not all(verdicts) else None
+            if not verdicts and not (expected["dates"] or expected["days"] or expected["weekdays"]):
+                verdicts.append(True)
+
+        if not verdicts:
+            return None
+        return all(verdicts)
+
+    @staticmethod
+    def _judge_place(expected_places: list[str], recall_answer: str, user_answer: str) -> Optional[bool]:
+        """장소(꾸밈말 포함 구)를 어절 단위로 비교. '집'과 '친구네 집'은 같은 장소로 보지 않음"""
+        user_places = extract_places(user_answer)
+        # 장소를 못 찾았거나 여러 곳을 늘어놓은 답은 LLM이 판단
+        if len(user_places) != 1:
+            return None
+        user_place = _compact(user_places[0])
+        if user_place in {_compact(place) for place in expected_places}:
+            return True
+        # '공원이었을걸'처럼 서술어를 다 떼지 못한 어절에 정답 장소가 들어 있으면 LLM이 판단
+        if any(_compact(place) in user_place for place in expected_places):
+            return None
+        # '집' vs '친구네 집', '학교' vs '학교 앞 카페'처럼 정답의 단어를 일부 공유하면 애매
+        expected_words = _stems(recall_answer) | {w for place in expected_places for w in place.split()}
+        if set(user_places[0].split()) & expected_words:
+            return None
+        return False
+
+    @staticmethod
+    def _hint(expected: dict, expected_places: list[str]) -> str:
+        """정답을 직접 말하지 않는 간접 단서"""
+        if expected["dates"]:
+            # 날짜를 물었으면 요일을, 요일을 물었으면 주말/평일만 알려 줌
+            return f"그날은 {_weekday_name(next(iter(expected['weekdays'])))}이었어요."
+        if expected["weekdays"]:
+            return "주말이었어요." if next(iter(expected["weekdays"])) >= 5 else "평일이었어요."
+        if expected["days"]:
+            return f"그달 {'초' if min(expected['days']) <= 10 else '중순' if min(expected['days']) <= 20 else '말'}이었어요."
+        if expected_places:
+            place = expected_places[0]
+            return f"'{place[0]}'(으)로 시작하는 {len(_compact(place))}글자 장소예요."
+        return "아침, 점심, 저녁 중 언제였는지 떠올려 보세요."
+
+    def evaluate(self, question_type: str, recall_answer: str, user_answer: str,
+                 date: Optional[str] = None) -> Optional[tuple[bool, str, str, float]]:
+        """(정답 여부, 피드백, 힌트, 점수)를 반환합니다. None이면 LLM으로 채점해야 합니다."""
+        if question_type not in ORIENTATION_TYPES or not user_answer.strip():
+            return None
+        today = datetime.strptime(date, "%Y-%m-%d") if date else datetime.today()
+        today = today.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        expected = extract_time_facts(recall_answer, today)
+        expected_places = extract_places(recall_answer)
+        has_time = any(expected[k] for k in ("dates", "days", "weekdays", "times"))
+        if not has_time and not expected_places:
+            return self._record(None)
+
+        answer = extract_time_facts(user_answer, today)
+        has_candidate = any(answer[k] for k in ("dates", "days", "weekdays", "times")) or extract_places(user_answer)
+        if DONT_KNOW.search(user_answer) and not has_candidate:
+            return self._record(False, self.DONT_KNOW_FEEDBACK, self._hint(expected, expected_places))
+        # 부정·망설임이 섞였거나 후보를 여러 개 댄 답은 어느 쪽이 답인지 LLM이 판단
+        if HEDGE.search(user_answer) or DONT_KNOW.search(user_answer) or self._has_several_candidates(answer):
+            return self._record(None)
+
+        # 시간 문항은 시간 정보를, 장소 문항은 장소를 먼저 보고 나머지로 보충
+        judges = []
+        if has_time:
+            judges.append(lambda: self._judge_time(expected, answer))
+        if expected_places:
+            judges.append(lambda: self._judge_place(expected_places, recall_answer, user_answer))
+        if question_type == "장소 지남력":
+            judges.reverse()
+
+        for judge in judges:
+            verdict = judge()
+            if verdict is not None:
+                return self._record(verdict, None, self._hint(expected, expected_places))
+        return self._record(None)
+
+    # ──────────────────────────────────
+    # 기록
+    def _record(self, verdict: Optional[bool], feedback: Optional[str] = None,
+                hint: str = "") -> Optional[tuple[bool, str, str, float]]:
+        with self._lock:
+            key = "escalated" if verdict is None else ("local_correct" if verdict else "local_wrong")
+            self.counts[key] += 1
+            if self.log_every and sum(self.counts.values()) % self.log_every == 0:
+                print(f"[지남력 채점 통계] {self.stats()}")
+        if verdict is None:
+            return None
+        if verdict:
+            return True, feedback or self.CORRECT_FEEDBACK, "", 100.0
+        return False, feedback or self.WRONG_FEEDBACK, hint, 0.0
+
+    def stats(self) -> dict:
+        counts = dict(self.counts)
+        total = sum(counts.values())
+        return {**counts, "local_rate": (total - counts["escalated"]) / total if total else 0.0}
+
+
+# 회상 세션 객체가 여러 개여도 통계가 한곳에 모이도록 공유 인스턴스 사용
+orientation_evaluator = OrientationEvaluator()
+
+
+if __name__ == "__main__":
+    # 오늘이 2025-06-01(일)이라고 가정한 예시 채점
+    cases = [
+        ("시간 지남력", "5월 29일 목요일이었어요.", "29일이요"),
+        ("시간 지남력", "5월 29일 목요일이었어요.", "사흘 전"),
+        ("시간 지남력", "5월 29일 목요일이었어요.", "오월 이십팔일"),
+        ("시간 지남력", "5월 29일 목요일이었어요.", "수요일"),
+        ("시간 지남력", "어제 오후였어요.", "어제 오후"),
+        ("시간 지남력", "어제 오후였어요.", "어제 저녁쯤"),
+        ("시간 지남력", "토요일 저녁이었어요.", "기억이 안 나요"),
+        ("시간 지남력", "5월 29일 목요일이었어요.", "29일 아니고 28일"),
+        ("시간 지남력", "5월 29일 목요일이었어요.", "5월 30일이었나 29일이었나"),
+        ("시간 지남력", "5월 29일 목요일이었어요.", "잘 모르겠는데 29일?"),
+        ("장소 지남력", "용지관에서 사전투표를 했어요.", "용지관이요"),
+        ("장소 지남력", "용지관에서 사전투표를 했어요.", "도서관에서 공부했어요"),
+        ("장소 지남력", "학교 앞 카페에서 친구를 만났어요.", "학교"),
+        ("장소 지남력", "도서관에서 휴식을 취했어요.", "조용한 곳에서 쉬었던 것 같아요"),
+        ("장소 지남력", "친구네 집에서 저녁을 먹었어요.", "집"),
+        ("장소 지남력", "친구네 집에서 저녁을 먹었어요.", "친구네 집이요"),
+        ("장소 지남력", "병원에서 진료를 받았어요.", "학교 갔다가 병원에 갔어요"),
+        ("장소 지남력", "학교에서 수업을 들었어요.", "학교 갔다가 병원에 갔어요"),
+        ("장소 지남력", "병원에서 진료를 받았어요.", "약국 다녀왔어요"),
+        ("장소 지남력", "공원에서 산책했어요.", "아마 공원이었을걸요"),
+        ("장소 지남력", "공원에서 산책했어요.", "한강 공원"),
+        ("장소 지남력", "공원에서 산책했어요.", "아마 도서관이었을걸요"),
+        ("장소 지남력", "집에서 텔레비전을 봤어요.", "우리 집이요"),
+        ("장소 지남력", "집에서 텔레비전을 봤어요.", "어제 집이요"),
+        ("기억력", "파스타를 먹었어요.", "파스타"),
+    ]
+    evaluator = OrientationEvaluator(log_every=0)
+    for question_type, answer, user in cases:
+        print(f"[{question_type}] 정답={answer!r} 답변={user!r} → {evaluator.evaluate(question_type, answer, user, '2025-06-01')}")
+    print(evaluator.stats())
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+PROFILE_API_URL = os.getenv("PROFILE_API_URL", "https://nabiya.site/api/users/get_user_info/")
+
+
+class _CachedProfile:
+    def __init__(self, profile: dict, ttl: float, stale_ttl: float):
+        now = time.monotonic()
+        self.profile = profile
+        self.fresh_until = now + ttl
+        self.stale_until = now + stale_ttl
+
+
+class ProfileClient:
+    """
+    사용자 정보 API(get_user_info) 조회 클라이언트.
+    - 커넥션 풀을 가진 requests.Session 하나를 재사용
+    - ttl초 동안은 캐시에서 바로 반환
+    - ttl이 지났어도 stale_ttl 안이면 캐시 값을 바로 반환하고 백그라운드에서 갱신 (stale-while-revalidate)
+    - 같은 사용자를 동시에 조회하면 API 요청은 한 번만 보내고 결과를 나눠 씀 (single-flight)
+    - 조회에 실패하면 기존 캐시 값(없으면 {})을 반환
+    """
+
+    def __init__(self, base_url: str = PROFILE_API_URL, ttl: float = 300, stale_ttl: float = 3600,
+                 timeout: float = 5, pool_size: int = 10, max_entries: int = 5000):
+        self.base_url = base_url
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.max_entries = max_entries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._cache: "OrderedDict[str, _CachedProfile]" = OrderedDict()
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="profile-refresh")
+        self.counts = {"hit": 0, "stale": 0, "miss": 0, "shared": 0, "request": 0, "error": 0}
+
+    def _request(self, user_id: str) -> dict:
+        with self._lock:
+            self.counts["request"] += 1
+        resp = self.session.get(self.base_url, params={"user_id": user_id}, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()  # e.g. {"user_id":"1","name":"김철수","gender":"남성", ...}
+
+    def _load(self, user_id: str, future: Future) -> None:
+        """API를 호출해 캐시를 채우고, 같은 조회를 기다리던 쪽에 결과를 넘깁니다."""
+        try:
+            profile = self._request(user_id)
+            with self._lock:
+                self._cache[user_id] = _CachedProfile(profile, self.ttl, self.stale_ttl)
+                self._cache.move_to_end(user_id)
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        except Exception as e:
+            print(f"[프로필 조회 실패] user_id={user_id} / error={e}")
+            with self._lock:
+                self.counts["error"] += 1
+                cached = self._cache.get(user_id)
+            profile = cached.profile if cached else {}
+        finally:
+            with self._lock:
+                self._inflight.pop(user_id, None)
+        future.set_result(profile)
+
+    def _start_load(self, user_id: str) -> tuple[Future, bool]:
+        """진행 중인 조회가 있으면 그 Future를, 없으면 새 Future를 (새로 만들었는지와 함께) 반환합니다."""
+        with self._lock:
+            future = self._inflight.get(user_id)
+            if future is not None:
+                self.counts["shared"] += 1
+                return future, False
+            future = Future()
+            self._inflight[user_id] = future
+            return future, True
+
+    def get(self, user_id: str) -> dict:
+        user_id = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None and now < cached.fresh_until:
+                self.counts["hit"] += 1
+                self._cache.move_to_end(user_id)
+                return cached.profile
+            if cached is not None and now < cached.stale_until:
+                self.counts["stale"] += 1
+            else:
+                cached = None
+                self.counts["miss"] += 1
+
+        future, owner = self._start_load(user_id)
+        if cached is not None:
+            # 오래된 값을 먼저 돌려주고 갱신은 백그라운드에서
+            if owner:
+                self._refresher.submit(self._load, user_id, future)
+            return cached.profile
+
+        if owner:
+            self._load(user_id, future)
+        return future.result()
+
+    def invalidate(self, user_id: str) -> None:
+        """사용자 정보가 바뀌었을 때 캐시를 지웁니다."""
+        with self._lock:
+            self._cache.pop(str(user_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counts, "entries": len(self._cache)}
+
+
+# 세션마다 챗봇이 따로 만들어져도 캐시와 커넥션 풀을 함께 쓰도록 공유 인스턴스 사용
+profile_client = ProfileClient(
+    ttl=float(os.getenv("PROFILE_CACHE_TTL", "300")),
+    stale_ttl=float(os.getenv("PROFILE_CACHE_STALE_TTL", "3600")),
+)
+
+
+if __name__ == "__main__":
+    # 로컬 스텁 서버로 캐시 / single-flight / stale-while-revalidate 동작 확인
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    hits = []
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            hits.append(self.path)
+            time.sleep(0.3)  # 느린 API 흉내
+            body = json.dumps({"user_id": "1", "name": f"테스트{len(hits)}", "gender": "여성"}, ensure_ascii=False)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body.encode("utf-8"))
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ProfileClient(base_url=f"http://127.0.0.1:{server.server_port}/", ttl=1, stale_ttl=10)
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        names = {p["name"] for p in pool.map(lambda _: client.get("1"), range(10))}
+    print(f"[동시 조회 10회] 응답={names} / 서버 요청 {len(hits)}회")
+
+    started = time.perf_counter()
+    client.get("1")
+    print(f"[캐시 조회] {(time.perf_counter() - started) * 1000:.1f}ms / 서버 요청 {len(hits)}회")
+
+    time.sleep(1.1)
+    started = time.perf_counter()
+    stale = client.get("1")
+    print(f"[TTL 경과 후 조회] {stale['name']} {(time.perf_counter() - started) * 1000:.1f}ms (이전 값 즉시 반환)")
+    time.sleep(0.5)
+    print(f"[백그라운드 갱신 후] {client.get('1')['name']} / 서버 요청 {len(hits)}회")
+    print(f"[통계] {client.stats()}")
+    server.shutdown()
@@ -0,0 +1,134 @@
+import os
+import string
+import threading
+import time
+from typing import Iterable, Optional
+
+
+class PromptTemplate:
+    """읽어 둔 프롬프트 파일 하나. {변수} 목록을 미리 파싱해 둡니다."""
+
+    def __init__(self, path: str, text: str, mtime: float):
+        self.path = path
+        self.text = text
+        self.mtime = mtime
+        try:
+            self.fields = frozenset(
+                field.split(".")[0].split("[")[0]
+                for _, field, _, _ in string.Formatter().parse(text)
+                if field
+            )
+        except ValueError:
+            # 짝이 안 맞는 중괄호가 있는 프롬프트는 원문 그대로만 사용 가능
+            self.fields = frozenset()
+
+    def render(self, **kwargs) -> str:
+        # 변수 없이 쓰는 프롬프트는 원문 그대로 (기존처럼 format을 거치지 않음)
+        if not kwargs:
+            return self.text
+        missing = self.fields - kwargs.keys()
+        if missing:
+            raise KeyError(f"[프롬프트 변수 누락] {self.path}: {sorted(missing)}")
+        return self.text.format(**kwargs)
+
+
+class PromptRegistry:
+    """
+    프롬프트 파일을 한 번만 읽어 보관하는 저장소.
+    - register(): 모듈 로드 시점에 파일 존재와 {변수}를 검사해 문제가 있으면 바로 예외
+    - get()/render(): 파일 mtime이 바뀐 경우에만 다시 읽음 (check_interval초에 한 번만 확인)
+    - 다시 읽은 파일에 등록된 변수 외의 {변수}가 있으면 기존 템플릿을 계속 사용
+    """
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self._templates: dict[str, PromptTemplate] = {}
+        self._expected: dict[str, Optional[frozenset]] = {}
+        self._checked_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normpath(path)
+
+    @staticmethod
+    def _read(path: str) -> PromptTemplate:
+        mtime = os.stat(path).st_mtime
+        with open(path, "r", encoding="utf-8") as f:
+            return PromptTemplate(path, f.read(), mtime)
+
+    @staticmethod
+    def _unknown_fields(template: PromptTemplate, expected: Optional[frozenset]) -> frozenset:
+        return template.fields - expected if expected is not None else frozenset()
+
+    def register(self, path: str, fields: Iterable[str] = ()) -> PromptTemplate:
+        """
+        프롬프트를 등록합니다. fields는 호출하는 쪽에서 넘겨줄 변수 이름들입니다.
+        파일이 없거나 템플릿이 fields에 없는 변수를 요구하면 예외를 던집니다.
+        """
+        key = self._key(path)
+        expected = frozenset(fields)
+        template = self._read(path)
+        unknown = self._unknown_fields(template, expected)
+        if unknown:
+            raise KeyError(f"[프롬프트 변수 누락] {path}: 템플릿이 {sorted(unknown)}를 요구하지만 넘겨주지 않습니다")
+
+        with self._lock:
+            self._templates[key] = template
+            self._expected[key] = expected
+            self._checked_at[key] = time.monotonic()
+        return template
+
+    def get(self, path: str) -> PromptTemplate:
+        key = self._key(path)
+        now = time.monotonic()
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None and now - self._checked_at[key] < self.check_interval:
+                return template
+            self._checked_at[key] = now
+
+        if template is None:
+            # 등록하지 않은 프롬프트는 처음 쓸 때 읽음 (없으면 FileNotFoundError)
+            template = self._read(path)
+            with self._lock:
+                self._templates[key] = template
+                self._expected.setdefault(key, None)
+            return template
+
+        try:
+            mtime = os.stat(path).st_mtime
+            if mtime == template.mtime:
+                return template
+            reloaded = self._read(path)
+        except OSError as e:
+            print(f"[프롬프트 다시 읽기 실패] {path} / error={e} → 기존 내용 사용")
+            return template
+
+        unknown = self._unknown_fields(reloaded, self._expected.get(key))
+        if unknown:
+            print(f"[프롬프트 다시 읽기 거부] {path}: 알 수 없는 변수 {sorted(unknown)} → 기존 내용 사용")
+            with self._lock:
+                # 같은 파일을 계속 다시 읽지 않도록 mtime만 갱신
+                template.mtime = mtime
+            return template
+
+        print(f"[프롬프트 다시 읽음] {path}")
+        with self._lock:
+            self._templates[key] = reloaded
+        return reloaded
+
+    def render(self, path: str, **kwargs) -> str:
+        return self.get(path).render(**kwargs)
+
+
+# 챗봇 모듈들이 같은 파일을 따로 읽지 않도록 공유 인스턴스 사용
+prompts = PromptRegistry()
+
+
+if __name__ == "__main__":
+    # prompt/ 아래 모든 파일이 읽히고 변수가 파싱되는지 확인
+    prompt_dir = "./prompt"
+    for name in sorted(os.listdir(prompt_dir)):
+        template = prompts.get(os.path.join(prompt_dir, name))
+        print(f"{name}: {sorted(template.fields)}")
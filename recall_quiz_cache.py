@@ -0,0 +1,120 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+from chat_reall_sess import RT_ChatRecallSession
+from diary_db_management import DATE_FORMAT, DiaryDBManager
+
+# 회상 퀴즈가 참고하는 기간 (get_diary_7days_by_date와 같은 7일)
+RECALL_WINDOW_DAYS = 7
+
+
+class RecallQuizCache:
+    """
+    (user_id, 날짜)별 회상 퀴즈를 미리 만들어 두는 캐시.
+    - 일기가 저장되면 DiaryDBManager 알림을 받아 그 사용자의 캐시를 비우고, 오늘 퀴즈를 백그라운드에서 다시 생성
+    - get()은 캐시에 있으면 바로 반환하고, 없으면 (진행 중인 생성이 있으면 기다렸다가) 동기로 생성
+    - 생성 도중 새 일기가 저장되면 그 결과는 버림 (사용자별 버전 번호로 판단)
+      버전은 진행 중인 생성과 비교할 때만 필요하므로, 생성 중인 퀴즈가 없는 사용자의 버전은 지움
+    """
+
+    def __init__(self, recall_session: RT_ChatRecallSession, db_manager: DiaryDBManager,
+                 max_entries: int = 1000, workers: int = 2):
+        self.recall_session = recall_session
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple[str, str], dict]" = OrderedDict()
+        self._inflight: dict[tuple[str, str, int], Future] = {}
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recall-quiz")
+        self.counts = {"hit": 0, "wait": 0, "miss": 0, "precomputed": 0, "discarded": 0}
+        db_manager.add_listener(self.on_diaries_saved)
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.today().strftime(DATE_FORMAT)
+
+    def on_diaries_saved(self, user_id: str, metadata_list: list[dict]) -> None:
+        user_id = str(user_id)
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+            self._forget_version(user_id)
+
+        # 오래된 날짜의 일기(데이터셋 일괄 적재 등)는 오늘 퀴즈에 안 들어가므로 미리 만들지 않음
+        window_start = (datetime.today() - timedelta(days=RECALL_WINDOW_DAYS - 1)).strftime(DATE_FORMAT)
+        if any((meta.get("date") or self._today()) >= window_start for meta in metadata_list):
+            self.schedule(user_id, self._today())
+
+    def schedule(self, user_id: str, date: str) -> Future:
+        """백그라운드에서 퀴즈를 생성합니다. (같은 버전의 생성이 진행 중이면 그 Future 반환)"""
+        future, owner, version = self._start(str(user_id), date)
+        if owner:
+            self._executor.submit(self._compute, str(user_id), date, version, future)
+        return future
+
+    def _start(self, user_id: str, date: str) -> tuple[Future, bool, int]:
+        """(Future, 직접 생성해야 하는지, 시작 시점의 버전)을 반환합니다."""
+        with self._lock:
+            version = self._versions.get(user_id, 0)
+            future = self._inflight.get((user_id, date, version))
+            if future is not None:
+                return future, False, version
+            future = Future()
+            self._inflight[(user_id, date, version)] = future
+            return future, True, version
+
+    def _compute(self, user_id: str, date: str, version: int, future: Future) -> None:
+        try:
+            diary_content = self.recall_session.get_diary_content(date, user_id)
+            questions = self.recall_session.generate_recall_questions(user_id, date, diary_content)
+            entry = {"diary_content": diary_content, "questions": questions}
+            with self._lock:
+                # 빈 결과(파싱 실패)와, 생성 중에 새 일기가 들어와 낡아진 결과는 저장하지 않음
+                if questions and self._versions.get(user_id, 0) == version:
+                    self._entries[(user_id, date)] = entry
+                    self._entries.move_to_end((user_id, date))
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                    self.counts["precomputed"] += 1
+                elif questions:
+                    self.counts["discarded"] += 1
+            future.set_result(entry)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop((user_id, date, version), None)
+                self._forget_version(user_id)
+
+    def _forget_version(self, user_id: str) -> None:
+        """진행 중인 생성이 없으면 버전을 지웁니다. (self._lock 안에서 호출, _versions가 끝없이 커지지 않도록)"""
+        if not any(key[0] == user_id for key in self._inflight):
+            self._versions.pop(user_id, None)
+
+    def get(self, user_id: str, date: Optional[str] = None) -> dict:
+        """
+        {"diary_content": [Document, ...], "questions": [{"질문", "답변"}, ...]}을 반환합니다.
+        해당 날짜 일기가 없으면 get_diary_content와 같은 ValueError를 던집니다.
+        """
+        user_id, date = str(user_id), date or self._today()
+        with self._lock:
+            entry = self._entries.get((user_id, date))
+            if entry is not None:
+                self._entries.move_to_end((user_id, date))
+                self.counts["hit"] += 1
+                return entry
+
+        future, owner, version = self._start(user_id, date)
+        with self._lock:
+            self.counts["miss" if owner else "wait"] += 1
+        if owner:
+            # 캐시에 없으면 요청 스레드에서 바로 생성 (기존 동작)
+            self._compute(user_id, date, version, future)
+        return future.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counts, "entries": len(self._entries), "versions": len(self._versions)}
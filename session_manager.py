@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Generic, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class SessionNotFound(KeyError):
+    """create=False로 요청한 세션이 없거나 만료됨"""
+
+
+class _Session(Generic[T]):
+    def __init__(self, bot: T):
+        self.bot = bot
+        # 같은 세션으로 동시에 들어온 요청이 chat_history를 섞지 않도록 직렬화
+        self.lock = threading.Lock()
+        self.last_access = time.monotonic()
+
+
+class SessionManager(Generic[T]):
+    """
+    세션(사용자) ID별로 챗봇 인스턴스를 따로 보관합니다.
+    - max_sessions를 넘으면 가장 오래 안 쓴 세션부터 제거 (LRU)
+    - idle_timeout(초) 동안 요청이 없던 세션은 제거
+    - 챗봇의 chat_history는 max_history개까지만 유지
+    """
+
+    def __init__(self, factory: Callable[[], T], max_sessions: int = 500, idle_timeout: int = 1800, max_history: int = 200):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_history = max_history
+        self._sessions: "OrderedDict[str, _Session[T]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        expired = [sid for sid, s in self._sessions.items() if now - s.last_access > self.idle_timeout]
+        for sid in expired:
+            del self._sessions[sid]
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _acquire(self, session_id: str, fresh: bool, create: bool = True) -> "_Session[T]":
+        with self._lock:
+            self._evict()
+            session = None if fresh else self._sessions.get(session_id)
+            if session is None:
+                if not create:
+                    raise SessionNotFound(session_id)
+                session = _Session(self.factory())
+                self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            session.last_access = time.monotonic()
+            self._evict()
+            return session
+
+    @contextmanager
+    def session(self, session_id: str, fresh: bool = False, create: bool = True) -> Iterator[T]:
+        """
+        세션의 챗봇을 빌려줍니다. 블록이 끝나면 대화 기록 길이를 정리합니다.
+        fresh=True면 기존 상태를 버리고 새 챗봇으로 시작합니다.
+        create=False면 없거나 만료된 세션일 때 새로 만들지 않고 SessionNotFound를 던집니다.
+        """
+        session = self._acquire(session_id, fresh, create)
+        with session.lock:
+            try:
+                yield session.bot
+            finally:
+                history = getattr(session.bot, "chat_history", None)
+                if history is not None and len(history) > self.max_history:
+                    del history[:-self.max_history]
+                session.last_access = time.monotonic()
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
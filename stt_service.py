@@ -0,0 +1,192 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Iterator, Optional
+from google.cloud import speech
+
+STT_LANGUAGE_CODE = "ko-KR"
+# 로컬 가짜 음성 서비스(에뮬레이터) 주소. 설정하면 인증 없이 해당 주소로 gRPC 연결 (예: localhost:50051)
+STT_API_ENDPOINT = os.getenv("STT_API_ENDPOINT")
+# 오디오 조각이 이 시간(초) 동안 안 들어오면 발화가 끝난 것으로 보고 인식을 마무리
+STT_AUDIO_IDLE_SECONDS = float(os.getenv("STT_AUDIO_IDLE_SECONDS", "10"))
+
+
+def create_speech_client() -> speech.SpeechClient:
+    if STT_API_ENDPOINT:
+        import grpc
+        transport_cls = speech.SpeechClient.get_transport_class("grpc")
+        print(f"[STT 로컬 엔드포인트 사용] {STT_API_ENDPOINT}")
+        return speech.SpeechClient(transport=transport_cls(channel=grpc.insecure_channel(STT_API_ENDPOINT)))
+    return speech.SpeechClient()
+
+
+def recognize(client: speech.SpeechClient, audio: bytes, language_code: str = STT_LANGUAGE_CODE) -> str:
+    """녹음 파일 전체(WebM/Opus)를 한 번에 인식합니다."""
+    config = speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
+        language_code=language_code,
+    )
+    response = client.recognize(config=config, audio=speech.RecognitionAudio(content=audio))
+    return "".join(r.alternatives[0].transcript for r in response.results)
+
+
+def stream_transcripts(client: speech.SpeechClient, audio_chunks: Iterator[bytes],
+                       language_code: str = STT_LANGUAGE_CODE) -> Iterator[dict]:
+    """
+    오디오 조각(WebM/Opus)을 받는 대로 streaming_recognize로 보내고 인식 결과를 이벤트로 내보냅니다.
+    - {"type": "interim", "transcript": 지금까지 확정된 문장 + 인식 중인 문장}
+    - {"type": "final", "text": 확정된 문장, "transcript": 지금까지 확정된 전체}
+    - {"type": "done", "transcript": 최종 전체 문장}
+    """
+    streaming_config = speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
+            language_code=language_code,
+        ),
+        interim_results=True,
+    )
+    requests = (speech.StreamingRecognizeRequest(audio_content=chunk) for chunk in audio_chunks)
+    responses = client.streaming_recognize(config=streaming_config, requests=requests)
+
+    final_parts = []
+    for response in responses:
+        for result in response.results:
+            if not result.alternatives:
+                continue
+            text = result.alternatives[0].transcript
+            if result.is_final:
+                final_parts.append(text)
+                yield {"type": "final", "text": text, "transcript": "".join(final_parts)}
+            else:
+                yield {"type": "interim", "transcript": "".join(final_parts) + text}
+    yield {"type": "done", "transcript": "".join(final_parts)}
+
+
+class StreamingRecognition:
+    """
+    HTTP 요청 여러 번에 나눠 올라오는 오디오를 하나의 streaming_recognize 호출로 이어 주는 세션.
+    feed()로 넣은 조각은 백그라운드 스레드에서 바로 인식 서비스로 전달되고,
+    인식 결과는 events()로 꺼내 갈 수 있습니다.
+    """
+
+    def __init__(self, client: speech.SpeechClient, owner: str, language_code: str = STT_LANGUAGE_CODE,
+                 idle_timeout: float = STT_AUDIO_IDLE_SECONDS):
+        self.client = client
+        self.owner = owner
+        self.language_code = language_code
+        self.idle_timeout = idle_timeout
+        self.created = time.monotonic()
+        self.finished = False
+        self._audio: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        self._events: "queue.Queue[dict]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="stt-stream", daemon=True)
+        self._thread.start()
+
+    def _audio_chunks(self) -> Iterator[bytes]:
+        while True:
+            try:
+                chunk = self._audio.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                print("[STT 스트림] 오디오 입력이 없어 인식을 마무리합니다.")
+                return
+            if chunk is None:
+                return
+            yield chunk
+
+    def _run(self) -> None:
+        try:
+            for event in stream_transcripts(self.client, self._audio_chunks(), self.language_code):
+                self._events.put(event)
+        except Exception as e:
+            print(f"[STT 스트림 실패] {e}")
+            self._events.put({"type": "error", "error": str(e)})
+        finally:
+            self.finished = True
+
+    def feed(self, chunk: bytes) -> None:
+        if chunk:
+            self._audio.put(chunk)
+
+    def close(self) -> None:
+        """더 보낼 오디오가 없음을 알립니다. (남은 결과가 나온 뒤 done 이벤트로 끝남)"""
+        self._audio.put(None)
+
+    def events(self) -> Iterator[dict]:
+        """done 또는 error 이벤트가 나올 때까지 인식 결과를 순서대로 내보냅니다."""
+        while True:
+            event = self._events.get()
+            yield event
+            if event["type"] in ("done", "error"):
+                return
+
+
+class StreamingRecognitionManager:
+    """stream_id별 StreamingRecognition 보관. max_age초가 지난 세션은 새 세션을 만들 때 정리합니다."""
+
+    def __init__(self, client: speech.SpeechClient, max_age: float = 600):
+        self.client = client
+        self.max_age = max_age
+        self._streams: dict[str, StreamingRecognition] = {}
+        self._lock = threading.Lock()
+
+    def create(self, owner: str) -> str:
+        stream_id = uuid.uuid4().hex
+        with self._lock:
+            now = time.monotonic()
+            for sid in [sid for sid, s in self._streams.items() if now - s.created > self.max_age]:
+                self._streams.pop(sid).close()
+            self._streams[stream_id] = StreamingRecognition(self.client, owner)
+        return stream_id
+
+    def get(self, stream_id: str, owner: str) -> Optional[StreamingRecognition]:
+        with self._lock:
+            stream = self._streams.get(stream_id)
+        return stream if stream is not None and stream.owner == owner else None
+
+    def discard(self, stream_id: str) -> None:
+        with self._lock:
+            stream = self._streams.pop(stream_id, None)
+        if stream is not None:
+            stream.close()
+
+
+if __name__ == "__main__":
+    # 로컬 가짜 음성 서비스로 중간 결과가 오디오 도착에 맞춰 나오는지 확인
+    # (실제 에뮬레이터를 띄웠다면 STT_API_ENDPOINT=localhost:포트 로 create_speech_client() 사용)
+    from types import SimpleNamespace
+
+    class FakeSpeechClient:
+        """조각 하나가 도착할 때마다 중간 결과를, 세 조각마다 확정 결과를 돌려주는 가짜 클라이언트"""
+
+        def streaming_recognize(self, config, requests):
+            def result(words, is_final):
+                alternative = SimpleNamespace(transcript=" ".join(words) + (" " if is_final else ""))
+                return SimpleNamespace(results=[SimpleNamespace(alternatives=[alternative], is_final=is_final)])
+
+            words = []
+            for request in requests:
+                words.append(request.audio_content.decode("utf-8"))
+                yield result(words, is_final=len(words) == 3)
+                if len(words) == 3:
+                    words = []
+            # 오디오가 끝나면 남은 부분을 확정
+            if words:
+                yield result(words, is_final=True)
+
+    manager = StreamingRecognitionManager(FakeSpeechClient())
+    stream_id = manager.create(owner="test_user")
+    stream = manager.get(stream_id, "test_user")
+
+    def upload():
+        for word in "오늘 시장에 갔다가 오랜만에 친구를 만났어요".split():
+            time.sleep(0.2)  # 마이크에서 조각이 들어오는 간격 흉내
+            stream.feed(word.encode("utf-8"))
+        stream.close()
+
+    started = time.perf_counter()
+    threading.Thread(target=upload).start()
+    for event in stream.events():
+        print(f"{(time.perf_counter() - started) * 1000:6.0f}ms {event}")
+    manager.discard(stream_id)
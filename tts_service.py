@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from google.cloud import texttospeech
+
+TTS_AUDIO_DIR = "static/tts"
+TTS_LANGUAGE_CODE = "ko-KR"
+TTS_VOICE_NAME = "ko-KR-Chirp3-HD-Achernar"
+TTS_CACHE_MAX_MB = int(os.getenv("TTS_CACHE_MAX_MB", "500"))
+# 문장 단위 동시 합성에 쓸 작업자 수
+TTS_SYNTH_WORKERS = int(os.getenv("TTS_SYNTH_WORKERS", "4"))
+
+# 문장 끝 (마침표·물음표·느낌표·말줄임표·물결·줄바꿈) 뒤의 공백에서 자름
+SENTENCE_END = re.compile(r"(?<=[.!?…~\n])\s+")
+# 이보다 짧은 문장은 다음 문장과 합쳐서 합성 (너무 잘게 나누면 요청 수만 늘어남)
+MIN_SENTENCE_CHARS = 8
+
+# 음성 인코딩별 파일 확장자
+AUDIO_EXTENSIONS = {"MP3": ".mp3", "OGG_OPUS": ".ogg"}
+
+
+class SentenceBuffer:
+    """
+    스트리밍으로 들어오는 텍스트를 모아 문장이 완성될 때마다 꺼내 주는 버퍼.
+    feed()는 완성된 문장 목록을, flush()는 남은 텍스트를 반환합니다.
+    """
+
+    def __init__(self, min_chars: int = MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        self._buffer += text
+        parts = SENTENCE_END.split(self._buffer)
+        # 마지막 조각은 아직 끝나지 않은 문장
+        self._buffer = parts.pop()
+        sentences, pending = [], ""
+        for part in parts:
+            pending = f"{pending} {part}".strip()
+            if len(pending) >= self.min_chars:
+                sentences.append(pending)
+                pending = ""
+        if pending:
+            self._buffer = f"{pending} {self._buffer}"
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        rest, self._buffer = self._buffer.strip(), ""
+        return rest or None
+
+
+def split_sentences(text: str, min_chars: int = MIN_SENTENCE_CHARS) -> list[str]:
+    """텍스트를 문장 단위로 나눕니다. (짧은 문장은 다음 문장과 합침)"""
+    buffer = SentenceBuffer(min_chars)
+    sentences = buffer.feed(text)
+    rest = buffer.flush()
+    return sentences + [rest] if rest else sentences
+
+
+class TTSCache:
+    """
+    Google TTS 합성 결과를 audio_dir에 파일로 보관하는 캐시.
+    - 파일 이름은 hash(텍스트, 목소리, 오디오 설정)이라 같은 요청은 기존 파일을 그대로 반환
+    - 같은 텍스트를 동시에 요청하면 합성은 한 번만 하고 결과를 나눠 씀
+    - 디렉터리 전체 크기가 max_bytes를 넘으면 가장 오래 안 쓴 파일부터 삭제 (LRU, 파일 mtime 기준)
+    """
+
+    def __init__(self, client: texttospeech.TextToSpeechClient, audio_dir: str = TTS_AUDIO_DIR,
+                 max_bytes: int = TTS_CACHE_MAX_MB * 1024 * 1024,
+                 voice_name: str = TTS_VOICE_NAME, language_code: str = TTS_LANGUAGE_CODE):
+        self.client = client
+        self.audio_dir = audio_dir
+        self.max_bytes = max_bytes
+        self.voice_name = voice_name
+        self.language_code = language_code
+
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self._files: "OrderedDict[str, int]" = OrderedDict()  # 파일 이름 → 크기 (오래 안 쓴 순)
+        self._total_bytes = 0
+        self.counts = {"hit": 0, "miss": 0, "shared": 0, "evicted": 0}
+        self._pool = ThreadPoolExecutor(max_workers=TTS_SYNTH_WORKERS, thread_name_prefix="tts")
+        self._scan()
+
+    def _scan(self) -> None:
+        """재시작해도 LRU 순서가 이어지도록 기존 파일을 mtime 순으로 읽어 둡니다."""
+        os.makedirs(self.audio_dir, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.audio_dir):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.audio_dir, name))
+                continue
+            stat = os.stat(os.path.join(self.audio_dir, name))
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._total_bytes += size
+
+    def _config(self, voice_name: str = None, audio_encoding: str = "MP3", speaking_rate: float = 1.0) -> dict:
+        return {
+            "language_code": self.language_code,
+            "voice_name": voice_name or self.voice_name,
+            "ssml_gender": "FEMALE",
+            "audio_encoding": audio_encoding,
+            "speaking_rate": speaking_rate,
+        }
+
+    @staticmethod
+    def _key(text: str, config: dict) -> str:
+        payload = json.dumps({"text": text, **config}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _synthesize(self, text: str, config: dict) -> bytes:
+        synthesis_input = texttospeech.SynthesisInput(text=text)
+        voice = texttospeech.VoiceSelectionParams(
+            language_code=config["language_code"],
+            name=config["voice_name"],
+            ssml_gender=texttospeech.SsmlVoiceGender[config["ssml_gender"]],
+        )
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding[config["audio_encoding"]],
+            speaking_rate=config["speaking_rate"],
+        )
+        response = self.client.synthesize_speech(input=synthesis_input, voice=voice, audio_config=audio_config)
+        return response.audio_content
+
+    def _store(self, name: str, audio: bytes) -> None:
+        path = os.path.join(self.audio_dir, name)
+        with open(path + ".tmp", "wb") as out:
+            out.write(audio)
+        os.replace(path + ".tmp", path)
+
+        with self._lock:
+            self._total_bytes -= self._files.pop(name, 0)
+            self._files[name] = len(audio)
+            self._total_bytes += len(audio)
+            # 방금 만든 파일은 남기고 오래된 것부터 삭제
+            while self._total_bytes > self.max_bytes and len(self._files) > 1:
+                old_name, old_size = self._files.popitem(last=False)
+                self._total_bytes -= old_size
+                self.counts["evicted"] += 1
+                try:
+                    os.remove(os.path.join(self.audio_dir, old_name))
+                except FileNotFoundError:
+                    pass
+
+    def _get_or_create(self, name: str, produce) -> str:
+        """name 파일이 캐시에 있으면 그 경로를, 없으면 produce()로 오디오를 만들어 저장한 뒤 경로를 반환합니다."""
+        path = os.path.join(self.audio_dir, name)
+
+        with self._lock:
+            if name in self._files and os.path.exists(path):
+                self._files.move_to_end(name)
+                self.counts["hit"] += 1
+                hit = True
+            else:
+                hit = False
+                future = self._inflight.get(name)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self._inflight[name] = future
+                    self.counts["miss"] += 1
+                else:
+                    self.counts["shared"] += 1
+
+        if hit:
+            # 재시작 후에도 LRU 순서가 유지되도록 mtime 갱신
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            return path
+
+        if not owner:
+            return future.result()
+
+        try:
+            self._store(name, produce())
+            future.set_result(path)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(name, None)
+        return path
+
+    def synthesize(self, text: str, voice_name: str = None, audio_encoding: str = "MP3",
+                   speaking_rate: float = 1.0) -> str:
+        """텍스트를 합성한 오디오 파일 경로를 반환합니다. (캐시에 있으면 합성하지 않음)"""
+        config = self._config(voice_name, audio_encoding, speaking_rate)
+        name = self._key(text, config) + AUDIO_EXTENSIONS[audio_encoding]
+        return self._get_or_create(name, lambda: self._synthesize(text, config))
+
+    def synthesize_playlist(self, text: str, **options) -> list[str]:
+        """
+        긴 텍스트를 문장 단위로 나눠 동시에 합성하고, 문장 순서대로 파일 경로 목록을 반환합니다.
+        (클라이언트는 첫 파일부터 바로 재생 가능)
+        """
+        futures = [self.submit(sentence, **options) for sentence in split_sentences(text)]
+        return [future.result() for future in futures]
+
+    def synthesize_concat(self, text: str, **options) -> str:
+        """
+        긴 텍스트를 문장 단위로 동시에 합성한 뒤 하나의 파일로 이어 붙여 경로를 반환합니다.
+        MP3는 프레임을 그대로 이어 붙여도 재생되고, OGG_OPUS는 연결(chained) 스트림이 됩니다.
+        작업자 스레드 안에서 호출하면 풀이 막힐 수 있으므로 요청 스레드에서 호출해야 합니다.
+        """
+        sentences = split_sentences(text)
+        if len(sentences) <= 1:
+            return self.synthesize(text, **options)
+
+        config = self._config(options.get("voice_name"), options.get("audio_encoding", "MP3"),
+                              options.get("speaking_rate", 1.0))
+        name = self._key(text, {**config, "chunked": True}) + AUDIO_EXTENSIONS[config["audio_encoding"]]
+
+        def produce() -> bytes:
+            futures = [self.submit(sentence, **options) for sentence in sentences]
+            parts = []
+            for sentence, future in zip(sentences, futures):
+                try:
+                    with open(future.result(), "rb") as f:
+                        parts.append(f.read())
+                except FileNotFoundError:
+                    # 합쳐지기 전에 LRU로 지워진 조각은 다시 합성
+                    parts.append(self._synthesize(sentence, config))
+            return b"".join(parts)
+
+        return self._get_or_create(name, produce)
+
+    def submit(self, text: str, **options) -> Future:
+        """synthesize()를 작업자 스레드에서 실행합니다. (Future의 결과는 파일 경로)"""
+        return self._pool.submit(self.synthesize, text, **options)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counts, "files": len(self._files), "bytes": self._total_bytes, "max_bytes": self.max_bytes}
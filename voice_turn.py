@@ -0,0 +1,88 @@
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Iterator
+from google.cloud import speech
+from stt_service import recognize
+from tts_service import SentenceBuffer, TTSCache
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def run_voice_turn(bot, audio: bytes, user_id: str, stt_client: speech.SpeechClient,
+                   tts_cache: TTSCache) -> Iterator[dict]:
+    """
+    음성 한 턴(STT → 챗봇 답변 → TTS)을 한 번에 처리하며 이벤트를 내보냅니다.
+    챗봇 답변은 ask_stream()으로 받아 문장이 완성될 때마다 바로 TTS를 요청하므로,
+    전체 답변이 끝나기 전에 첫 문장 오디오를 재생할 수 있습니다.
+    - {"type": "transcript", "text": 인식된 사용자 발화}
+    - {"type": "delta", "text": 답변 토큰}
+    - {"type": "audio", "index": 순번, "text": 문장, "audio_url": ...}  (순번 순서대로 전송)
+    - {"type": "done", "transcript", "response", "audio_urls", "diary" 또는 "diary_job"(종료 시), "timings"}
+    """
+    started = time.perf_counter()
+    timings = {}
+
+    transcript = recognize(stt_client, audio).strip()
+    timings["stt_ms"] = _elapsed_ms(started)
+    yield {"type": "transcript", "text": transcript}
+    if not transcript:
+        yield {"type": "error", "error": "음성을 인식하지 못했어요. 다시 말씀해 주세요.", "timings": timings}
+        return
+
+    sentences = SentenceBuffer()
+    pending: "deque[tuple[int, str, Future]]" = deque()
+    audio_urls = []
+
+    def submit(text: str) -> None:
+        pending.append((len(audio_urls) + len(pending), text, tts_cache.submit(text)))
+
+    def ready_audio(wait: bool) -> Iterator[dict]:
+        # 앞 문장이 끝나야 뒤 문장을 보내므로 재생 순서가 바뀌지 않음
+        while pending and (wait or pending[0][2].done()):
+            index, text, future = pending.popleft()
+            url = "/" + future.result().replace("\\", "/")
+            audio_urls.append(url)
+            if index == 0:
+                timings["first_audio_ms"] = _elapsed_ms(started)
+            yield {"type": "audio", "index": index, "text": text, "audio_url": url}
+
+    llm_started = time.perf_counter()
+    final = None
+    for event in bot.ask_stream(transcript, user_id=user_id):
+        if event["type"] == "delta":
+            if "first_token_ms" not in timings:
+                timings["first_token_ms"] = _elapsed_ms(started)
+            yield event
+            for sentence in sentences.feed(event["text"]):
+                submit(sentence)
+            yield from ready_audio(wait=False)
+        elif event["type"] == "done":
+            final = event
+    timings["llm_ms"] = _elapsed_ms(llm_started)
+
+    # 답변 도중 오류로 토큰 없이 끝났다면 최종 답변(오류 안내)을 읽어 줌
+    if final and "first_token_ms" not in timings:
+        for sentence in sentences.feed(final["response"]):
+            submit(sentence)
+
+    rest = sentences.flush()
+    if rest:
+        submit(rest)
+    yield from ready_audio(wait=True)
+    timings["total_ms"] = _elapsed_ms(started)
+
+    done = {
+        "type": "done",
+        "transcript": transcript,
+        "response": final["response"] if final else "",
+        "audio_urls": audio_urls,
+        "timings": {**timings, "chat": final.get("timings") if final else None},
+    }
+    for key in ("diary", "diary_job"):
+        if final and final.get(key):
+            done[key] = final[key]
+    print(f"[음성 턴 소요 시간] {timings}")
+    yield done
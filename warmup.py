@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+from typing import Callable, Iterable
+import grpc
+from chat_daily import RT_Daily_Chatbot
+from chat_reall_sess import RT_ChatRecallSession
+from chat_theme import RT_Theme_Chatbot
+from diary_db_management import DiaryDBManager
+
+WARMUP_SHARDS = int(os.getenv("WARMUP_SHARDS", "8"))
+WARMUP_CHANNEL_TIMEOUT = float(os.getenv("WARMUP_CHANNEL_TIMEOUT", "10"))
+
+
+def fixed_utterances() -> list[str]:
+    """매번 똑같이 나가는 챗봇 문구 (프론트엔드가 /tts로 보내는 텍스트 그대로)"""
+    texts = [
+        RT_Daily_Chatbot.FIRST_MESSAGE,
+        RT_Daily_Chatbot.FAREWELL_MESSAGE + RT_Daily_Chatbot.DIARY_PENDING_NOTICE,
+        RT_Theme_Chatbot.FAREWELL_MESSAGE + RT_Theme_Chatbot.DIARY_PENDING_NOTICE,
+        RT_Theme_Chatbot.END_CONFIRM_MESSAGE,
+        RT_ChatRecallSession.TOO_MANY_WRONG_MESSAGE,
+    ]
+    return list(dict.fromkeys(texts))
+
+
+def _wait_channel(client) -> None:
+    channel = getattr(client.transport, "grpc_channel", None)
+    if channel is None:
+        return
+    grpc.channel_ready_future(channel).result(timeout=WARMUP_CHANNEL_TIMEOUT)
+
+
+def warm_up(synthesize: Callable[[str], object], grpc_clients: dict, db_manager: DiaryDBManager,
+            texts: Iterable[str] = None) -> dict:
+    """
+    첫 요청이 콜드 스타트 비용을 내지 않도록 미리 준비합니다.
+    1) TTS/STT gRPC 채널 연결
+    2) 고정 문구 음성을 미리 합성해 TTS 캐시에 저장
+    3) 최근 사용자들의 FAISS 샤드를 메모리에 로드
+    단계별 소요 시간(ms)을 반환합니다. 실패한 단계는 건너뛰고 기록만 남깁니다.
+    """
+    timings = {}
+
+    def stage(name: str, fn: Callable[[], object]) -> None:
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            print(f"[워밍업 실패] {name} / error={e}")
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    for name, client in grpc_clients.items():
+        stage(f"{name}_channel", lambda client=client: _wait_channel(client))
+    for idx, text in enumerate(texts if texts is not None else fixed_utterances()):
+        stage(f"tts_{idx}", lambda text=text: synthesize(text))
+    stage("faiss", lambda: print(f"[샤드 미리 로드] {db_manager.warm_up(WARMUP_SHARDS)}"))
+
+    print(f"[워밍업 완료] {timings}")
+    return timings
+
+
+def start_warm_up(*args, **kwargs) -> threading.Thread:
+    """서버 시작을 막지 않도록 백그라운드 스레드에서 warm_up()을 실행합니다."""
+    thread = threading.Thread(target=warm_up, args=args, kwargs=kwargs, name="warm-up", daemon=True)
+    thread.start()
+    return thread